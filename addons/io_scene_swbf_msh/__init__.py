@@ -52,18 +52,26 @@ if "bpy" in locals():
     reload_package(locals())
 # End of stuff taken from glTF
 
+import os
 import bpy
 from bpy_extras.io_utils import ExportHelper
-from bpy.props import BoolProperty, EnumProperty
+from bpy.props import BoolProperty, EnumProperty, FloatProperty, IntProperty
 from bpy.types import Operator
-from .msh_scene import create_scene
-from .msh_scene_save import save_scene
+from .msh_scene import create_scene, create_scenes
+from .msh_export_settings import EXPORT_OPERATOR_IDNAME, create_scene_arguments
+from .msh_model_gather import select_collection_objects
+from .msh_model_triangle_strips import TriangleStripStats, gather_triangle_strip_stats
+from .msh_model_vertex_cache_optimize import VertexCacheOptimizationStats
+from .msh_model_gather_cache import register_geometry_cache_handlers, unregister_geometry_cache_handlers
+from .msh_scene_save import save_scene_file, update_scene_file, is_stream_path
+from .msh_verifier import verify_msh_file
 from .msh_material_properties import *
+from .msh_scene_watch import WatchProperties, WatchPanel, register_watch_handlers, unregister_watch_handlers
 
 class ExportMSH(Operator, ExportHelper):
     """ Export the current scene as a SWBF .msh file. """
 
-    bl_idname = "swbf_msh.export"
+    bl_idname = EXPORT_OPERATOR_IDNAME
     bl_label = "Export SWBF .msh File"
     filename_ext = ".msh"
 
@@ -75,19 +83,180 @@ class ExportMSH(Operator, ExportHelper):
 
     generate_triangle_strips: BoolProperty(
         name="Generate Triangle Strips",
-        description="Triangle strip generation can be slow for meshes with thousands of faces "
-                    "and is off by default to enable fast mesh iteration.\n\n"
+        description="Triangle strip generation is off by default to enable fast mesh iteration.\n\n"
                     "In order to improve runtime performance and reduce munged model size you are "
                     "**strongly** advised to turn it on for your 'final' export!",
         default=False
     )
 
+    triangle_strip_mode: EnumProperty(name="Triangle Strip Mode",
+                                      description="How triangle strips are generated.",
+                                      items=(
+                                          ('FAST', "Fast", "Quickly build strips by following shared edges."),
+                                          ('CACHE_AWARE', "Vertex Cache Aware", "Build strips while simulating the GPU's vertex cache "
+                                                                                "and fall back to a triangle list for segments where it transforms "
+                                                                                "fewer vertices.")
+                                      ),
+                                      default='FAST')
+
+    vertex_cache_size: IntProperty(
+        name="Vertex Cache Size",
+        description="Number of entries in the simulated post-transform vertex cache.",
+        default=16,
+        min=3,
+        max=64
+    )
+
+    vertex_cache_type: EnumProperty(name="Vertex Cache Type",
+                                    description="Replacement policy of the simulated post-transform vertex cache.",
+                                    items=(
+                                        ('FIFO', "FIFO", "Vertices are evicted in the order they were transformed."),
+                                        ('LRU', "LRU", "The least recently used vertex is evicted.")
+                                    ),
+                                    default='FIFO')
+
+    triangle_strip_workers: IntProperty(
+        name="Triangle Strip Workers",
+        description="Number of processes to generate triangle strips with. "
+                    "0 uses one process per CPU and 1 generates strips without starting any processes.",
+        default=1,
+        min=0,
+        max=64
+    )
+
+    stitch_triangle_strips: BoolProperty(
+        name="Stitch Triangle Strips",
+        description="Join each geometry segment's triangle strips into a single strip using degenerate "
+                    "triangles when that takes fewer indices than the separate strips.",
+        default=False
+    )
+
+    strip_restart_cost: IntProperty(
+        name="Strip Restart Cost",
+        description="Number of extra indices a stitched strip may take for each strip it joins. "
+                    "0 only stitches when it reduces the index count, higher values trade more indices "
+                    "for fewer strips.",
+        default=0,
+        min=0,
+        max=64
+    )
+
+    use_triangle_strips_cache: BoolProperty(
+        name="Cache Triangle Strips",
+        description="Store generated triangle strips on disk and reuse them for meshes that "
+                    "have not changed since a previous export.",
+        default=True
+    )
+
+    triangle_strips_cache_directory: StringProperty(
+        name="Triangle Strips Cache Directory",
+        description="Directory to store cached triangle strips in. "
+                    "Leave empty to use a directory in the system's temporary folder.",
+        default="",
+        subtype='DIR_PATH'
+    )
+
+    triangle_strips_cache_size: IntProperty(
+        name="Triangle Strips Cache Size (MB)",
+        description="Maximum size of the triangle strips cache. "
+                    "The least recently used strips are removed when it is exceeded.",
+        default=256,
+        min=1
+    )
+
+    optimize_vertex_cache: BoolProperty(
+        name="Optimize Vertex Cache",
+        description="Reorder the triangles and vertices of each segment to make better use of the GPU's "
+                    "vertex cache. Uses the Vertex Cache Size and Vertex Cache Type settings.",
+        default=False
+    )
+
+    weld_position_tolerance: FloatProperty(
+        name="Weld Position Tolerance",
+        description="Spacing of the grid vertex positions are snapped to when welding vertices, positions "
+                    "in the same grid cell are welded. 0 only welds identical positions.",
+        default=0.0,
+        min=0.0,
+        precision=6
+    )
+
+    weld_normal_tolerance: FloatProperty(
+        name="Weld Normal Tolerance",
+        description="Spacing of the grid normal components are snapped to when welding vertices, normals "
+                    "in the same grid cell are welded. 0 only welds identical normals.",
+        default=0.0,
+        min=0.0,
+        precision=6
+    )
+
+    weld_texcoord_tolerance: FloatProperty(
+        name="Weld UV Tolerance",
+        description="Spacing of the grid UV coordinates are snapped to when welding vertices, UVs "
+                    "in the same grid cell are welded. 0 only welds identical UVs.",
+        default=0.0,
+        min=0.0,
+        precision=6
+    )
+
+    weld_color_tolerance: FloatProperty(
+        name="Weld Color Tolerance",
+        description="Spacing of the grid vertex color channels are snapped to when welding vertices, colors "
+                    "in the same grid cell are welded. 0 only welds identical colors.",
+        default=0.0,
+        min=0.0,
+        precision=6
+    )
+
+    split_large_segments: BoolProperty(
+        name="Split Large Segments",
+        description="Split geometry segments with more vertices than a .msh file supports into multiple "
+                    "segments instead of failing the export.",
+        default=False
+    )
+
+    use_geometry_cache: BoolProperty(
+        name="Cache Geometry",
+        description="Keep the geometry built for objects in memory between exports and reuse it "
+                    "for objects that have not changed since.",
+        default=True
+    )
+
+    geometry_cache_size: IntProperty(
+        name="Geometry Cache Size (MB)",
+        description="Approximate maximum memory used by cached geometry. "
+                    "The least recently exported objects are removed when it is exceeded.",
+        default=256,
+        min=1
+    )
+
+    fast_bounding_box: BoolProperty(
+        name="Fast Bounding Box",
+        description="Calculate the scene's bounding box from the bounding boxes of each object's segments "
+                    "instead of every vertex. Faster but the box can be larger than the scene for rotated objects.",
+        default=False
+    )
+
+    update_existing_file: BoolProperty(
+        name="Update Existing File",
+        description="Only rewrite the models and materials that changed when the .msh file already exists. "
+                    "Much faster for small edits to large scenes but the file is not replaced atomically.",
+        default=False
+    )
+
+    verify_output: BoolProperty(
+        name="Verify Output",
+        description="Check the integrity of the .msh file after it has been written and report any problems found.",
+        default=False
+    )
+
     export_target: EnumProperty(name="Export Target",
                                 description="What to export.",
                                 items=(
                                     ('SCENE', "Scene", "Export the current active scene."),
                                     ('SELECTED', "Selected", "Export the currently selected objects and their parents."),
-                                    ('SELECTED_WITH_CHILDREN', "Selected with Children", "Export the currently selected objects with their children and parents.")
+                                    ('SELECTED_WITH_CHILDREN', "Selected with Children", "Export the currently selected objects with their children and parents."),
+                                    ('COLLECTIONS', "Each Collection", "Export each collection of the current scene to it's own .msh file, named after the collection, in the chosen file's directory."),
+                                    ('TOP_LEVEL_OBJECTS', "Each Top Level Object", "Export each object without a parent and it's children to it's own .msh file, named after the object, in the chosen file's directory.")
                                 ),
                                 default='SCENE')
 
@@ -97,17 +266,151 @@ class ExportMSH(Operator, ExportHelper):
         default=True
     )
 
+    collection: StringProperty(
+        name="Collection",
+        description="Only export the objects in this collection and it's child collections, "
+                    "instead of the objects the Export Target selects. Used by batch exporting.",
+        default="",
+        options={'HIDDEN', 'SKIP_SAVE'}
+    )
+
     def execute(self, context):
-        with open(self.filepath, 'wb') as output_file:
-            save_scene(
-                output_file=output_file,
-                scene=create_scene(
-                    generate_triangle_strips=self.generate_triangle_strips, 
-                    apply_modifiers=self.apply_modifiers,
-                    export_target=self.export_target))
+        vertex_cache_stats = []
+        weld_stats = []
+
+        scene_arguments = create_scene_arguments(self, vertex_cache_stats=vertex_cache_stats, weld_stats=weld_stats)
+        weld_tolerances = scene_arguments["weld_tolerances"]
+        triangle_strip_options = scene_arguments["triangle_strip_options"]
+
+        if self.collection:
+            if self.collection not in bpy.data.collections:
+                raise RuntimeError(f"Collection '{self.collection}' does not exist!")
+
+            scene_arguments["objects"] = select_collection_objects(bpy.data.collections[self.collection])
+
+            outputs = [(self.filepath, create_scene(**scene_arguments))]
+        elif self.export_target in {'COLLECTIONS', 'TOP_LEVEL_OBJECTS'}:
+            scenes = create_scenes(**scene_arguments)
+            filepaths = self.create_output_filepaths(os.path.dirname(self.filepath), list(scenes.keys()))
+
+            outputs = [(filepaths[name], scene) for name, scene in scenes.items()]
+        else:
+            outputs = [(self.filepath, create_scene(**scene_arguments))]
+
+        for filepath, scene in outputs:
+            if self.update_existing_file:
+                update_scene_file(filepath=filepath, scene=scene, fast_bounding_box=self.fast_bounding_box)
+            else:
+                save_scene_file(filepath=filepath, scene=scene, fast_bounding_box=self.fast_bounding_box)
+
+        if not weld_tolerances.is_exact():
+            self.report_weld_stats(weld_stats)
+
+        if self.optimize_vertex_cache:
+            self.report_vertex_cache_stats(vertex_cache_stats)
+
+        if self.generate_triangle_strips:
+            models = [model for _, scene in outputs for model in scene.models]
+
+            self.report_triangle_strip_stats(gather_triangle_strip_stats(models, triangle_strip_options))
+
+        if self.verify_output:
+            self.report_verification_problems([f"{os.path.basename(filepath)}: {problem}"
+                                               for filepath, _ in outputs if not is_stream_path(filepath)
+                                               for problem in verify_msh_file(filepath)])
+
+        if len(outputs) > 1:
+            self.report({'INFO'}, f"Exported {len(outputs)} .msh files.")
+        elif len(outputs) == 0:
+            self.report({'WARNING'}, "There was nothing to export.")
 
         return {'FINISHED'}
 
+    def create_output_filepaths(self, directory, names):
+        """ Creates the path of the .msh file for each name. Names that would share a file,
+            such as "Prop.001" and "Prop_001" or names differing only in case, get a numbered
+            suffix and a warning is reported for them. """
+
+        filepaths = {}
+        used_filenames = set()
+        renamed = []
+
+        for name in names:
+            filename = bpy.path.clean_name(name)
+            suffix = 2
+
+            while filename.lower() in used_filenames:
+                filename = f"{bpy.path.clean_name(name)}_{suffix}"
+                suffix += 1
+
+            if filename != bpy.path.clean_name(name):
+                renamed.append(f"'{name}' -> {filename}{self.filename_ext}")
+
+            used_filenames.add(filename.lower())
+            filepaths[name] = os.path.join(directory, filename + self.filename_ext)
+
+        for rename in renamed:
+            print(f"SWBF .msh export: {rename}")
+
+        if renamed:
+            self.report({'WARNING'}, f"{len(renamed)} names would have been exported to the same file as another "
+                                     f"and were renamed, the first was {renamed[0]}")
+
+        return filepaths
+
+    def report_verification_problems(self, problems):
+        """ Prints every problem found in the written file to the system console and
+            reports the first of them. """
+
+        for problem in problems:
+            print(f"SWBF .msh export: {problem}")
+
+        if problems:
+            self.report({'ERROR'}, f"The written .msh file failed verification with {len(problems)} problems, "
+                                   f"the first was: {problems[0]}")
+        else:
+            self.report({'INFO'}, "The written .msh file passed verification.")
+
+    def report_triangle_strip_stats(self, stats):
+        """ Prints the efficiency of each segment's triangle strips to the system console
+            and reports the totals. """
+
+        for segment_stats in stats:
+            print(f"SWBF .msh export: {segment_stats}")
+
+        total = TriangleStripStats(
+            triangle_count=sum(segment_stats.triangle_count for segment_stats in stats),
+            index_count=sum(segment_stats.index_count for segment_stats in stats),
+            vertex_cache_misses=sum(segment_stats.vertex_cache_misses for segment_stats in stats))
+
+        self.report({'INFO'}, f"Triangle strips: {total.triangle_count} triangles, "
+                              f"{total.indices_per_triangle:.3f} indices per triangle, ACMR {total.acmr:.3f}")
+
+    def report_weld_stats(self, stats):
+        """ Prints how many vertices welding with tolerances saved for each object to the
+            system console and reports the total. """
+
+        for object_stats in stats:
+            print(f"SWBF .msh export: {object_stats}")
+
+        self.report({'INFO'}, f"Welding: {sum(object_stats.vertices_saved for object_stats in stats)} "
+                              f"vertices saved across {len(stats)} objects")
+
+    def report_vertex_cache_stats(self, stats):
+        """ Prints the vertex cache efficiency of each segment before and after optimization
+            to the system console and reports the totals. """
+
+        for segment_stats in stats:
+            print(f"SWBF .msh export: {segment_stats}")
+
+        total = VertexCacheOptimizationStats(
+            triangle_count=sum(segment_stats.triangle_count for segment_stats in stats),
+            vertex_cache_misses_before=sum(segment_stats.vertex_cache_misses_before for segment_stats in stats),
+            vertex_cache_misses_after=sum(segment_stats.vertex_cache_misses_after for segment_stats in stats))
+
+        self.report({'INFO'}, f"Vertex cache optimization: {total.triangle_count} triangles, "
+                              f"ACMR {total.acmr_before:.3f} -> {total.acmr_after:.3f}")
+
 # Only needed if you want to add into a dynamic menu
 def menu_func_export(self, context):
     self.layout.operator(ExportMSH.bl_idname, text="SWBF msh (.msh)")
@@ -115,17 +418,28 @@ def menu_func_export(self, context):
 def register():
     bpy.utils.register_class(MaterialProperties)
     bpy.utils.register_class(MaterialPropertiesPanel)
+    bpy.utils.register_class(WatchProperties)
+    bpy.utils.register_class(WatchPanel)
     bpy.utils.register_class(ExportMSH)
 
     bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
     bpy.types.Material.swbf_msh = bpy.props.PointerProperty(type=MaterialProperties)
+    bpy.types.Scene.swbf_msh_watch = bpy.props.PointerProperty(type=WatchProperties)
+
+    register_geometry_cache_handlers()
+    register_watch_handlers()
 
 
 def unregister():
     bpy.utils.unregister_class(MaterialProperties)
     bpy.utils.unregister_class(MaterialPropertiesPanel)
+    bpy.utils.unregister_class(WatchProperties)
+    bpy.utils.unregister_class(WatchPanel)
     bpy.utils.unregister_class(ExportMSH)
     bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
 
+    unregister_geometry_cache_handlers()
+    unregister_watch_handlers()
+
 if __name__ == "__main__":
     register()
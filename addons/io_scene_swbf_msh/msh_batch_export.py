@@ -0,0 +1,278 @@
+""" Contains a command line driver for exporting many .blend files to .msh files with a
+    pool of background Blender processes. It's run with Blender:
+
+        blender -b -P msh_batch_export.py -- manifest.json --jobs 4
+
+    The manifest is a JSON file listing the .blend files to export, relative paths in it
+    are relative to the manifest:
+
+        {
+            "options": { "generate_triangle_strips": true },
+            "jobs": [
+                { "blend": "props/crate.blend", "output": "msh/crate.msh" },
+                { "blend": "props/props.blend", "scene": "Props", "collection": "Barrel",
+                  "output": "msh/barrel.msh", "options": { "apply_modifiers": false } }
+            ]
+        }
+
+    "options" are properties of the exporter passed to every job, a job's own options
+    override them. Jobs are split between the worker processes and a summary of every
+    job's result and timings is printed once they've all finished. """
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List
+
+import bpy
+import addon_utils
+
+# Each worker is a whole Blender process with a .blend file loaded, so more than a few
+# quickly runs out of memory. Larger pools can be asked for with --jobs.
+DEFAULT_WORKER_COUNT = min(2, os.cpu_count() or 1)
+
+@dataclass
+class BatchExportJob:
+    """ Class describing the export of a .blend file, or a scene or collection in it, to
+        a .msh file. """
+
+    blend: str = ""
+    output: str = ""
+    scene: str = None
+    collection: str = None
+    options: Dict = field(default_factory=dict)
+
+@dataclass
+class BatchExportResult:
+    """ Class describing the outcome of a BatchExportJob. """
+
+    blend: str = ""
+    output: str = ""
+    succeeded: bool = False
+    error: str = None
+    load_time: float = 0.0
+    export_time: float = 0.0
+    worker_exit_code: int = None
+
+def load_manifest(path: str) -> List[BatchExportJob]:
+    """ Loads the jobs of a manifest with the manifest's options applied to each job and
+        their paths made absolute. """
+
+    with open(path, "r", encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    jobs: List[BatchExportJob] = []
+
+    for job in manifest.get("jobs", []):
+        if "blend" not in job or "output" not in job:
+            raise RuntimeError(f"Manifest '{path}' has a job without a \"blend\" or \"output\"!")
+
+        jobs.append(BatchExportJob(
+            blend=os.path.join(directory, job["blend"]),
+            output=os.path.join(directory, job["output"]),
+            scene=job.get("scene"),
+            collection=job.get("collection"),
+            options={**manifest.get("options", {}), **job.get("options", {})}))
+
+    return jobs
+
+def run_batch_export(jobs: List[BatchExportJob], worker_count: int, blender_path: str) -> List[BatchExportResult]:
+    """ Runs jobs in worker_count background Blender processes and returns the result of
+        every job, in the order of jobs. Jobs not finished by a worker that exited early
+        are failed with the worker's exit code. """
+
+    shards = [jobs[index::worker_count] for index in range(worker_count)]
+    shards = [shard for shard in shards if len(shard) > 0]
+
+    with tempfile.TemporaryDirectory(prefix="msh_batch_export_") as directory:
+        workers = []
+
+        for index, shard in enumerate(shards):
+            jobs_path = os.path.join(directory, f"jobs_{index}.json")
+            results_path = os.path.join(directory, f"results_{index}.json")
+
+            with open(jobs_path, "w", encoding="utf-8") as jobs_file:
+                json.dump([asdict(job) for job in shard], jobs_file)
+
+            process = subprocess.Popen([blender_path, "-b", "--python-exit-code", "1",
+                                        "-P", os.path.abspath(__file__), "--",
+                                        "--worker", jobs_path, "--results", results_path])
+
+            workers.append((shard, results_path, process))
+
+        results: Dict[int, BatchExportResult] = {}
+
+        for shard, results_path, process in workers:
+            exit_code = process.wait()
+            shard_results = _load_results(results_path)
+
+            for job_index, job in enumerate(shard):
+                if job_index < len(shard_results):
+                    result = shard_results[job_index]
+                else:
+                    result = BatchExportResult(blend=job.blend, output=job.output,
+                                               error="The worker exited before the job finished.")
+
+                result.worker_exit_code = exit_code
+                results[id(job)] = result
+
+    return [results[id(job)] for job in jobs]
+
+def run_worker(jobs: List[BatchExportJob], results_path: str):
+    """ Runs jobs one after another in this Blender, saving the results to results_path
+        after each job so they survive the process crashing. """
+
+    _enable_addon()
+
+    results: List[BatchExportResult] = []
+
+    for job in jobs:
+        results.append(run_job(job))
+
+        _save_results(results_path, results)
+
+def run_job(job: BatchExportJob) -> BatchExportResult:
+    """ Runs a job in this Blender. The job's scene is exported through a context override,
+        so it works without a window, and a collection is exported without changing the
+        selection. Triangle strips are always generated serially as every worker is
+        already one process of the pool. """
+
+    result = BatchExportResult(blend=job.blend, output=job.output)
+
+    try:
+        start = time.perf_counter()
+
+        bpy.ops.wm.open_mainfile(filepath=job.blend, load_ui=False)
+
+        scene = _get_scene(job.scene)
+
+        result.load_time = time.perf_counter() - start
+
+        os.makedirs(os.path.dirname(job.output), exist_ok=True)
+
+        start = time.perf_counter()
+
+        outcome = _run_export_operator(scene, **{**job.options, "triangle_strip_workers": 1,
+                                                 "collection": job.collection or "",
+                                                 "filepath": job.output, "check_existing": False})
+
+        if 'FINISHED' not in outcome:
+            raise RuntimeError("The export was cancelled.")
+
+        result.export_time = time.perf_counter() - start
+        result.succeeded = True
+    except Exception as error:
+        result.error = str(error)
+
+    return result
+
+def _enable_addon():
+    """ Enables the exporter, from the directory of this script if it is not installed. """
+
+    addon_directory = os.path.dirname(os.path.abspath(__file__))
+    module_name = os.path.basename(addon_directory)
+
+    _, loaded = addon_utils.check(module_name)
+
+    if not loaded:
+        sys.path.insert(0, os.path.dirname(addon_directory))
+
+        if addon_utils.enable(module_name, default_set=False) is None:
+            raise RuntimeError(f"Failed to enable the exporter from '{addon_directory}'!")
+
+def _get_scene(scene_name: str) -> bpy.types.Scene:
+    """ Returns the scene named scene_name, or the active scene if it is None. """
+
+    if scene_name is None:
+        return bpy.context.scene
+
+    if scene_name not in bpy.data.scenes:
+        raise RuntimeError(f"Scene '{scene_name}' does not exist!")
+
+    return bpy.data.scenes[scene_name]
+
+def _run_export_operator(scene: bpy.types.Scene, **properties):
+    """ Runs the exporter with scene as the context's scene, without making it the
+        window's scene as background Blender may not have a window. """
+
+    if scene == bpy.context.scene:
+        return bpy.ops.swbf_msh.export(**properties)
+
+    override = {"scene": scene, "view_layer": scene.view_layers[0]}
+
+    if hasattr(bpy.context, "temp_override"):
+        with bpy.context.temp_override(**override):
+            return bpy.ops.swbf_msh.export(**properties)
+
+    # Blender versions before 3.2 take the override as the operator's first argument.
+    return bpy.ops.swbf_msh.export(override, **properties)
+
+def _save_results(path: str, results: List[BatchExportResult]):
+    temp_path = path + ".tmp"
+
+    with open(temp_path, "w", encoding="utf-8") as results_file:
+        json.dump([asdict(result) for result in results], results_file)
+
+    os.replace(temp_path, path)
+
+def _load_results(path: str) -> List[BatchExportResult]:
+    try:
+        with open(path, "r", encoding="utf-8") as results_file:
+            return [BatchExportResult(**result) for result in json.load(results_file)]
+    except (OSError, ValueError):
+        return []
+
+def print_summary(results: List[BatchExportResult], total_time: float):
+    for result in results:
+        status = "OK    " if result.succeeded else "FAILED"
+
+        print(f"{status} {result.load_time:7.2f}s load {result.export_time:7.2f}s export  "
+              f"{result.blend} -> {result.output}")
+
+        if not result.succeeded:
+            print(f"       {result.error} (worker exit code {result.worker_exit_code})")
+
+    failed_count = sum(1 for result in results if not result.succeeded)
+
+    print(f"Exported {len(results) - failed_count} of {len(results)} .msh files in {total_time:.2f}s, "
+          f"{failed_count} failed.")
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="blender -b -P msh_batch_export.py --",
+                                     description="Export .blend files to .msh files with a pool of Blender processes.")
+    parser.add_argument("manifest", nargs="?", help="JSON manifest of the jobs to export")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_WORKER_COUNT, help="number of Blender processes to use")
+    parser.add_argument("--blender", default=bpy.app.binary_path, help="Blender executable for the workers")
+    parser.add_argument("--summary", help="also save the results of every job as JSON to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--results", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        with open(args.worker, "r", encoding="utf-8") as jobs_file:
+            run_worker([BatchExportJob(**job) for job in json.load(jobs_file)], args.results)
+
+        return 0
+
+    if args.manifest is None:
+        parser.error("a manifest is required")
+
+    start = time.perf_counter()
+    results = run_batch_export(load_manifest(args.manifest), max(args.jobs, 1), args.blender)
+
+    print_summary(results, time.perf_counter() - start)
+
+    if args.summary is not None:
+        with open(args.summary, "w", encoding="utf-8") as summary_file:
+            json.dump([asdict(result) for result in results], summary_file, indent=4)
+
+    return 0 if all(result.succeeded for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []))
@@ -0,0 +1,66 @@
+""" Contains the function turning the properties of the export operator into the arguments
+    for creating a scene, shared by the operator and watch mode. """
+
+import bpy
+from typing import Dict, List
+from .msh_model_gather import WeldTolerances, WeldStats
+from .msh_model_gather_cache import geometry_cache
+from .msh_model_triangle_strips import TriangleStripMode, TriangleStripOptions
+from .msh_model_triangle_strips_cache import TriangleStripsCache
+from .msh_model_vertex_cache import VertexCacheType
+from .msh_model_vertex_cache_optimize import VertexCacheOptimizationStats
+
+EXPORT_OPERATOR_IDNAME = "swbf_msh.export"
+
+def get_last_export_settings():
+    """ Returns the properties the export operator was last run with, or it's defaults if
+        it hasn't been run yet. """
+
+    return bpy.context.window_manager.operator_properties_last(EXPORT_OPERATOR_IDNAME)
+
+def create_scene_arguments(settings, worker_count: int = None,
+                           vertex_cache_stats: List[VertexCacheOptimizationStats] = None,
+                           weld_stats: List[WeldStats] = None) -> Dict:
+    """ Creates the keyword arguments for create_scene and create_scenes from the
+        properties of the export operator. worker_count overrides the operator's triangle
+        strip workers when passed. Applies the operator's geometry cache settings to the
+        shared geometry cache. """
+
+    triangle_strip_options = TriangleStripOptions(
+        mode=TriangleStripMode[settings.triangle_strip_mode],
+        vertex_cache_size=settings.vertex_cache_size,
+        vertex_cache_type=VertexCacheType[settings.vertex_cache_type],
+        worker_count=settings.triangle_strip_workers if worker_count is None else worker_count,
+        stitch=settings.stitch_triangle_strips,
+        stitch_restart_cost=settings.strip_restart_cost)
+
+    triangle_strips_cache = None
+
+    if settings.use_triangle_strips_cache:
+        triangle_strips_cache = TriangleStripsCache(
+            directory=bpy.path.abspath(settings.triangle_strips_cache_directory),
+            max_size=settings.triangle_strips_cache_size * 1024 * 1024)
+
+    if settings.use_geometry_cache:
+        geometry_cache.max_size = settings.geometry_cache_size * 1024 * 1024
+    else:
+        geometry_cache.clear()
+
+    weld_tolerances = WeldTolerances(
+        position=settings.weld_position_tolerance,
+        normal=settings.weld_normal_tolerance,
+        texcoord=settings.weld_texcoord_tolerance,
+        color=settings.weld_color_tolerance)
+
+    return dict(
+        generate_triangle_strips=settings.generate_triangle_strips,
+        apply_modifiers=settings.apply_modifiers,
+        export_target=settings.export_target,
+        triangle_strip_options=triangle_strip_options,
+        triangle_strips_cache=triangle_strips_cache,
+        geometry_cache=geometry_cache if settings.use_geometry_cache else None,
+        split_large_segments=settings.split_large_segments,
+        optimize_vertex_cache=settings.optimize_vertex_cache,
+        vertex_cache_stats=vertex_cache_stats,
+        weld_tolerances=weld_tolerances,
+        weld_stats=weld_stats)
@@ -4,6 +4,7 @@
 from dataclasses import dataclass, field
 from typing import List
 from enum import Enum
+import numpy as np
 from mathutils import Vector, Quaternion
 
 class ModelType(Enum):
@@ -27,22 +28,59 @@ class ModelTransform:
     translation: Vector = field(default_factory=Vector)
     rotation: Quaternion = field(default_factory=Quaternion)
 
+def get_index_dtype(vertex_count: int):
+    """ Gets the smallest unsigned integer type able to index vertex_count vertices. """
+
+    return np.uint16 if vertex_count <= 0x10000 else np.uint32
+
 @dataclass
 class GeometrySegment:
-    """ Class representing a 'SEGM' section in a .msh file. """
+    """ Class representing a 'SEGM' section in a .msh file.
+
+        Vertex attributes are stored as contiguous float32 NumPy arrays with a row per
+        vertex. Triangles are stored as an unsigned (normally uint16) array with a row per
+        triangle and polygons as a flat array of their indices alongside their sizes.
+
+        Arrays may be shared between copies of a segment and must be replaced instead of
+        being modified in place. """
 
     material_name: str = ""
 
-    positions: List[Vector] = field(default_factory=list)
-    normals: List[Vector] = field(default_factory=list)
-    colors: List[List[float]] = None
-    texcoords: List[Vector] = field(default_factory=list)
+    positions: np.ndarray = field(default_factory=lambda: np.zeros((0, 3), dtype=np.float32))
+    normals: np.ndarray = field(default_factory=lambda: np.zeros((0, 3), dtype=np.float32))
+    colors: np.ndarray = None
+    texcoords: np.ndarray = field(default_factory=lambda: np.zeros((0, 2), dtype=np.float32))
     # TODO: Skin support.
 
-    polygons: List[List[int]] = field(default_factory=list)
-    triangles: List[List[int]] = field(default_factory=list)
+    polygon_indices: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.uint16))
+    polygon_sizes: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.uint16))
+    triangles: np.ndarray = field(default_factory=lambda: np.zeros((0, 3), dtype=np.uint16))
     triangle_strips: List[List[int]] = None
 
+    @property
+    def vertex_count(self) -> int:
+        return len(self.positions)
+
+    @property
+    def polygons(self) -> List[List[int]]:
+        """ Compatibility accessor for the polygons as a list of index lists. """
+
+        if len(self.polygon_sizes) == 0:
+            return []
+
+        offsets = np.cumsum(self.polygon_sizes, dtype=np.int64)[:-1]
+
+        return [polygon.tolist() for polygon in np.split(self.polygon_indices, offsets)]
+
+    @polygons.setter
+    def polygons(self, polygons: List[List[int]]):
+        """ Sets the polygons from a list of index lists, after the positions are set. """
+
+        self.polygon_sizes = np.array([len(polygon) for polygon in polygons], dtype=np.uint16)
+        self.polygon_indices = np.fromiter((index for polygon in polygons for index in polygon),
+                                           dtype=get_index_dtype(self.vertex_count),
+                                           count=int(self.polygon_sizes.sum(dtype=np.int64)))
+
 @dataclass
 class CollisionPrimitive:
     """ Class representing a 'SWCI' section in a .msh file. """
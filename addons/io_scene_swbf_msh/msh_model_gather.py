@@ -3,86 +3,344 @@
 
 import bpy
 import math
+import numpy as np
+from copy import copy
+from dataclasses import dataclass, astuple
 from enum import Enum
 from typing import List, Set, Dict, Tuple
 from itertools import zip_longest
+from contextlib import contextmanager, ExitStack
 from .msh_model import *
 from .msh_model_utilities import *
 from .msh_utilities import *
+from .msh_model_gather_cache import GeometryCache, create_object_fingerprint, EXPORT_SCENE_PROPERTY
 
 SKIPPED_OBJECT_TYPES = {"LATTICE", "CAMERA", "LIGHT", "SPEAKER", "LIGHT_PROBE"}
 MESH_OBJECT_TYPES = {"MESH", "CURVE", "SURFACE", "META", "FONT", "GPENCIL"}
 MAX_MSH_VERTEX_COUNT = 32767
 
-def gather_models(apply_modifiers: bool, export_target: str) -> List[Model]:
+@dataclass
+class WeldTolerances:
+    """ Class holding the spacing of the grids vertex attributes are snapped to when
+        welding triangle corners into vertices, corners whose attributes land in the same
+        grid cells are welded. 0.0 only welds identical values. """
+
+    position: float = 0.0
+    normal: float = 0.0
+    texcoord: float = 0.0
+    color: float = 0.0
+
+    def is_exact(self) -> bool:
+        return not any(astuple(self))
+
+@dataclass
+class WeldStats:
+    """ Class describing how many vertices welding with tolerances saved for an object. """
+
+    object_name: str = ""
+    exact_vertex_count: int = 0
+    vertex_count: int = 0
+    degenerate_triangle_count: int = 0
+
+    @property
+    def vertices_saved(self) -> int:
+        return self.exact_vertex_count - self.vertex_count
+
+    def __str__(self) -> str:
+        return (f"{self.object_name}: {self.exact_vertex_count} -> {self.vertex_count} vertices "
+                f"({self.vertices_saved} saved, {self.degenerate_triangle_count} degenerate triangles removed)")
+
+def gather_models(apply_modifiers: bool, export_target: str, geometry_cache: GeometryCache = None,
+                  split_large_segments: bool = False, weld_tolerances: WeldTolerances = None,
+                  weld_stats: List[WeldStats] = None, objects: List[bpy.types.Object] = None) -> List[Model]:
     """ Gathers the Blender objects from the current scene and returns them as a list of
-        Model objects. """
+        Model objects. If a GeometryCache is supplied geometry is reused from it for
+        objects that have not changed since it was stored. Objects sharing a data-block
+        and equivalent modifiers share the geometry created for the first of them.
+
+        When welding with tolerances the WeldStats of each object that had it's geometry
+        created are appended to weld_stats if passed. When objects is passed those objects
+        are gathered instead of the ones selected by export_target. """
+
+    if weld_tolerances is None:
+        weld_tolerances = WeldTolerances()
 
-    depsgraph = bpy.context.evaluated_depsgraph_get()
-    parents = create_parents_set()
+    # The objects are only evaluated once an object actually needs to be.
+    depsgraph = None
+    children_index = create_children_index()
+
+    # Unscaled geometry of each data-block created during this export.
+    shared_geometry: Dict[Tuple, List[GeometrySegment]] = {}
 
     models_list: List[Model] = []
 
-    for uneval_obj in select_objects(export_target):
-        if uneval_obj.type in SKIPPED_OBJECT_TYPES and uneval_obj.name not in parents:
-            continue
+    if objects is None:
+        objects = select_objects(export_target, children_index)
 
-        if apply_modifiers:
-            obj = uneval_obj.evaluated_get(depsgraph)
-        else:
-            obj = uneval_obj
+    with ExitStack() as exit_stack:
+        for uneval_obj in objects:
+            if uneval_obj.type in SKIPPED_OBJECT_TYPES and uneval_obj.name not in children_index:
+                continue
+
+            if apply_modifiers:
+                if depsgraph is None:
+                    depsgraph = exit_stack.enter_context(evaluate_objects(objects))
 
-        check_for_bad_lod_suffix(obj)
+                obj = uneval_obj.evaluated_get(depsgraph)
+            else:
+                obj = uneval_obj
 
-        local_translation, local_rotation, _ = obj.matrix_local.decompose()
+            check_for_bad_lod_suffix(obj)
 
-        model = Model()
-        model.name = obj.name
-        model.model_type = get_model_type(obj)
-        model.hidden = get_is_model_hidden(obj)
-        model.transform.rotation = convert_rotation_space(local_rotation)
-        model.transform.translation = convert_vector_space(local_translation)
+            local_translation, local_rotation, _ = obj.matrix_local.decompose()
 
-        if obj.parent is not None:
-            model.parent = obj.parent.name
+            model = Model()
+            model.name = obj.name
+            model.model_type = get_model_type(obj)
+            model.hidden = get_is_model_hidden(obj)
+            model.transform.rotation = convert_rotation_space(local_rotation)
+            model.transform.translation = convert_vector_space(local_translation)
 
-        if obj.type in MESH_OBJECT_TYPES:
-            mesh = obj.to_mesh()
-            model.geometry = create_mesh_geometry(mesh)
-            obj.to_mesh_clear()
+            if obj.parent is not None:
+                model.parent = obj.parent.name
 
-            _, _, world_scale = obj.matrix_world.decompose()
-            world_scale = convert_scale_space(world_scale)
-            scale_segments(world_scale, model.geometry)
-    
-            for segment in model.geometry:
-                if len(segment.positions) > MAX_MSH_VERTEX_COUNT:
-                    raise RuntimeError(f"Object '{obj.name}' has resulted in a .msh geometry segment that has "
-                                       f"more than {MAX_MSH_VERTEX_COUNT} vertices! Split the object's mesh up "
-                                       f"and try again!")
+            if obj.type in MESH_OBJECT_TYPES:
+                _, _, world_scale = obj.matrix_world.decompose()
+                world_scale = convert_scale_space(world_scale)
+
+                if geometry_cache is not None:
+                    fingerprint = create_object_fingerprint(obj, world_scale, apply_modifiers, astuple(weld_tolerances))
+                    model.geometry = geometry_cache.get(uneval_obj.name, fingerprint)
 
-        if get_is_collision_primitive(obj):
-            model.collisionprimitive = get_collision_primitive(obj)
+                if model.geometry is None:
+                    shared_key = create_shared_geometry_key(uneval_obj, apply_modifiers)
+                    unscaled_geometry = shared_geometry.get(shared_key) if shared_key is not None else None
 
-        models_list.append(model)
+                    if unscaled_geometry is None:
+                        object_weld_stats = WeldStats(object_name=obj.name)
+
+                        mesh = obj.to_mesh()
+                        unscaled_geometry = create_mesh_geometry(mesh, weld_tolerances, object_weld_stats)
+                        obj.to_mesh_clear()
+
+                        if weld_stats is not None and not weld_tolerances.is_exact():
+                            weld_stats.append(object_weld_stats)
+
+                        if shared_key is not None:
+                            shared_geometry[shared_key] = unscaled_geometry
+
+                    model.geometry = [copy(segment) for segment in unscaled_geometry]
+
+                    scale_segments(world_scale, model.geometry)
+
+                    if geometry_cache is not None:
+                        geometry_cache.put(uneval_obj.name, fingerprint, uneval_obj.data.name if uneval_obj.data else "",
+                                           model.geometry)
+
+                if split_large_segments:
+                    model.geometry = split_segments(model.geometry, MAX_MSH_VERTEX_COUNT)
+
+                for segment in model.geometry:
+                    if len(segment.positions) > MAX_MSH_VERTEX_COUNT:
+                        raise RuntimeError(f"Object '{obj.name}' has resulted in a .msh geometry segment that has "
+                                           f"more than {MAX_MSH_VERTEX_COUNT} vertices! Split the object's mesh up "
+                                           f"and try again!")
+
+            if get_is_collision_primitive(obj):
+                model.collisionprimitive = get_collision_primitive(obj)
+
+            models_list.append(model)
 
     return models_list
 
-def create_parents_set() -> Set[str]:
-    """ Creates a set with the names of the Blender objects from the current scene
-        that have at least one child. """
-        
-    parents = set()
+@contextmanager
+def evaluate_objects(objects: List[bpy.types.Object]):
+    """ Context manager. Yields a depsgraph with objects evaluated in it.
+
+        When the objects are only part of the current scene they're linked into a temporary
+        scene of their own and evaluated there, so exporting a few objects from a large
+        scene does not evaluate all of it. Anything they depend on, such as the targets of
+        their modifiers and constraints, is still evaluated by the depsgraph. The temporary
+        scene is removed afterwards. """
+
+    scene = bpy.context.scene
+
+    if len(objects) >= len(scene.objects) or not hasattr(bpy.types.ViewLayer, "depsgraph"):
+        yield bpy.context.evaluated_depsgraph_get()
+        return
+
+    export_scene = bpy.data.scenes.new(".swbf_msh_export")
+
+    # Marks the scene for depsgraph handlers, evaluating it is not a change to the objects.
+    export_scene[EXPORT_SCENE_PROPERTY] = True
+
+    try:
+        export_scene.frame_current = scene.frame_current
+
+        for obj in objects:
+            export_scene.collection.objects.link(obj)
+
+        depsgraph = export_scene.view_layers[0].depsgraph
+        depsgraph.update()
+
+        yield depsgraph
+    finally:
+        bpy.data.scenes.remove(export_scene)
+
+def create_shared_geometry_key(obj: bpy.types.Object, apply_modifiers: bool) -> Tuple:
+    """ Creates the key under which an object's unscaled geometry can be shared with other
+        objects using the same data-block. Returns None when the geometry can not be
+        shared because it depends on more than the object's data and modifier settings. """
+
+    if obj.data is None:
+        return None
+
+    key = [obj.type, obj.data.name_full, tuple(slot.material.name if slot.material else "" for slot in obj.material_slots)]
+
+    if apply_modifiers:
+        for modifier in obj.modifiers:
+            signature = get_modifier_signature(modifier)
+
+            if signature is None:
+                return None
+
+            key.append(signature)
+
+    return tuple(key)
+
+def get_modifier_signature(modifier: bpy.types.Modifier) -> Tuple:
+    """ Gets a tuple of a modifier's settings. Returns None for modifiers that reference
+        other objects or collections (directly or through a collection property, like UV
+        Project's projectors), that use geometry nodes or that use global texture
+        coordinates, as their result depends on more than their settings. """
+
+    if modifier.type == "NODES" or getattr(modifier, "texture_coords", None) == "GLOBAL":
+        return None
+
+    signature = [modifier.type]
+
+    for prop in modifier.bl_rna.properties:
+        if prop.identifier == "rna_type":
+            continue
+
+        if prop.type == "COLLECTION":
+            if len(getattr(modifier, prop.identifier)) > 0:
+                return None
+
+            continue
+
+        value = getattr(modifier, prop.identifier)
+
+        if prop.type == "POINTER":
+            if isinstance(value, (bpy.types.Object, bpy.types.Collection)):
+                return None
+
+            value = value.name_full if isinstance(value, bpy.types.ID) else None
+        elif prop.type == "ENUM" and prop.is_enum_flag:
+            value = frozenset(value)
+        elif getattr(prop, "is_array", False):
+            value = tuple(value)
+
+        signature.append((prop.identifier, value))
+
+    return tuple(signature)
+
+def create_children_index() -> Dict[str, List[bpy.types.Object]]:
+    """ Creates a dict mapping the names of the Blender objects from the current scene
+        that have at least one child to their children, in one pass over the scene. """
+
+    children_index: Dict[str, List[bpy.types.Object]] = {}
 
     for obj in bpy.context.scene.objects:
         if obj.parent is not None:
-            parents.add(obj.parent.name)
+            children_index.setdefault(obj.parent.name, []).append(obj)
+
+    return children_index
+
+@dataclass
+class MeshArrays:
+    """ Class holding the per triangle corner attributes of a Blender mesh as NumPy arrays,
+        already converted to .msh coordinate space. """
+
+    corner_positions: np.ndarray = None
+    corner_normals: np.ndarray = None
+    corner_texcoords: np.ndarray = None
+    corner_colors: np.ndarray = None
+    corner_loops: np.ndarray = None
+
+    triangle_material_indices: np.ndarray = None
+    triangle_polygon_indices: np.ndarray = None
+
+    polygon_loop_starts: np.ndarray = None
+    polygon_loop_totals: np.ndarray = None
+
+def read_mesh_arrays(mesh: bpy.types.Mesh) -> MeshArrays:
+    """ Reads the attributes of a Blender mesh with loop triangles in bulk with foreach_get. """
+
+    def read(collection, attribute: str, count: int, components: int, dtype) -> np.ndarray:
+        array = np.empty(count * components, dtype=dtype)
+        collection.foreach_get(attribute, array)
+
+        return array.reshape(-1, components) if components > 1 else array
 
-    return parents
+    vertex_count = len(mesh.vertices)
+    loop_count = len(mesh.loops)
+    triangle_count = len(mesh.loop_triangles)
+    polygon_count = len(mesh.polygons)
 
-def create_mesh_geometry(mesh: bpy.types.Mesh) -> List[GeometrySegment]:
+    arrays = MeshArrays()
+
+    vertex_positions = read(mesh.vertices, "co", vertex_count, 3, np.float32)
+    triangle_vertices = read(mesh.loop_triangles, "vertices", triangle_count, 3, np.int32)
+    triangle_loops = read(mesh.loop_triangles, "loops", triangle_count, 3, np.int32)
+    triangle_normals = read(mesh.loop_triangles, "normal", triangle_count, 3, np.float32)
+    triangle_use_smooth = read(mesh.loop_triangles, "use_smooth", triangle_count, 1, np.bool_)
+
+    arrays.triangle_material_indices = read(mesh.loop_triangles, "material_index", triangle_count, 1, np.int32)
+    arrays.triangle_polygon_indices = read(mesh.loop_triangles, "polygon_index", triangle_count, 1, np.int32)
+    arrays.polygon_loop_starts = read(mesh.polygons, "loop_start", polygon_count, 1, np.int32)
+    arrays.polygon_loop_totals = read(mesh.polygons, "loop_total", polygon_count, 1, np.int32)
+
+    corner_vertices = triangle_vertices.ravel()
+    arrays.corner_loops = triangle_loops.ravel()
+
+    if mesh.has_custom_normals:
+        smooth_normals = read(mesh.loops, "normal", loop_count, 3, np.float32)[arrays.corner_loops]
+    else:
+        smooth_normals = read(mesh.vertices, "normal", vertex_count, 3, np.float32)[corner_vertices]
+
+    if mesh.use_auto_smooth:
+        corner_normals = smooth_normals
+    else:
+        corner_use_smooth = np.repeat(triangle_use_smooth, 3)
+        corner_normals = np.where(corner_use_smooth[:, np.newaxis], smooth_normals,
+                                  np.repeat(triangle_normals, 3, axis=0))
+
+    arrays.corner_positions = convert_vector_space_array(vertex_positions[corner_vertices])
+    arrays.corner_normals = convert_vector_space_array(corner_normals)
+
+    if mesh.uv_layers.active is not None:
+        arrays.corner_texcoords = read(mesh.uv_layers.active.data, "uv", loop_count, 2, np.float32)[arrays.corner_loops]
+    else:
+        arrays.corner_texcoords = np.zeros((len(arrays.corner_loops), 2), dtype=np.float32)
+
+    if mesh.vertex_colors.active is not None:
+        arrays.corner_colors = read(mesh.vertex_colors.active.data, "color", loop_count, 4, np.float32)[arrays.corner_loops]
+
+    return arrays
+
+def create_mesh_geometry(mesh: bpy.types.Mesh, weld_tolerances: WeldTolerances = None,
+                         weld_stats: WeldStats = None) -> List[GeometrySegment]:
     """ Creates a list of GeometrySegment objects from a Blender mesh.
-        Does NOT create triangle strips in the GeometrySegment however. """
+        Does NOT create triangle strips in the GeometrySegment however.
+
+        Corners are welded into vertices when their attributes snap to the same values with
+        weld_tolerances, each vertex takes it's attributes from the first corner welded into it.
+        Triangles and polygons welding collapsed are removed. The vertex counts with and
+        without tolerances are stored in weld_stats if passed. """
+
+    if weld_tolerances is None:
+        weld_tolerances = WeldTolerances()
 
     if mesh.has_custom_normals:
         mesh.calc_normals_split()
@@ -93,91 +351,156 @@ def create_mesh_geometry(mesh: bpy.types.Mesh) -> List[GeometrySegment]:
     material_count = max(len(mesh.materials), 1)
 
     segments: List[GeometrySegment] = [GeometrySegment() for i in range(material_count)]
-    vertex_cache: List[Dict[Tuple[float], int]] = [dict() for i in range(material_count)]
-    vertex_remap: List[Dict[Tuple[int, int], int]] = [dict() for i in range(material_count)]
-    polygons: List[Set[int]] = [set() for i in range(material_count)]
-
-    if mesh.vertex_colors.active is not None:
-        for segment in segments:
-            segment.colors = []
 
     for segment, material in zip(segments, mesh.materials):
         segment.material_name = material.name
 
-    def add_vertex(material_index: int, vertex_index: int, loop_index: int, use_smooth_normal: bool, face_normal: Vector) -> int:
-        nonlocal segments, vertex_remap
+    arrays = read_mesh_arrays(mesh)
 
-        vertex_cache_miss_index = -1
-        segment = segments[material_index]
-        cache = vertex_cache[material_index]
-        remap = vertex_remap[material_index]
+    attribute_columns = [(arrays.corner_positions, weld_tolerances.position),
+                         (arrays.corner_normals, weld_tolerances.normal),
+                         (arrays.corner_texcoords, weld_tolerances.texcoord)]
 
-        vertex_normal: Vector
+    if arrays.corner_colors is not None:
+        attribute_columns.append((arrays.corner_colors, weld_tolerances.color))
 
-        if use_smooth_normal or mesh.use_auto_smooth:
-            if mesh.has_custom_normals:
-                vertex_normal = mesh.loops[loop_index].normal
-            else:
-                vertex_normal = mesh.vertices[vertex_index].normal
+    corner_attributes = np.hstack([quantize_attribute(column, tolerance) for column, tolerance in attribute_columns])
+    corner_material_indices = np.repeat(arrays.triangle_material_indices, 3)
+    vertex_corners, corner_indices = weld_corners(corner_attributes, corner_material_indices, material_count)
+
+    if weld_stats is not None:
+        weld_stats.vertex_count = sum(len(corners) for corners in vertex_corners)
+
+        if weld_tolerances.is_exact():
+            weld_stats.exact_vertex_count = weld_stats.vertex_count
         else:
-            vertex_normal = face_normal
+            exact_corners, _ = weld_corners(np.hstack([column for column, _ in attribute_columns]),
+                                            corner_material_indices, material_count)
+            weld_stats.exact_vertex_count = sum(len(corners) for corners in exact_corners)
 
-        def get_cache_vertex():
-            yield mesh.vertices[vertex_index].co.x
-            yield mesh.vertices[vertex_index].co.y
-            yield mesh.vertices[vertex_index].co.z
+    # Every loop belongs to a single polygon and so a single material, which lets the
+    # loop to vertex remap for all segments share one array.
+    loop_remap = np.zeros(len(mesh.loops), dtype=np.int64)
+    loop_remap[arrays.corner_loops] = corner_indices
 
-            yield vertex_normal.x
-            yield vertex_normal.y
-            yield vertex_normal.z
+    triangle_indices = corner_indices.reshape(-1, 3)
 
-            if mesh.uv_layers.active is not None:
-                yield mesh.uv_layers.active.data[loop_index].uv.x
-                yield mesh.uv_layers.active.data[loop_index].uv.y
+    for material_index, segment in enumerate(segments):
+        corners = vertex_corners[material_index]
+        index_dtype = get_index_dtype(len(corners))
 
-            if segment.colors is not None:
-                for v in mesh.vertex_colors.active.data[loop_index].color:
-                    yield v
+        segment.positions = np.ascontiguousarray(arrays.corner_positions[corners], dtype=np.float32)
+        segment.normals = np.ascontiguousarray(arrays.corner_normals[corners], dtype=np.float32)
+        segment.texcoords = np.ascontiguousarray(arrays.corner_texcoords[corners], dtype=np.float32)
 
-        vertex_cache_entry = tuple(get_cache_vertex())
-        cached_vertex_index = cache.get(vertex_cache_entry, vertex_cache_miss_index)
+        if arrays.corner_colors is not None:
+            segment.colors = np.ascontiguousarray(arrays.corner_colors[corners], dtype=np.float32)
 
-        if cached_vertex_index != vertex_cache_miss_index:
-            remap[(vertex_index, loop_index)] = cached_vertex_index
+        segment.triangles = triangle_indices[arrays.triangle_material_indices == material_index].astype(index_dtype)
 
-            return cached_vertex_index
+        polygon_indices = np.unique(arrays.triangle_polygon_indices[arrays.triangle_material_indices == material_index])
+        polygon_loop_totals = arrays.polygon_loop_totals[polygon_indices]
+        polygon_loops = (np.repeat(arrays.polygon_loop_starts[polygon_indices] - np.cumsum(polygon_loop_totals) +
+                                   polygon_loop_totals, polygon_loop_totals) +
+                         np.arange(int(polygon_loop_totals.sum())))
 
-        new_index: int = len(segment.positions)
-        cache[vertex_cache_entry] = new_index
-        remap[(vertex_index, loop_index)] = new_index
+        segment.polygon_indices = loop_remap[polygon_loops].astype(index_dtype)
+        segment.polygon_sizes = polygon_loop_totals.astype(np.uint16)
 
-        segment.positions.append(convert_vector_space(mesh.vertices[vertex_index].co))
-        segment.normals.append(convert_vector_space(vertex_normal))
+        # Welding with tolerances can merge the corners of small triangles and polygons.
+        if not weld_tolerances.is_exact():
+            triangle_count = len(segment.triangles)
 
-        if mesh.uv_layers.active is None:
-            segment.texcoords.append(Vector((0.0, 0.0)))
-        else:
-            segment.texcoords.append(mesh.uv_layers.active.data[loop_index].uv.copy())
+            segment.triangles = remove_degenerate_triangles(segment.triangles)
+            segment.polygon_indices, segment.polygon_sizes = remove_degenerate_polygons(segment.polygon_indices,
+                                                                                        segment.polygon_sizes)
 
-        if segment.colors is not None:
-            segment.colors.append(list(mesh.vertex_colors.active.data[loop_index].color))
+            if weld_stats is not None:
+                weld_stats.degenerate_triangle_count += triangle_count - len(segment.triangles)
 
-        return new_index
+    return segments
 
-    for tri in mesh.loop_triangles:
-        polygons[tri.material_index].add(tri.polygon_index)
-        segments[tri.material_index].triangles.append([
-            add_vertex(tri.material_index, tri.vertices[0], tri.loops[0], tri.use_smooth, tri.normal),
-            add_vertex(tri.material_index, tri.vertices[1], tri.loops[1], tri.use_smooth, tri.normal),
-            add_vertex(tri.material_index, tri.vertices[2], tri.loops[2], tri.use_smooth, tri.normal)])
+def quantize_attribute(values: np.ndarray, tolerance: float) -> np.ndarray:
+    """ Snaps attribute values to a grid with a spacing of tolerance so that values
+        differing only by noise weld together. Values in the same grid cell weld, so
+        values less than tolerance apart are not welded if they straddle a cell boundary
+        and each component can move by up to tolerance / 2. A tolerance of 0.0 returns
+        values as is. """
 
-    for segment, remap, polys in zip(segments, vertex_remap, polygons):
-        for poly_index in polys:
-            poly = mesh.polygons[poly_index]
+    if tolerance <= 0.0:
+        return values
 
-            segment.polygons.append([remap[(v, l)] for v, l in zip(poly.vertices, poly.loop_indices)])
+    return np.round(values.astype(np.float64) / tolerance)
 
-    return segments
+def weld_corners(corner_attributes: np.ndarray, corner_groups: np.ndarray,
+                 group_count: int) -> Tuple[List[np.ndarray], np.ndarray]:
+    """ Welds triangle corners with identical attributes within each group into vertices.
+
+        Returns a list with an array per group of the corners the group's vertices are taken
+        from, in order of first use, and an array mapping each corner to it's vertex index
+        in it's group. """
+
+    # Pack each corner's group and attributes into a single opaque value so all groups
+    # can be welded by one unique call. Adding 0.0 turns -0.0 into 0.0 so they compare equal.
+    # Quantized attributes arrive as float64 and keep their precision.
+    key_dtype = np.result_type(corner_attributes.dtype, np.float32)
+    keys = np.hstack((corner_groups.reshape(-1, 1).astype(key_dtype),
+                      corner_attributes.astype(key_dtype) + key_dtype.type(0.0)))
+    keys = np.ascontiguousarray(keys)
+    keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * keys.shape[1]))).ravel()
+
+    _, first_corners, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+
+    # np.unique sorts the vertices, renumber them in order of first use.
+    first_use_order = np.argsort(first_corners, kind="stable")
+    first_use_rank = np.empty_like(first_use_order)
+    first_use_rank[first_use_order] = np.arange(len(first_use_order))
+
+    vertex_first_corners = first_corners[first_use_order]
+    vertex_groups = corner_groups[vertex_first_corners]
+
+    # Then number each vertex within it's group.
+    group_order = np.argsort(vertex_groups, kind="stable")
+    group_starts = np.concatenate(([0], np.cumsum(np.bincount(vertex_groups, minlength=group_count))))
+    vertex_group_indices = np.empty_like(group_order)
+    vertex_group_indices[group_order] = np.arange(len(group_order)) - group_starts[vertex_groups[group_order]]
+
+    group_corners = [vertex_first_corners[group_order[group_starts[group]:group_starts[group + 1]]]
+                     for group in range(group_count)]
+
+    return group_corners, vertex_group_indices[first_use_rank[inverse]]
+
+def remove_degenerate_triangles(triangles: np.ndarray) -> np.ndarray:
+    """ Returns the triangles of an (n, 3) index array that use three different vertices. """
+
+    return triangles[(triangles[:, 0] != triangles[:, 1]) &
+                     (triangles[:, 1] != triangles[:, 2]) &
+                     (triangles[:, 2] != triangles[:, 0])]
+
+def remove_degenerate_polygons(polygon_indices: np.ndarray,
+                               polygon_sizes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Removes repeated consecutive indices from polygons, for example from a polygon's
+        corners being welded together, and then the polygons left with less than 3 indices.
+        Returns the new polygon indices and sizes. """
+
+    if len(polygon_sizes) == 0:
+        return polygon_indices, polygon_sizes
+
+    sizes = polygon_sizes.astype(np.int64)
+    starts = np.cumsum(sizes) - sizes
+    polygons = np.repeat(np.arange(len(sizes)), sizes)
+
+    # The index following each index, wrapping around to the start of it's polygon.
+    following = np.arange(1, len(polygon_indices) + 1)
+    following[starts + sizes - 1] = starts
+
+    keep = polygon_indices != polygon_indices[following]
+    new_sizes = np.bincount(polygons[keep], minlength=len(sizes))
+
+    keep &= (new_sizes >= 3)[polygons]
+
+    return polygon_indices[keep], new_sizes[new_sizes >= 3].astype(polygon_sizes.dtype)
 
 def get_model_type(obj: bpy.types.Object) -> ModelType:
     """ Get the ModelType for a Blender object. """
@@ -277,8 +600,10 @@ def check_for_bad_lod_suffix(obj: bpy.types.Object):
         if name.endswith(f"_lod{i}"):
             raise RuntimeError(failure_message)
 
-def select_objects(export_target: str) -> List[bpy.types.Object]:
-    """ Returns a list of objects to export. """
+def select_objects(export_target: str,
+                   children_index: Dict[str, List[bpy.types.Object]] = None) -> List[bpy.types.Object]:
+    """ Returns a list of objects to export. A children index from create_children_index
+        can be passed to avoid building a new one. """
 
     if export_target == "SCENE" or not export_target in {"SELECTED", "SELECTED_WITH_CHILDREN"}:
         return list(bpy.context.scene.objects)
@@ -287,25 +612,99 @@ def select_objects(export_target: str) -> List[bpy.types.Object]:
     added = {obj.name for obj in objects}
 
     if export_target == "SELECTED_WITH_CHILDREN":
+        if children_index is None:
+            children_index = create_children_index()
+
         children = []
 
-        def add_children(parent):
-            nonlocal children
-            nonlocal added
+        # Depth first, each child followed by it's own children before it's next sibling.
+        for obj in objects:
+            pending = list(reversed(children_index.get(obj.name, ())))
+
+            while pending:
+                child = pending.pop()
 
-            for obj in bpy.context.scene.objects:
-                if obj.parent == parent and obj.name not in added:
-                    children.append(obj)
-                    added.add(obj.name)
+                if child.name in added:
+                    continue
 
-                    add_children(obj)
+                children.append(child)
+                added.add(child.name)
 
-        
-        for obj in objects:
-            add_children(obj)
+                pending.extend(reversed(children_index.get(child.name, ())))
 
         objects = objects + children
 
+    return add_object_parents(objects)
+
+def select_object_groups(export_target: str,
+                         children_index: Dict[str, List[bpy.types.Object]] = None) -> Dict[str, List[bpy.types.Object]]:
+    """ Returns the objects to export to each of several .msh files, keyed by the name of
+        what they're exported from. For 'COLLECTIONS' this is each child collection of the
+        scene with the objects in it and it's child collections. For 'TOP_LEVEL_OBJECTS'
+        it's each object without a parent, with it's children. The parents of objects are
+        included in the same group as them. """
+
+    groups: Dict[str, List[bpy.types.Object]] = {}
+
+    if export_target == "COLLECTIONS":
+        scene_objects = set(bpy.context.scene.objects)
+
+        for top_collection in bpy.context.scene.collection.children:
+            objects = select_collection_objects(top_collection, scene_objects)
+
+            if objects:
+                groups[top_collection.name] = objects
+    elif export_target == "TOP_LEVEL_OBJECTS":
+        if children_index is None:
+            children_index = create_children_index()
+
+        for root in bpy.context.scene.objects:
+            if root.parent is not None:
+                continue
+
+            objects = []
+            pending = [root]
+
+            while pending:
+                obj = pending.pop()
+
+                objects.append(obj)
+                pending.extend(reversed(children_index.get(obj.name, ())))
+
+            groups[root.name] = objects
+    else:
+        raise RuntimeError(f"Export target '{export_target}' does not export to multiple .msh files!")
+
+    return groups
+
+def select_collection_objects(collection: bpy.types.Collection,
+                              scene_objects: Set[bpy.types.Object] = None) -> List[bpy.types.Object]:
+    """ Returns the objects of the current scene in a collection and it's child collections,
+        followed by their parents. """
+
+    if scene_objects is None:
+        scene_objects = set(bpy.context.scene.objects)
+
+    objects = []
+    added = set()
+    collections = [collection]
+
+    while collections:
+        collection = collections.pop()
+
+        for obj in collection.objects:
+            if obj in scene_objects and obj.name not in added:
+                objects.append(obj)
+                added.add(obj.name)
+
+        collections.extend(reversed(collection.children))
+
+    return add_object_parents(objects)
+
+def add_object_parents(objects: List[bpy.types.Object]) -> List[bpy.types.Object]:
+    """ Returns a list of objects followed by any of their ancestors not already in it. """
+
+    added = {obj.name for obj in objects}
     parents = []
 
     for obj in objects:
@@ -323,6 +722,14 @@ def select_objects(export_target: str) -> List[bpy.types.Object]:
 def convert_vector_space(vec: Vector) -> Vector:
     return Vector((-vec.x, vec.z, vec.y))
 
+def convert_vector_space_array(vectors: np.ndarray) -> np.ndarray:
+    """ Converts an (n, 3) array of vectors to .msh coordinate space. """
+
+    converted = vectors[:, [0, 2, 1]]
+    converted[:, 0] *= -1.0
+
+    return converted
+
 def convert_scale_space(vec: Vector) -> Vector:
     return Vector(vec.xzy)
 
@@ -0,0 +1,176 @@
+""" Contains the export session cache of GeometrySegments built for Blender objects
+    and the handlers keeping it up to date with changes made in Blender. """
+
+import bpy
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from copy import copy
+from dataclasses import dataclass, field
+from typing import List, Tuple
+from bpy.app.handlers import persistent
+from .msh_model import *
+
+# Custom property set on the temporary scenes objects are evaluated in during export.
+EXPORT_SCENE_PROPERTY = "swbf_msh_export"
+
+@dataclass
+class GeometryCacheEntry:
+    fingerprint: Tuple = ()
+    data_name: str = ""
+    segments: List[GeometrySegment] = field(default_factory=list)
+    size: int = 0
+
+class GeometryCache:
+    """ Class caching the GeometrySegments created for objects between exports.
+
+        Entries are keyed by object name and only used while the object's fingerprint
+        still matches. Entries are also invalidated when Blender reports an object or
+        it's data has been changed. The least recently used entries are evicted when
+        the estimated size of the cache exceeds max_size. """
+
+    def __init__(self, max_size: int = 256 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, name: str, fingerprint: Tuple) -> List[GeometrySegment]:
+        """ Returns copies of the cached segments for an object or None. """
+
+        entry = self._entries.get(name)
+
+        if entry is None or entry.fingerprint != fingerprint:
+            return None
+
+        self._entries.move_to_end(name)
+
+        return [copy(segment) for segment in entry.segments]
+
+    def put(self, name: str, fingerprint: Tuple, data_name: str, segments: List[GeometrySegment]):
+        """ Stores copies of the segments for an object. """
+
+        self.invalidate(name)
+
+        entry = GeometryCacheEntry(
+            fingerprint=fingerprint,
+            data_name=data_name,
+            segments=[copy(segment) for segment in segments],
+            size=sum(_estimate_segment_size(segment) for segment in segments))
+
+        self._entries[name] = entry
+        self.size += entry.size
+
+        while self.size > self.max_size and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def invalidate(self, name: str):
+        entry = self._entries.pop(name, None)
+
+        if entry is not None:
+            self.size -= entry.size
+
+    def invalidate_data(self, data_name: str):
+        """ Invalidates the entries of every object using a data-block. """
+
+        for name in [name for name, entry in self._entries.items() if entry.data_name == data_name]:
+            self.invalidate(name)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+geometry_cache = GeometryCache()
+
+def create_object_fingerprint(obj: bpy.types.Object, world_scale, apply_modifiers: bool,
+                              weld_tolerances: Tuple = ()) -> Tuple:
+    """ Creates a fingerprint for an (evaluated) object from the things that affect the
+        geometry created for it. The vertex positions, topology, smoothing, materials,
+        custom normals, active UVs and active vertex colors of meshes are hashed, everything
+        else is left to the depsgraph update handler to invalidate. """
+
+    data = obj.data
+    fingerprint = [obj.type, data.name if data is not None else "", tuple(world_scale), apply_modifiers,
+                   weld_tolerances]
+
+    fingerprint.append(tuple((modifier.type, modifier.name, modifier.show_viewport) for modifier in obj.modifiers))
+    fingerprint.append(tuple(slot.material.name if slot.material else "" for slot in obj.material_slots))
+
+    if isinstance(data, bpy.types.Mesh):
+        hasher = hashlib.blake2b(digest_size=16)
+
+        def hash_attribute(collection, attribute: str, count: int, dtype):
+            array = np.empty(count, dtype=dtype)
+            collection.foreach_get(attribute, array)
+            hasher.update(array.tobytes())
+
+        loop_count = len(data.loops)
+        polygon_count = len(data.polygons)
+
+        hash_attribute(data.vertices, "co", len(data.vertices) * 3, np.float32)
+        hash_attribute(data.loops, "vertex_index", loop_count, np.int32)
+        hash_attribute(data.polygons, "loop_total", polygon_count, np.int32)
+        hash_attribute(data.polygons, "use_smooth", polygon_count, bool)
+        hash_attribute(data.polygons, "material_index", polygon_count, np.int32)
+
+        if data.has_custom_normals:
+            data.calc_normals_split()
+            hash_attribute(data.loops, "normal", loop_count * 3, np.float32)
+
+        uv_layer = data.uv_layers.active
+
+        if uv_layer is not None:
+            hash_attribute(uv_layer.data, "uv", loop_count * 2, np.float32)
+
+        vertex_colors = data.vertex_colors.active
+
+        if vertex_colors is not None:
+            hash_attribute(vertex_colors.data, "color", loop_count * 4, np.float32)
+
+        fingerprint.extend((loop_count, polygon_count, data.use_auto_smooth, data.auto_smooth_angle,
+                            data.has_custom_normals, uv_layer is not None,
+                            vertex_colors is not None, hasher.hexdigest()))
+
+    return tuple(fingerprint)
+
+@persistent
+def on_depsgraph_update_post(scene, depsgraph=None):
+    """ Invalidates the cached geometry of objects and data-blocks that have changed. """
+
+    if scene.get(EXPORT_SCENE_PROPERTY):
+        return
+
+    if depsgraph is None:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+
+    for update in depsgraph.updates:
+        original = update.id.original
+
+        if isinstance(original, bpy.types.Object):
+            if update.is_updated_geometry:
+                geometry_cache.invalidate(original.name)
+        elif update.is_updated_geometry:
+            geometry_cache.invalidate_data(original.name)
+
+@persistent
+def on_load_post(*args):
+    geometry_cache.clear()
+
+def register_geometry_cache_handlers():
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update_post)
+    bpy.app.handlers.load_post.append(on_load_post)
+
+def unregister_geometry_cache_handlers():
+    if on_depsgraph_update_post in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(on_depsgraph_update_post)
+
+    if on_load_post in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(on_load_post)
+
+    geometry_cache.clear()
+
+def _estimate_segment_size(segment: GeometrySegment) -> int:
+    arrays = [segment.positions, segment.normals, segment.texcoords, segment.colors,
+              segment.polygon_indices, segment.polygon_sizes, segment.triangles]
+
+    return sum(array.nbytes for array in arrays if array is not None)
@@ -1,81 +1,263 @@
 """ Contains triangle strip generation functions for GeometrySegment. """
 
-from typing import List, Tuple
-from copy import deepcopy
+import multiprocessing
+import multiprocessing.spawn
+import os
+import sys
+import numpy as np
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import chain, repeat
+from typing import List, Tuple, Dict
 from .msh_model import *
+from .msh_model_vertex_cache import VertexCacheType, count_vertex_cache_misses, calculate_acmr
+from .msh_model_triangle_strips_cache import TriangleStripsCache
+from .msh_model_triangle_strips_generate import *
 
-def create_models_triangle_strips(models: List[Model]) -> List[Model]:
-    """ Create the triangle strips for a list of models geometry. """
+# Must be incremented whenever a change is made that alters the generated strips
+# so that stale entries in the triangle strips cache are not used.
+TRIANGLE_STRIPS_VERSION = 1
 
-    for model in models:
-        if model.geometry is not None:
-            for segment in model.geometry:
-                segment.triangle_strips = create_triangle_strips(segment.triangles)
+@dataclass
+class TriangleStripStats:
+    """ Class describing the efficiency of a GeometrySegment's triangle strips. """
+
+    model_name: str = ""
+    material_name: str = ""
+    triangle_count: int = 0
+    index_count: int = 0
+    vertex_cache_misses: int = 0
+
+    @property
+    def indices_per_triangle(self) -> float:
+        if self.triangle_count == 0:
+            return 0.0
+
+        return self.index_count / self.triangle_count
+
+    @property
+    def acmr(self) -> float:
+        return calculate_acmr(self.vertex_cache_misses, self.triangle_count)
+
+    def __str__(self) -> str:
+        return (f"'{self.model_name}' segment '{self.material_name}': {self.triangle_count} triangles, "
+                f"{self.indices_per_triangle:.3f} indices per triangle, ACMR {self.acmr:.3f}")
+
+def create_models_triangle_strips(models: List[Model], options: TriangleStripOptions = None,
+                                  cache: TriangleStripsCache = None) -> List[Model]:
+    """ Create the triangle strips for a list of models geometry. If a cache is supplied
+        it is used to skip generating strips for previously seen segments. """
+
+    if options is None:
+        options = TriangleStripOptions()
+
+    segments: List[GeometrySegment] = [segment for model in models if model.geometry is not None
+                                               for segment in model.geometry]
+
+    if cache is None:
+        _create_segments_triangle_strips(segments, options)
+
+        return models
+
+    keys: List[str] = [cache.create_key(_pack_triangles(segment.triangles), TRIANGLE_STRIPS_VERSION,
+                                        options.get_signature()) for segment in segments]
+    missed_segments: List[GeometrySegment] = []
+    missed_keys: List[str] = []
+
+    for segment, key in zip(segments, keys):
+        segment.triangle_strips = cache.get(key)
+
+        if segment.triangle_strips is None:
+            missed_segments.append(segment)
+            missed_keys.append(key)
+
+    if missed_segments:
+        _create_segments_triangle_strips(missed_segments, options)
+
+        for segment, key in zip(missed_segments, missed_keys):
+            cache.put(key, segment.triangle_strips)
+
+        cache.evict()
 
     return models
 
-def create_triangle_strips(segment_triangles: List[List[int]]) -> List[List[int]]:
-    """ Create the triangle strips for a list of triangles. """
+def _create_segments_triangle_strips(segments: List[GeometrySegment], options: TriangleStripOptions):
+    """ Create the triangle strips for a list of segments, in parallel when requested. """
 
-    triangles = deepcopy(segment_triangles)
-    strips: List[List[int]] = []
+    global _process_pool_failed
+
+    worker_count = options.worker_count if options.worker_count > 0 else os.cpu_count() or 1
+    worker_count = min(worker_count, len(segments))
+
+    if worker_count > 1 and not _process_pool_failed:
+        try:
+            _create_segments_triangle_strips_parallel(segments, options, worker_count)
+
+            return
+        except Exception as error:
+            # Process pools are not available in every Blender build or platform, generate
+            # strips serially for the rest of the session instead of retrying every export.
+            _process_pool_failed = True
+
+            print(f"SWBF .msh export: Generating triangle strips in parallel failed ({error!r}), "
+                  f"they will be generated serially from now on.")
+
+    for segment in segments:
+        segment.triangle_strips = create_segment_triangle_strips(segment.triangles.tolist(), options)
+
+# Set once starting or using a process pool has failed, after which strips are only
+# generated serially.
+_process_pool_failed = False
+
+def _create_segments_triangle_strips_parallel(segments: List[GeometrySegment], options: TriangleStripOptions,
+                                              worker_count: int):
+    """ Create the triangle strips for a list of segments with a process pool.
+        Only packed index buffers and options are sent to and received from the workers.
+
+        The workers are spawned with Blender's bundled Python and only import the strip
+        generation module, never bpy or the rest of the addon. If they haven't finished
+        within a generous timeout they're assumed to be hung and terminated. """
+
+    generate_module = _load_generate_module()
+    context = multiprocessing.get_context("spawn")
 
-    # The general idea here is we loop based off if 'triangles' is empty or not.
-    #
-    # For each iteration of the loop we create a new strip starting from the first
-    # triangle still in 'triangles'.
-    #
-    # Then we loop, attempting to find a triangle to add the strip each time. If we
-    # find one then we continue the loop, else we break out of it and append the
-    # created strip.
+    # The spawn context's executable is shared by everything in the process, so it's only
+    # changed while this pool starts it's workers.
+    previous_executable = multiprocessing.spawn.get_executable()
+    context.set_executable(_find_python_executable())
 
-    def create_strip() -> List[int]:
-        strip: List[int] = [triangles[0][0],
-                            triangles[0][1],
-                            triangles[0][2]]
-        strip_head: Tuple[int, int] = (strip[1], strip[2])
+    try:
+        _run_triangle_strips_pool(generate_module, context, segments, options, worker_count)
+    finally:
+        context.set_executable(previous_executable)
 
-        triangles.remove(triangles[0])
+def _run_triangle_strips_pool(generate_module, context, segments: List[GeometrySegment],
+                              options: TriangleStripOptions, worker_count: int):
+    triangle_buffers = [_pack_triangles(segment.triangles) for segment in segments]
+    chunksize = max(1, len(segments) // (worker_count * 4))
+    timeout = _WORKER_TIMEOUT_BASE + sum(len(segment.triangles) for segment in segments) * _WORKER_TIMEOUT_PER_TRIANGLE
 
-        while True:
-            def find_next_vertex():
-                nonlocal triangles
+    executor = ProcessPoolExecutor(max_workers=worker_count, mp_context=context, initializer=exec,
+                                   initargs=(_LOAD_GENERATE_MODULE_SOURCE, _create_load_generate_module_globals()))
 
-                even: bool = len(strip) % 2 == 0
+    try:
+        strip_buffers = list(executor.map(generate_module.create_packed_triangle_strips, triangle_buffers,
+                                          repeat(pack_triangle_strip_options(options)),
+                                          chunksize=chunksize, timeout=timeout))
+    except BaseException:
+        # Hung or crashed workers would otherwise keep the pool from shutting down.
+        for process in list(getattr(executor, "_processes", {}).values()):
+            process.terminate()
 
-                for tri, edge, last_vertex in iterate_triangle_edges_last_vertex(triangles, even):
-                    if edge == strip_head:
-                        triangles.remove(tri)
-                        return last_vertex
+        executor.shutdown(wait=False)
 
-                return None
+        raise
 
-            next_vertex: int = find_next_vertex()
+    executor.shutdown()
 
-            if next_vertex is None:
-                break
+    for segment, (lengths, indices) in zip(segments, strip_buffers):
+        segment.triangle_strips = _unpack_triangle_strips(lengths, indices)
 
-            strip.append(next_vertex)
-            strip_head = (strip_head[1], next_vertex)
+_WORKER_TIMEOUT_BASE = 60.0
+_WORKER_TIMEOUT_PER_TRIANGLE = 0.001
 
-        return strip
+# The strip generation module is loaded by path as a submodule of a private package, so
+# it can be imported without the addon's __init__.py (which imports bpy) and without adding
+# the addon's directory to sys.path. The same source loads it in the addon and, run with
+# exec as the pool's initializer, in every worker before anything of the addon is unpickled.
+_GENERATE_PACKAGE_NAME = "_swbf_msh_triangle_strips"
+_GENERATE_MODULE_NAME = f"{_GENERATE_PACKAGE_NAME}.msh_model_triangle_strips_generate"
 
-    while triangles:
-        strips.append(create_strip())
+_LOAD_GENERATE_MODULE_SOURCE = """
+import importlib.util, os, sys, types
+
+for name in [name for name in sys.modules if name.split(".")[0] == package_name]:
+    del sys.modules[name]
+
+package = types.ModuleType(package_name)
+package.__path__ = [directory]
+sys.modules[package_name] = package
+
+spec = importlib.util.spec_from_file_location(module_name, os.path.join(directory, "msh_model_triangle_strips_generate.py"))
+module = importlib.util.module_from_spec(spec)
+sys.modules[module_name] = module
+spec.loader.exec_module(module)
+"""
+
+def _create_load_generate_module_globals() -> Dict:
+    return {"package_name": _GENERATE_PACKAGE_NAME, "module_name": _GENERATE_MODULE_NAME,
+            "directory": os.path.dirname(os.path.abspath(__file__))}
+
+# Loaded on first use, the module is loaded again whenever this module is reloaded.
+_generate_module = None
+
+def _load_generate_module():
+    global _generate_module
+
+    if _generate_module is None:
+        exec(_LOAD_GENERATE_MODULE_SOURCE, _create_load_generate_module_globals())
+        _generate_module = sys.modules[_GENERATE_MODULE_NAME]
+
+    return _generate_module
+
+def _find_python_executable() -> str:
+    """ Finds the Python interpreter to spawn workers with. Depending on the version of
+        Blender sys.executable is either it's bundled Python or Blender itself. """
+
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+
+    version = f"{sys.version_info.major}.{sys.version_info.minor}"
+
+    for name in ("python.exe", f"python{version}", f"python{version}m", "python3", "python"):
+        path = os.path.join(sys.prefix, "bin", name)
+
+        if os.path.isfile(path):
+            return path
+
+    raise RuntimeError("Could not find Blender's bundled Python to generate triangle strips with!")
+
+def _pack_triangles(triangles: np.ndarray) -> bytes:
+    return np.ascontiguousarray(triangles, dtype=np.uint16).tobytes()
+
+def _unpack_triangle_strips(lengths_buffer: bytes, indices_buffer: bytes) -> List[List[int]]:
+    lengths = array("I")
+    lengths.frombytes(lengths_buffer)
+    indices = array("H")
+    indices.frombytes(indices_buffer)
+
+    strips: List[List[int]] = []
+    offset = 0
+
+    for length in lengths:
+        strips.append(indices[offset:offset + length].tolist())
+        offset += length
 
     return strips
 
-def iterate_triangle_edges_last_vertex(triangles: List[List[int]], even: bool):
-    """ Generator for iterating through the of each triangle in a list edges.
-        Yields (triangle, edge, last_vertex). """
-
-    if even:
-        for tri in triangles:
-            yield tri, (tri[0], tri[1]), tri[2]
-            yield tri, (tri[0], tri[2]), tri[1]
-            yield tri, (tri[1], tri[2]), tri[0]
-    else:
-        for tri in triangles:
-            yield tri, (tri[1], tri[0]), tri[2]
-            yield tri, (tri[2], tri[0]), tri[1]
-            yield tri, (tri[2], tri[1]), tri[0]
+def gather_triangle_strip_stats(models: List[Model], options: TriangleStripOptions = None) -> List[TriangleStripStats]:
+    """ Measures the index count and vertex cache efficiency of each GeometrySegment's
+        triangle strips in a list of models. """
+
+    if options is None:
+        options = TriangleStripOptions()
+
+    stats: List[TriangleStripStats] = []
+
+    for model in models:
+        if model.geometry is None:
+            continue
+
+        for segment in model.geometry:
+            indices = list(chain.from_iterable(segment.triangle_strips))
+
+            stats.append(TriangleStripStats(
+                model_name=model.name,
+                material_name=segment.material_name,
+                triangle_count=len(segment.triangles),
+                index_count=len(indices),
+                vertex_cache_misses=count_vertex_cache_misses(indices, options.vertex_cache_size,
+                                                              options.vertex_cache_type)))
+
+    return stats
@@ -0,0 +1,147 @@
+""" Contains a persistent on-disk cache for generated triangle strips. """
+
+import hashlib
+import os
+import tempfile
+import time
+from array import array
+from itertools import chain
+from typing import List
+
+TRIANGLE_STRIPS_CACHE_FILE_EXTENSION = ".strp"
+TRIANGLE_STRIPS_CACHE_TEMP_FILE_EXTENSION = ".strp.tmp"
+
+# Temporary files older than this (in seconds) were left by an export that was killed
+# part way through writing them and are removed by evict.
+_STALE_TEMP_FILE_AGE = 60 * 60
+
+def get_default_triangle_strips_cache_directory() -> str:
+    return os.path.join(tempfile.gettempdir(), "swbf_msh_triangle_strips_cache")
+
+class TriangleStripsCache:
+    """ Content addressed cache of triangle strips stored as one file per entry in a
+        directory. Hits refresh an entry's modification time so that evicting the
+        oldest entries first keeps the most recently used strips. """
+
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory or get_default_triangle_strips_cache_directory()
+        self.max_size = max_size
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+        except OSError:
+            pass
+
+    def create_key(self, triangle_buffer: bytes, version: int, options_signature: str) -> str:
+        """ Creates the key for a packed triangle buffer and the settings used to strip it. """
+
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update(f"{version}:{options_signature}:".encode("utf-8"))
+        hasher.update(triangle_buffer)
+
+        return hasher.hexdigest()
+
+    def get(self, key: str) -> List[List[int]]:
+        """ Returns the cached triangle strips for a key or None. """
+
+        path = self._get_path(key)
+
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+
+            os.utime(path)
+        except OSError:
+            return None
+
+        try:
+            return _unpack_triangle_strips(data)
+        except (ValueError, IndexError):
+            return None
+
+    def put(self, key: str, strips: List[List[int]]):
+        """ Stores triangle strips for a key. Failures to write are ignored and never leave
+            the temporary file the entry is written to behind. """
+
+        path = self._get_path(key)
+        temp_path = None
+
+        try:
+            file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory,
+                                                          suffix=TRIANGLE_STRIPS_CACHE_TEMP_FILE_EXTENSION)
+
+            with os.fdopen(file_descriptor, "wb") as file:
+                file.write(_pack_triangle_strips(strips))
+
+            os.replace(temp_path, path)
+            temp_path = None
+        except OSError:
+            pass
+        finally:
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def evict(self):
+        """ Removes the least recently used entries until the cache fits in it's max size.
+            Temporary files left behind by killed exports are removed as well. """
+
+        entries = []
+        stale_time = time.time() - _STALE_TEMP_FILE_AGE
+
+        try:
+            with os.scandir(self.directory) as iterator:
+                for entry in iterator:
+                    if entry.name.endswith(TRIANGLE_STRIPS_CACHE_FILE_EXTENSION):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    elif entry.name.endswith(TRIANGLE_STRIPS_CACHE_TEMP_FILE_EXTENSION):
+                        if entry.stat().st_mtime < stale_time:
+                            os.remove(entry.path)
+        except OSError:
+            return
+
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + TRIANGLE_STRIPS_CACHE_FILE_EXTENSION)
+
+def _pack_triangle_strips(strips: List[List[int]]) -> bytes:
+    lengths = array("I", [len(strips)])
+    lengths.extend(len(strip) for strip in strips)
+
+    return lengths.tobytes() + array("H", chain.from_iterable(strips)).tobytes()
+
+def _unpack_triangle_strips(data: bytes) -> List[List[int]]:
+    header = array("I")
+    header.frombytes(data[0:4])
+    strip_count = header[0]
+
+    lengths = array("I")
+    lengths.frombytes(data[4:4 + strip_count * 4])
+    indices = array("H")
+    indices.frombytes(data[4 + strip_count * 4:])
+
+    if len(lengths) != strip_count or sum(lengths) != len(indices):
+        raise ValueError("Truncated triangle strips cache entry.")
+
+    strips: List[List[int]] = []
+    offset = 0
+
+    for length in lengths:
+        strips.append(indices[offset:offset + length].tolist())
+        offset += length
+
+    return strips
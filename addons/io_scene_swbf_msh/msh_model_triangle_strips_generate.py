@@ -0,0 +1,378 @@
+""" Contains the generation of triangle strips from lists of triangles. Only depends on
+    NumPy and the standard library, so that it can be imported by the worker processes
+    strips are generated in without importing bpy or the rest of the addon. """
+
+import numpy as np
+from array import array
+from dataclasses import dataclass
+from enum import Enum
+from itertools import chain
+from typing import List, Tuple, Dict
+
+try:
+    from .msh_model_vertex_cache import VertexCache, VertexCacheType, count_vertex_cache_misses
+except ImportError:
+    from msh_model_vertex_cache import VertexCache, VertexCacheType, count_vertex_cache_misses
+
+class TriangleStripMode(Enum):
+    FAST = 0
+    CACHE_AWARE = 1
+
+@dataclass
+class TriangleStripOptions:
+    """ Class controlling how triangle strips are generated. """
+
+    mode: TriangleStripMode = TriangleStripMode.FAST
+    vertex_cache_size: int = 16
+    vertex_cache_type: VertexCacheType = VertexCacheType.FIFO
+
+    # Number of worker processes to generate strips with. 0 uses one per CPU
+    # and 1 generates strips serially on the calling thread.
+    worker_count: int = 1
+
+    # Join each segment's strips into a single strip with degenerate triangles when
+    # that takes fewer indices than the separate strips and their restarts.
+    stitch: bool = False
+    stitch_restart_cost: int = 0
+
+    def get_signature(self) -> str:
+        """ Returns a string identifying the options that affect the generated strips. """
+
+        signature = f"{self.mode.name}:{self.vertex_cache_size}:{self.vertex_cache_type.name}"
+
+        if self.stitch:
+            signature += f":stitch{self.stitch_restart_cost}"
+
+        return signature
+
+def create_segment_triangle_strips(segment_triangles: List[List[int]], options: TriangleStripOptions) -> List[List[int]]:
+    """ Create the triangle strips for a list of triangles using the supplied options. """
+
+    if options.mode == TriangleStripMode.FAST:
+        strips = create_triangle_strips(segment_triangles)
+    else:
+        strips = create_cache_aware_triangle_strips(segment_triangles, options.vertex_cache_size,
+                                                    options.vertex_cache_type)
+        triangle_list = [list(tri) for tri in segment_triangles]
+
+        # Each strip in a triangle list is a single triangle, it is only worth keeping when
+        # it saves vertex transforms over the strips.
+        strips_misses = count_vertex_cache_misses(chain.from_iterable(strips), options.vertex_cache_size,
+                                                  options.vertex_cache_type)
+        list_misses = count_vertex_cache_misses(chain.from_iterable(triangle_list), options.vertex_cache_size,
+                                                options.vertex_cache_type)
+
+        if list_misses < strips_misses:
+            strips = triangle_list
+
+    if options.stitch:
+        strips = stitch_triangle_strips(strips, options.stitch_restart_cost)
+
+    return strips
+
+def create_triangle_strips(segment_triangles: List[List[int]]) -> List[List[int]]:
+    """ Create the triangle strips for a list of triangles. """
+
+    triangles: List[Tuple[int, int, int]] = [tuple(tri) for tri in segment_triangles]
+    edge_index = create_triangle_edge_index(triangles)
+    used: List[bool] = [False] * len(triangles)
+    strips: List[List[int]] = []
+
+    # The general idea here is we loop over the triangles in order, starting a new strip
+    # from each triangle that has not yet been used by a previous strip.
+    #
+    # Then we loop, looking up the triangle that shares the strip's head edge through
+    # 'edge_index'. If we find one then we continue the loop, else we break out of it
+    # and append the created strip.
+    #
+    # For a new vertex to keep the winding of the triangle it adds it's triangle must
+    # contain the head edge in the same direction when the strip has an even length
+    # and in the opposite direction when the strip has an odd length.
+
+    def find_next_vertex(edge: Tuple[int, int]) -> int:
+        candidates = edge_index.get(edge)
+
+        while candidates:
+            tri_index, last_vertex = candidates.pop()
+
+            if not used[tri_index]:
+                used[tri_index] = True
+                return last_vertex
+
+        return None
+
+    def has_next_vertex(edge: Tuple[int, int]) -> bool:
+        return any(not used[tri_index] for tri_index, _ in edge_index.get(edge, ()))
+
+    def create_strip(tri_index: int) -> List[int]:
+        used[tri_index] = True
+
+        # Start the strip from whichever rotation of the triangle can be continued.
+        t0, t1, t2 = triangles[tri_index]
+        strip: List[int] = [t0, t1, t2]
+
+        for rotation in ((t0, t1, t2), (t1, t2, t0), (t2, t0, t1)):
+            if has_next_vertex((rotation[2], rotation[1])):
+                strip = list(rotation)
+                break
+
+        while True:
+            if len(strip) % 2 == 0:
+                next_vertex = find_next_vertex((strip[-2], strip[-1]))
+            else:
+                next_vertex = find_next_vertex((strip[-1], strip[-2]))
+
+            if next_vertex is None:
+                break
+
+            strip.append(next_vertex)
+
+        return strip
+
+    for tri_index in range(len(triangles)):
+        if not used[tri_index]:
+            strips.append(create_strip(tri_index))
+
+    return strips
+
+def create_cache_aware_triangle_strips(segment_triangles: List[List[int]], cache_size: int,
+                                       cache_type: VertexCacheType) -> List[List[int]]:
+    """ Create the triangle strips for a list of triangles while simulating a vertex cache.
+
+        Strips are started from the triangle with the most vertices already in the cache,
+        or when there are none from the triangle with the fewest unused neighbours (the
+        lowest valence) so that strips grow inwards from the mesh's borders instead of
+        leaving isolated triangles behind. """
+
+    triangles: List[Tuple[int, int, int]] = [tuple(tri) for tri in segment_triangles]
+    edge_index = create_triangle_edge_index(triangles)
+    used: List[bool] = [False] * len(triangles)
+    strips: List[List[int]] = []
+    cache = VertexCache(cache_size, cache_type)
+
+    neighbours: List[List[int]] = [[] for tri in triangles]
+    vertex_triangles: Dict[int, List[int]] = {}
+
+    for tri_index, (t0, t1, t2) in enumerate(triangles):
+        for edge in ((t1, t0), (t2, t1), (t0, t2)):
+            for neighbour, _ in edge_index.get(edge, ()):
+                if neighbour != tri_index and neighbour not in neighbours[tri_index]:
+                    neighbours[tri_index].append(neighbour)
+
+        for vertex in (t0, t1, t2):
+            vertex_triangles.setdefault(vertex, []).append(tri_index)
+
+    valence: List[int] = [len(tri_neighbours) for tri_neighbours in neighbours]
+    valence_buckets: Dict[int, List[int]] = {}
+
+    for tri_index in range(len(triangles) - 1, -1, -1):
+        valence_buckets.setdefault(valence[tri_index], []).append(tri_index)
+
+    def use_triangle(tri_index: int):
+        used[tri_index] = True
+
+        for neighbour in neighbours[tri_index]:
+            if not used[neighbour]:
+                valence[neighbour] -= 1
+                valence_buckets.setdefault(valence[neighbour], []).append(neighbour)
+
+    def emit_vertex(strip: List[int], vertex: int):
+        strip.append(vertex)
+        cache.access(vertex)
+
+    def pop_lowest_valence_triangle() -> int:
+        for bucket_valence in sorted(valence_buckets.keys()):
+            bucket = valence_buckets[bucket_valence]
+
+            while bucket:
+                tri_index = bucket.pop()
+
+                if not used[tri_index] and valence[tri_index] == bucket_valence:
+                    return tri_index
+
+        return None
+
+    def find_cached_start_triangle() -> int:
+        best_index = None
+        best_score = None
+
+        for vertex in cache:
+            unused_triangles = [tri_index for tri_index in vertex_triangles[vertex] if not used[tri_index]]
+            vertex_triangles[vertex] = unused_triangles
+
+            for tri_index in unused_triangles:
+                score = (-sum(1 for v in triangles[tri_index] if v in cache), valence[tri_index], tri_index)
+
+                if best_score is None or score < best_score:
+                    best_index = tri_index
+                    best_score = score
+
+        return best_index
+
+    def find_next_triangle(edge: Tuple[int, int]) -> Tuple[int, int]:
+        best = None
+
+        for tri_index, last_vertex in edge_index.get(edge, ()):
+            if not used[tri_index] and (best is None or valence[tri_index] < valence[best[0]]):
+                best = (tri_index, last_vertex)
+
+        return best
+
+    def create_strip(tri_index: int) -> List[int]:
+        use_triangle(tri_index)
+
+        t0, t1, t2 = triangles[tri_index]
+        start = (t0, t1, t2)
+        start_valence = None
+
+        # Start the strip from the rotation that continues into the lowest valence neighbour.
+        for rotation in ((t0, t1, t2), (t1, t2, t0), (t2, t0, t1)):
+            next_triangle = find_next_triangle((rotation[2], rotation[1]))
+
+            if next_triangle is not None and (start_valence is None or valence[next_triangle[0]] < start_valence):
+                start = rotation
+                start_valence = valence[next_triangle[0]]
+
+        strip: List[int] = []
+
+        for vertex in start:
+            emit_vertex(strip, vertex)
+
+        while True:
+            if len(strip) % 2 == 0:
+                next_triangle = find_next_triangle((strip[-2], strip[-1]))
+            else:
+                next_triangle = find_next_triangle((strip[-1], strip[-2]))
+
+            if next_triangle is None:
+                break
+
+            use_triangle(next_triangle[0])
+            emit_vertex(strip, next_triangle[1])
+
+        return strip
+
+    while True:
+        tri_index = find_cached_start_triangle()
+
+        if tri_index is None:
+            tri_index = pop_lowest_valence_triangle()
+
+        if tri_index is None:
+            break
+
+        strips.append(create_strip(tri_index))
+
+    return strips
+
+def stitch_triangle_strips(strips: List[List[int]], restart_cost: int) -> List[List[int]]:
+    """ Joins a list of triangle strips into a single strip using degenerate triangles.
+
+        A restart in a STRP chunk only flags the first two indices of a strip and adds no
+        indices, so with a 'restart_cost' of 0 the stitched strip is only returned when it
+        has fewer indices than the separate strips. A higher 'restart_cost' accepts that many
+        extra indices for each strip joined, trading a larger index count for fewer strips.
+        Otherwise the strips are returned unchanged. """
+
+    if len(strips) < 2:
+        return strips
+
+    # A strip with an even triangle count (even length) keeps it's winding when reversed
+    # so it can be joined from either end. Strips are indexed by the vertex they can be
+    # joined from so a strip starting on the stitched strip's last vertex can be found,
+    # those can be joined with fewer (or no) degenerate indices.
+    used: List[bool] = [False] * len(strips)
+    joinable: Dict[int, List[Tuple[int, bool]]] = {}
+
+    for strip_index in range(len(strips) - 1, -1, -1):
+        strip = strips[strip_index]
+
+        if len(strip) % 2 == 0:
+            joinable.setdefault(strip[-1], []).append((strip_index, True))
+
+        joinable.setdefault(strip[0], []).append((strip_index, False))
+
+    def find_joinable_strip(vertex: int) -> Tuple[int, bool]:
+        candidates = joinable.get(vertex)
+
+        while candidates:
+            strip_index, reverse = candidates.pop()
+
+            if not used[strip_index]:
+                return strip_index, reverse
+
+        return None
+
+    stitched: List[int] = list(strips[0])
+    used[0] = True
+    next_unused = 1
+
+    for _ in range(len(strips) - 1):
+        found = find_joinable_strip(stitched[-1])
+
+        if found is not None:
+            strip_index, reverse = found
+        else:
+            while used[next_unused]:
+                next_unused += 1
+
+            strip_index, reverse = next_unused, False
+
+        used[strip_index] = True
+        strip = strips[strip_index][::-1] if reverse else strips[strip_index]
+
+        # The joined strip's first triangle must start at an even index to keep it's winding.
+        if strip[0] != stitched[-1]:
+            stitched.extend((stitched[-1], strip[0]))
+
+        if len(stitched) % 2 == 1:
+            stitched.append(strip[0])
+
+        stitched.extend(strip)
+
+    if len(stitched) < sum(len(strip) for strip in strips) + restart_cost * (len(strips) - 1):
+        return [stitched]
+
+    return strips
+
+def create_triangle_edge_index(triangles: List[Tuple[int, int, int]]) -> Dict[Tuple[int, int], List[Tuple[int, int]]]:
+    """ Creates a dictionary mapping each directed edge (in winding order) of the triangles to
+        a list of (triangle_index, last_vertex) pairs for the triangles that contain it. """
+
+    edge_index: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+
+    # Entries are popped from the end of the lists so insert in reverse to have
+    # earlier triangles be picked first.
+    for tri_index in range(len(triangles) - 1, -1, -1):
+        t0, t1, t2 = triangles[tri_index]
+
+        edge_index.setdefault((t0, t1), []).append((tri_index, t2))
+        edge_index.setdefault((t1, t2), []).append((tri_index, t0))
+        edge_index.setdefault((t2, t0), []).append((tri_index, t1))
+
+    return edge_index
+
+def pack_triangle_strip_options(options: TriangleStripOptions) -> Tuple:
+    """ Packs the options that affect the generated strips into a tuple of plain values,
+        which unlike the options can be unpickled without importing the addon. """
+
+    return (options.mode.name, options.vertex_cache_size, options.vertex_cache_type.name,
+            options.stitch, options.stitch_restart_cost)
+
+def unpack_triangle_strip_options(packed_options: Tuple) -> TriangleStripOptions:
+    mode, vertex_cache_size, vertex_cache_type, stitch, stitch_restart_cost = packed_options
+
+    return TriangleStripOptions(mode=TriangleStripMode[mode], vertex_cache_size=vertex_cache_size,
+                                vertex_cache_type=VertexCacheType[vertex_cache_type],
+                                stitch=stitch, stitch_restart_cost=stitch_restart_cost)
+
+def create_packed_triangle_strips(triangle_buffer: bytes, packed_options: Tuple) -> Tuple[bytes, bytes]:
+    """ Process pool entry point. Creates the triangle strips for a packed triangle buffer
+        and returns them packed as (strip lengths, strip indices). """
+
+    triangles = np.frombuffer(triangle_buffer, dtype=np.uint16).reshape(-1, 3).tolist()
+
+    strips = create_segment_triangle_strips(triangles, unpack_triangle_strip_options(packed_options))
+
+    return (array("I", (len(strip) for strip in strips)).tobytes(),
+            array("H", chain.from_iterable(strips)).tobytes())
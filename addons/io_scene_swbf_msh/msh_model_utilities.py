@@ -1,6 +1,8 @@
 """ Utilities for operating on msh_model objects. """
 
-from typing import List
+import numpy as np
+from collections import deque
+from typing import List, Dict, Set
 from .msh_model import *
 from .msh_utilities import *
 from mathutils import Vector, Matrix
@@ -8,41 +10,246 @@ from mathutils import Vector, Matrix
 def scale_segments(scale: Vector, segments: List[GeometrySegment]):
     """ Scales are positions in the GeometrySegment list. """
 
+    scale = np.array(scale, dtype=np.float32)
+
+    for segment in segments:
+        segment.positions = segment.positions * scale
+
+def split_segments(segments: List[GeometrySegment], max_vertex_count: int) -> List[GeometrySegment]:
+    """ Splits every segment in a list with more than max_vertex_count vertices. """
+
+    split: List[GeometrySegment] = []
+
     for segment in segments:
-        segment.positions = [mul_vec(pos, scale) for pos in segment.positions]
+        if len(segment.positions) > max_vertex_count:
+            split.extend(split_segment(segment, max_vertex_count))
+        else:
+            split.append(segment)
+
+    return split
+
+def split_segment(segment: GeometrySegment, max_vertex_count: int) -> List[GeometrySegment]:
+    """ Splits a segment into multiple segments sharing it's material that each have
+        at most max_vertex_count vertices. Does NOT split triangle strips.
+
+        Each piece is grown across neighbouring polygons from a seed so that it stays
+        spatially coherent and only vertices on the boundaries between pieces have to
+        be duplicated. """
+
+    polygons = segment.polygons
+
+    # Group the triangles by the polygon they belong to so that polygons are never
+    # split between pieces. Triangles without a polygon are grouped on their own.
+    polygon_vertex_sets = [set(polygon) for polygon in polygons]
+    vertex_polygons: Dict[int, List[int]] = {}
+
+    for polygon_index, polygon in enumerate(polygons):
+        for vertex in polygon:
+            vertex_polygons.setdefault(vertex, []).append(polygon_index)
+
+    unit_polygons: List[int] = list(range(len(polygons)))
+    unit_triangles: List[List[List[int]]] = [[] for polygon in polygons]
+
+    for tri in segment.triangles.tolist():
+        for polygon_index in vertex_polygons.get(tri[0], ()):
+            if tri[1] in polygon_vertex_sets[polygon_index] and tri[2] in polygon_vertex_sets[polygon_index]:
+                unit_triangles[polygon_index].append(tri)
+                break
+        else:
+            unit_polygons.append(None)
+            unit_triangles.append([tri])
+
+    unit_vertices: List[Set[int]] = []
+    vertex_units: Dict[int, List[int]] = {}
+
+    for unit_index, (polygon_index, triangles) in enumerate(zip(unit_polygons, unit_triangles)):
+        vertices = set(polygon_vertex_sets[polygon_index]) if polygon_index is not None else set()
+        vertices.update(*triangles)
+
+        if len(vertices) > max_vertex_count:
+            raise RuntimeError(f"A polygon using material '{segment.material_name}' has more than "
+                               f"{max_vertex_count} vertices and can not be split into smaller segments!")
+
+        unit_vertices.append(vertices)
+
+        for vertex in vertices:
+            vertex_units.setdefault(vertex, []).append(unit_index)
+
+    assigned: List[bool] = [False] * len(unit_vertices)
+    next_unassigned = 0
+    rejected: List[int] = []
+    pieces: List[List[int]] = []
+
+    while True:
+        # Seed each piece next to the previous one where possible to keep pieces coherent.
+        seed = next((unit for unit in rejected if not assigned[unit]), None)
+
+        if seed is None:
+            while next_unassigned < len(assigned) and assigned[next_unassigned]:
+                next_unassigned += 1
+
+            if next_unassigned == len(assigned):
+                break
+
+            seed = next_unassigned
+
+        piece: List[int] = []
+        piece_vertices: Set[int] = set()
+        queued: Set[int] = {seed}
+        queue = deque((seed,))
+        rejected = []
+
+        while True:
+            if not queue:
+                # The piece's connected polygons have all been added, when there is space
+                # left fill it with the next unassigned polygon instead of starting a new piece.
+                if rejected:
+                    break
+
+                while next_unassigned < len(assigned) and assigned[next_unassigned]:
+                    next_unassigned += 1
+
+                if next_unassigned == len(assigned):
+                    break
+
+                queued.add(next_unassigned)
+                queue.append(next_unassigned)
+
+            unit = queue.popleft()
+
+            if len(piece_vertices) + len(unit_vertices[unit] - piece_vertices) > max_vertex_count:
+                rejected.append(unit)
+                continue
+
+            assigned[unit] = True
+            piece.append(unit)
+            piece_vertices |= unit_vertices[unit]
+
+            for vertex in unit_vertices[unit]:
+                for neighbour in vertex_units[vertex]:
+                    if not assigned[neighbour] and neighbour not in queued:
+                        queued.add(neighbour)
+                        queue.append(neighbour)
+
+        pieces.append(piece)
+
+    return [_create_segment_piece(segment, [polygons[unit_polygons[unit]] for unit in piece
+                                            if unit_polygons[unit] is not None],
+                                  [tri for unit in piece for tri in unit_triangles[unit]])
+            for piece in pieces]
+
+def _create_segment_piece(segment: GeometrySegment, polygons: List[List[int]],
+                          triangles: List[List[int]]) -> GeometrySegment:
+    piece = GeometrySegment()
+    piece.material_name = segment.material_name
+
+    remap: Dict[int, int] = {}
 
-def get_model_world_matrix(model: Model, models: List[Model]) -> Matrix:
-    """ Gets a Blender Matrix for transforming the model into world space. """
+    def remap_vertex(vertex: int) -> int:
+        index = remap.get(vertex)
 
-    transform_stack: List[ModelTransform] = [model.transform]
-    transform_stack.extend((parent.transform for parent in get_model_ancestors(model, models)))
+        if index is None:
+            index = len(remap)
+            remap[vertex] = index
 
-    world_matrix: Matrix = Matrix()
+        return index
 
-    for transform in reversed(transform_stack):
-        translation_matrix = Matrix.Translation(transform.translation)
-        rotation_matrix = transform.rotation.to_matrix().to_4x4()
+    piece_triangles = [[remap_vertex(v) for v in tri] for tri in triangles]
+    piece_polygons = [[remap_vertex(v) for v in polygon] for polygon in polygons]
 
-        world_matrix = world_matrix @ (translation_matrix @ rotation_matrix)
+    vertices = np.fromiter(remap.keys(), dtype=np.int64, count=len(remap))
 
-    return world_matrix
+    piece.positions = segment.positions[vertices]
+    piece.normals = segment.normals[vertices]
+    piece.texcoords = segment.texcoords[vertices]
+
+    if segment.colors is not None:
+        piece.colors = segment.colors[vertices]
+
+    piece.triangles = np.array(piece_triangles, dtype=get_index_dtype(len(vertices))).reshape(-1, 3)
+    piece.polygons = piece_polygons
+
+    return piece
+
+class ModelHierarchy:
+    """ Class indexing the hierarchy of a list of models by name and by parent so it can
+        be queried without scanning the list. """
+
+    def __init__(self, models: List[Model]):
+        self.models = models
+        self.models_by_name: Dict[str, Model] = {}
+        self.children_by_parent: Dict[str, List[Model]] = {}
+
+        for model in models:
+            self.models_by_name.setdefault(model.name, model)
+            self.children_by_parent.setdefault(model.parent, []).append(model)
+
+    def get_roots(self) -> List[Model]:
+        """ Gets all the models with no parent. """
+
+        return self.children_by_parent.get("", [])
+
+    def get_children(self, parent: Model) -> List[Model]:
+        """ Gets all the models whose parent is the supplied model. """
+
+        return self.children_by_parent.get(parent.name, [])
+
+    def get_parent(self, child: Model) -> Model:
+        """ Gets the parent of a model or None if it has no parent in the list. """
+
+        if not child.parent:
+            return None
+
+        return self.models_by_name.get(child.parent)
+
+    def is_name_unused(self, name: str) -> bool:
+        return name not in self.models_by_name
+
+def get_model_world_matrices(models: List[Model]) -> Dict[str, Matrix]:
+    """ Gets a Blender Matrix for transforming each model in a list into world space,
+        keyed by model name. Each model's matrix is built on it's parent's so every
+        transform is only converted to a matrix once. """
+
+    hierarchy = ModelHierarchy(models)
+    world_matrices: Dict[str, Matrix] = {}
+
+    for model in models:
+        # Walk up to the nearest ancestor with a known matrix then build back down from it.
+        chain: List[Model] = []
+        parent_matrix = Matrix()
+        current = model
+
+        while current is not None:
+            if current.name in world_matrices:
+                parent_matrix = world_matrices[current.name]
+                break
+
+            chain.append(current)
+            current = hierarchy.get_parent(current)
+
+        for current in reversed(chain):
+            translation_matrix = Matrix.Translation(current.transform.translation)
+            rotation_matrix = current.transform.rotation.to_matrix().to_4x4()
+
+            parent_matrix = parent_matrix @ (translation_matrix @ rotation_matrix)
+            world_matrices[current.name] = parent_matrix
+
+    return world_matrices
 
 def sort_by_parent(models: List[Model]) -> List[Model]:
     """ Sorts a Model list so that models are ordered by their parent.
         Required for some tools to be able to load .msh files. """
 
+    hierarchy = ModelHierarchy(models)
     sorted_models: List[Model] = []
 
-    for root in get_root_models(models):
-        def add_children(model: Model):
-            nonlocal sorted_models
+    # Depth first, with each model followed by all of it's descendants before it's next sibling.
+    stack: List[Model] = list(reversed(hierarchy.get_roots()))
 
-            for child in get_model_children(model, models):
-                sorted_models.append(child)
-                add_children(child)
-
-        sorted_models.append(root)
-        add_children(root)
+    while stack:
+        model = stack.pop()
+        sorted_models.append(model)
+        stack.extend(reversed(hierarchy.get_children(model)))
 
     return sorted_models
 
@@ -72,45 +279,20 @@ def get_root_models(models: List[Model]) -> Model:
         if model.parent == "":
             yield model
 
-def get_model_children(parent: Model, models: List[Model]) -> Model:
-    """ Generator. Returns all Model objects in a list whose parent is
-        the supplied model. """
-
-    for model in models:
-        if parent.name == model.parent:
-            yield model
-
-def get_model_ancestors(child: Model, models: List[Model]) -> Model:
-    """ Generator. Yields the parent for a model, then yields the parent's parent,
-        repeating until at the root model. """
-
-    for model in models:
-        if child.parent == model.name:
-            child = model
-            yield model
-
 def get_unique_scene_root_name(models: List[Model]) -> Model:
     """ Returns a unique model name of the form of either "SceneRoot" or
         "SceneRoot{i}". """
 
+    hierarchy = ModelHierarchy(models)
     name: str = "SceneRoot"
 
-    if is_model_name_unused(name, models):
+    if hierarchy.is_name_unused(name):
         return name
 
     for i in range(len(models) + 1):
         name = f"SceneRoot{i}"
 
-        if is_model_name_unused(name, models):
+        if hierarchy.is_name_unused(name):
             return name
 
     return name
-
-def is_model_name_unused(name: str, models: List[Model]) -> bool:
-    """ Checks if there is no Model using a name in a list of models.  """
-
-    for model in models:
-        if model.name == name:
-            return False
-
-    return True
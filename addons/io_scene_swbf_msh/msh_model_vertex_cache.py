@@ -0,0 +1,168 @@
+""" Contains a simulation of a GPU's post-transform vertex cache for measuring
+    and optimizing the vertex reuse of index buffers. """
+
+from collections import deque, OrderedDict
+from enum import Enum
+from typing import Iterable, List
+
+class VertexCacheType(Enum):
+    FIFO = 0
+    LRU = 1
+
+class VertexCache:
+    """ Class simulating a fixed size post-transform vertex cache. """
+
+    def __init__(self, size: int, cache_type: VertexCacheType):
+        self.size = size
+        self.cache_type = cache_type
+        self._fifo = deque()
+        self._entries = OrderedDict()
+
+    def __contains__(self, index: int) -> bool:
+        return index in self._entries
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def access(self, index: int) -> bool:
+        """ Fetch a vertex through the cache. Returns True on a cache hit. """
+
+        if index in self._entries:
+            if self.cache_type == VertexCacheType.LRU:
+                self._entries.move_to_end(index)
+
+            return True
+
+        self._entries[index] = None
+
+        if self.cache_type == VertexCacheType.FIFO:
+            self._fifo.append(index)
+
+            if len(self._fifo) > self.size:
+                del self._entries[self._fifo.popleft()]
+        elif len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+        return False
+
+def count_vertex_cache_misses(indices: Iterable[int], cache_size: int, cache_type: VertexCacheType) -> int:
+    """ Counts the number of vertices that will have to be transformed to process
+        a sequence of indices. """
+
+    cache = VertexCache(cache_size, cache_type)
+
+    return sum(1 for index in indices if not cache.access(index))
+
+def calculate_acmr(cache_misses: int, triangle_count: int) -> float:
+    """ Calculates the average cache miss ratio (transformed vertices per triangle). """
+
+    if triangle_count == 0:
+        return 0.0
+
+    return cache_misses / triangle_count
+
+# Scoring constants from Tom Forsyth's "Linear-Speed Vertex Cache Optimisation".
+_FORSYTH_CACHE_DECAY_POWER = 1.5
+_FORSYTH_LAST_TRIANGLE_SCORE = 0.75
+_FORSYTH_VALENCE_BOOST_SCALE = 2.0
+_FORSYTH_VALENCE_BOOST_POWER = 0.5
+
+def optimize_triangle_order(triangles: List[List[int]], vertex_count: int, cache_size: int,
+                            cache_type: VertexCacheType = VertexCacheType.LRU) -> List[List[int]]:
+    """ Reorders a list of triangles for vertex cache efficiency using Tom Forsyth's
+        linear-speed vertex cache optimisation algorithm. The modelled cache follows
+        cache_type, in a FIFO cache hits leave a vertex where it is so it's score keeps
+        decaying until it is evicted. """
+
+    if not triangles:
+        return []
+
+    cache_size = max(cache_size, 4)
+
+    vertex_triangles: List[List[int]] = [[] for i in range(vertex_count)]
+
+    for tri_index, tri in enumerate(triangles):
+        for vertex in tri:
+            vertex_triangles[vertex].append(tri_index)
+
+    cache_position: List[int] = [-1] * vertex_count
+    cache_scores: List[float] = [(1.0 - (position - 3) / (cache_size - 3)) ** _FORSYTH_CACHE_DECAY_POWER
+                                 if position >= 3 else _FORSYTH_LAST_TRIANGLE_SCORE
+                                 for position in range(cache_size)]
+
+    def get_vertex_score(vertex: int) -> float:
+        remaining = len(vertex_triangles[vertex])
+
+        if remaining == 0:
+            return -1.0
+
+        score = _FORSYTH_VALENCE_BOOST_SCALE * remaining ** -_FORSYTH_VALENCE_BOOST_POWER
+
+        if cache_position[vertex] >= 0:
+            score += cache_scores[cache_position[vertex]]
+
+        return score
+
+    vertex_scores: List[float] = [get_vertex_score(vertex) for vertex in range(vertex_count)]
+    added: List[bool] = [False] * len(triangles)
+    cache: List[int] = []
+    optimized: List[List[int]] = []
+    next_unadded = 0
+
+    best = max(range(len(triangles)), key=lambda tri_index: sum(vertex_scores[v] for v in triangles[tri_index]))
+
+    while True:
+        tri = triangles[best]
+        added[best] = True
+        optimized.append(tri)
+
+        for vertex in tri:
+            vertex_triangles[vertex].remove(best)
+
+        # An LRU cache moves all of the triangle's vertices to the front of the modelled
+        # cache, a FIFO cache only pushes the ones that missed, in the order they're fetched.
+        if cache_type == VertexCacheType.LRU:
+            new_cache = list(tri)
+            new_cache.extend(vertex for vertex in cache if vertex not in tri)
+        else:
+            new_cache = []
+
+            for vertex in tri:
+                if vertex not in cache and vertex not in new_cache:
+                    new_cache.insert(0, vertex)
+
+            new_cache.extend(cache)
+
+        for vertex in new_cache[cache_size:]:
+            cache_position[vertex] = -1
+            vertex_scores[vertex] = get_vertex_score(vertex)
+
+        cache = new_cache[:cache_size]
+
+        for position, vertex in enumerate(cache):
+            cache_position[vertex] = position
+            vertex_scores[vertex] = get_vertex_score(vertex)
+
+        # The next triangle is the best scoring one using a vertex in the cache, when
+        # there are none take the first triangle that has not been added yet.
+        best = None
+        best_score = -1.0
+
+        for vertex in cache:
+            for tri_index in vertex_triangles[vertex]:
+                score = sum(vertex_scores[v] for v in triangles[tri_index])
+
+                if score > best_score:
+                    best = tri_index
+                    best_score = score
+
+        if best is None:
+            while next_unadded < len(added) and added[next_unadded]:
+                next_unadded += 1
+
+            if next_unadded == len(added):
+                break
+
+            best = next_unadded
+
+    return optimized
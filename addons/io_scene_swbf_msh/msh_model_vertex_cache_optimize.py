@@ -0,0 +1,96 @@
+""" Contains the optimization of GeometrySegments for the post-transform vertex cache
+    and vertex fetching. """
+
+import numpy as np
+from dataclasses import dataclass
+from typing import List
+from .msh_model import *
+from .msh_model_vertex_cache import VertexCacheType, optimize_triangle_order, count_vertex_cache_misses, calculate_acmr
+
+@dataclass
+class VertexCacheOptimizationStats:
+    """ Class describing the vertex cache efficiency of a GeometrySegment's triangles
+        before and after optimization. """
+
+    model_name: str = ""
+    material_name: str = ""
+    triangle_count: int = 0
+    vertex_cache_misses_before: int = 0
+    vertex_cache_misses_after: int = 0
+
+    @property
+    def acmr_before(self) -> float:
+        return calculate_acmr(self.vertex_cache_misses_before, self.triangle_count)
+
+    @property
+    def acmr_after(self) -> float:
+        return calculate_acmr(self.vertex_cache_misses_after, self.triangle_count)
+
+    def __str__(self) -> str:
+        return (f"{self.model_name} ({self.material_name}): {self.triangle_count} triangles, "
+                f"ACMR {self.acmr_before:.3f} -> {self.acmr_after:.3f}")
+
+def optimize_models_vertex_cache(models: List[Model], cache_size: int,
+                                 cache_type: VertexCacheType) -> List[VertexCacheOptimizationStats]:
+    """ Optimizes every GeometrySegment in a list of models for the vertex cache and
+        returns the ACMR of each segment's triangles before and after. """
+
+    stats: List[VertexCacheOptimizationStats] = []
+
+    for model in models:
+        if model.geometry is None:
+            continue
+
+        for segment in model.geometry:
+            misses_before = count_vertex_cache_misses(segment.triangles.ravel().tolist(), cache_size, cache_type)
+
+            optimize_segment_vertex_cache(segment, cache_size, cache_type)
+
+            stats.append(VertexCacheOptimizationStats(
+                model_name=model.name,
+                material_name=segment.material_name,
+                triangle_count=len(segment.triangles),
+                vertex_cache_misses_before=misses_before,
+                vertex_cache_misses_after=count_vertex_cache_misses(segment.triangles.ravel().tolist(),
+                                                                    cache_size, cache_type)))
+
+    return stats
+
+def optimize_segment_vertex_cache(segment: GeometrySegment, cache_size: int,
+                                  cache_type: VertexCacheType = VertexCacheType.LRU):
+    """ Reorders a segment's triangles for the vertex cache and then it's vertices into
+        the order they're first used by the triangles. """
+
+    triangles = optimize_triangle_order(segment.triangles.tolist(), segment.vertex_count, cache_size, cache_type)
+
+    segment.triangles = np.array(triangles, dtype=segment.triangles.dtype).reshape(-1, 3)
+
+    reorder_segment_vertices(segment)
+
+def reorder_segment_vertices(segment: GeometrySegment):
+    """ Reorders a segment's vertices into the order they're first referenced by it's
+        triangles so vertex fetches walk the vertex buffer mostly sequentially. Vertices
+        not used by any triangle are kept, after the used ones. """
+
+    vertex_count = segment.vertex_count
+
+    # Order the vertices by their first use, followed by any unused vertices.
+    used, first_uses = np.unique(segment.triangles.ravel(), return_index=True)
+    unused = np.setdiff1d(np.arange(vertex_count), used, assume_unique=True)
+    order = np.concatenate((used[np.argsort(first_uses, kind="stable")], unused)).astype(np.int64)
+
+    remap = np.empty(vertex_count, dtype=np.int64)
+    remap[order] = np.arange(vertex_count)
+
+    segment.positions = segment.positions[order]
+    segment.normals = segment.normals[order]
+    segment.texcoords = segment.texcoords[order]
+
+    if segment.colors is not None:
+        segment.colors = segment.colors[order]
+
+    segment.polygon_indices = remap[segment.polygon_indices].astype(segment.polygon_indices.dtype)
+    segment.triangles = remap[segment.triangles].astype(segment.triangles.dtype)
+
+    if segment.triangle_strips is not None:
+        segment.triangle_strips = [remap[strip].tolist() for strip in segment.triangle_strips]
@@ -0,0 +1,248 @@
+""" Contains a memory-mapped reader for inspecting .msh files and a command line tool
+    for dumping their chunk tree. Only depends on the standard library so it can run
+    outside of Blender:
+
+        python msh_reader.py file.msh """
+
+import argparse
+import mmap
+import struct
+import sys
+from typing import Dict, Iterator, List
+
+# Chunks containing child chunks and the size of the data preceding their children.
+CONTAINER_CHUNKS: Dict[str, int] = {
+    "HEDR": 0,
+    "MSH2": 0,
+    "SINF": 0,
+    "MATL": 4, # Material count.
+    "MATD": 0,
+    "MODL": 0,
+    "GEOM": 0,
+    "SEGM": 0
+}
+
+class Chunk:
+    """ Class representing a chunk in a .msh file. A chunk's children are only indexed
+        when they're first accessed and chunk data is returned as memoryviews of the
+        file, so only the parts of a file that are used are ever read. """
+
+    def __init__(self, view: memoryview, chunk_id: str, offset: int, size: int):
+        self.view = view
+        self.id = chunk_id
+        self.offset = offset
+        self.size = size
+        self._children: List["Chunk"] = None
+
+    def __repr__(self) -> str:
+        return f"Chunk('{self.id}', offset={self.offset}, size={self.size})"
+
+    @property
+    def data(self) -> memoryview:
+        """ The chunk's data, excluding it's header. """
+
+        return self.view[self.offset + 8:self.offset + 8 + self.size]
+
+    @property
+    def children(self) -> List["Chunk"]:
+        if self._children is None:
+            self._children = []
+
+            if self.id in CONTAINER_CHUNKS:
+                self._children = list(_iterate_chunks(self.view, self.offset + 8 + CONTAINER_CHUNKS[self.id],
+                                                      self.offset + 8 + self.size))
+
+        return self._children
+
+    def find(self, chunk_id: str) -> "Chunk":
+        """ Returns the first child with an ID or None. """
+
+        return next((child for child in self.children if child.id == chunk_id), None)
+
+    def find_all(self, chunk_id: str) -> List["Chunk"]:
+        return [child for child in self.children if child.id == chunk_id]
+
+    def read_u32(self, offset: int = 0) -> int:
+        if offset + 4 > self.size:
+            raise ValueError(f"{self.id} chunk at offset {self.offset} is too small to read a u32 at {offset}!")
+
+        return struct.unpack_from("<I", self.view, self.offset + 8 + offset)[0]
+
+    def read_string(self) -> str:
+        data = bytes(self.data)
+
+        return data.split(b"\0", 1)[0].decode("utf-8", errors="replace")
+
+    def read_array(self, format: str, item_size: int, components: int) -> memoryview:
+        """ Returns a view of a chunk starting with an element count followed by the
+            elements, each of components values of a struct format, without copying. """
+
+        count = self.read_u32()
+        start = self.offset + 8 + 4
+        end = start + count * components * item_size
+
+        if end > self.offset + 8 + self.size:
+            raise ValueError(f"{self.id} chunk at offset {self.offset} is truncated!")
+
+        view = self.view[start:end]
+
+        if components > 1 and count > 0:
+            return view.cast(format, (count, components))
+
+        return view.cast(format)
+
+class MshFile:
+    """ Class for a memory-mapped .msh file. Use as a context manager or call close(),
+        views returned from a file must be released before it can be closed. """
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise RuntimeError("The .msh reader only supports little endian machines!")
+
+        self._file = open(path, "rb")
+
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"'{path}' is empty and not a .msh file!")
+
+        self.view = memoryview(self._map)
+        self.root = next(_iterate_chunks(self.view, 0, len(self.view)), None)
+
+        if self.root is None or self.root.id != "HEDR":
+            self.close()
+            raise ValueError(f"'{path}' is not a .msh file!")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.root = None
+        self.view.release()
+
+        try:
+            self._map.close()
+        except BufferError:
+            # Views of the file are still in use, the map is closed once they're released.
+            pass
+
+        self._file.close()
+
+    @property
+    def models(self) -> List[Chunk]:
+        return self.root.find("MSH2").find_all("MODL")
+
+def get_positions(segm: Chunk) -> memoryview:
+    """ Gets a (vertex count, 3) float view of a SEGM's positions. """
+
+    return segm.find("POSL").read_array("f", 4, 3)
+
+def get_normals(segm: Chunk) -> memoryview:
+    return segm.find("NRML").read_array("f", 4, 3)
+
+def get_texcoords(segm: Chunk) -> memoryview:
+    return segm.find("UV0L").read_array("f", 4, 2)
+
+def get_colors(segm: Chunk) -> memoryview:
+    """ Gets a view of a SEGM's packed colors or None if it has no colors. """
+
+    clrl = segm.find("CLRL")
+
+    return clrl.read_array("I", 4, 1) if clrl is not None else None
+
+def get_triangles(segm: Chunk) -> memoryview:
+    """ Gets a (triangle count, 3) unsigned short view of a SEGM's triangles. """
+
+    return segm.find("NDXT").read_array("H", 2, 3)
+
+def get_triangle_strip_indices(segm: Chunk) -> memoryview:
+    """ Gets a view of a SEGM's triangle strip indices, the first two indices of each
+        strip have the 0x8000 bit set. """
+
+    return segm.find("STRP").read_array("H", 2, 1)
+
+def iterate_polygons(segm: Chunk) -> Iterator[memoryview]:
+    """ Generator. Yields a view of the indices of each polygon in a SEGM. """
+
+    ndxl = segm.find("NDXL")
+    data = ndxl.data
+    offset = 4
+
+    for i in range(ndxl.read_u32()):
+        size = struct.unpack_from("<H", data, offset)[0]
+
+        yield data[offset + 2:offset + 2 + size * 2].cast("H")
+
+        offset += 2 + size * 2
+
+def get_segment_counts(segm: Chunk) -> Dict[str, int]:
+    """ Gets the vertex, polygon, triangle and strip index counts of a SEGM. """
+
+    counts: Dict[str, int] = {}
+
+    for name, chunk_id in (("material", "MATI"), ("vertices", "POSL"), ("polygons", "NDXL"),
+                           ("triangles", "NDXT"), ("strip indices", "STRP")):
+        chunk = segm.find(chunk_id)
+
+        if chunk is not None:
+            counts[name] = chunk.read_u32()
+
+    return counts
+
+def _iterate_chunks(view: memoryview, start: int, end: int) -> Iterator[Chunk]:
+    offset = start
+
+    while offset + 8 <= end:
+        chunk_id = bytes(view[offset:offset + 4]).decode("ascii", errors="replace")
+        size = struct.unpack_from("<I", view, offset + 4)[0]
+
+        if offset + 8 + size > end:
+            raise ValueError(f"{chunk_id} chunk at offset {offset} overruns it's parent!")
+
+        yield Chunk(view, chunk_id, offset, size)
+
+        offset += 8 + size
+
+def dump_chunk(chunk: Chunk, depth: int = 0, out=None):
+    """ Prints a chunk and it's descendants with the names of models and the counts of
+        segments. """
+
+    line = f"{'  ' * depth}{chunk.id} offset={chunk.offset} size={chunk.size}"
+
+    if chunk.id in {"MODL", "MATD"}:
+        name = chunk.find("NAME")
+
+        if name is not None:
+            line += f" name='{name.read_string()}'"
+    elif chunk.id == "SEGM":
+        line += " " + " ".join(f"{name}={count}" for name, count in get_segment_counts(chunk).items())
+
+    print(line, file=out if out is not None else sys.stdout)
+
+    for child in chunk.children:
+        dump_chunk(child, depth + 1, out)
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Dump the chunk tree of .msh files.")
+    parser.add_argument("files", nargs="+", help=".msh files to dump")
+    args = parser.parse_args(argv)
+
+    result = 0
+
+    for path in args.files:
+        try:
+            with MshFile(path) as msh:
+                print(path)
+                dump_chunk(msh.root, 1)
+        except (OSError, ValueError) as error:
+            print(f"{path}: {error}", file=sys.stderr)
+            result = 1
+
+    return result
+
+if __name__ == "__main__":
+    sys.exit(main())
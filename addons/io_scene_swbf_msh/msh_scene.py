@@ -4,12 +4,17 @@
 from dataclasses import dataclass, field
 from typing import List, Dict
 from copy import copy
+from itertools import product
 import bpy
+import numpy as np
 from mathutils import Vector
 from .msh_model import Model
-from .msh_model_gather import gather_models
-from .msh_model_utilities import sort_by_parent, has_multiple_root_models, reparent_model_roots, get_model_world_matrix
-from .msh_model_triangle_strips import create_models_triangle_strips
+from .msh_model_gather import gather_models, select_object_groups, WeldTolerances, WeldStats
+from .msh_model_gather_cache import GeometryCache
+from .msh_model_utilities import sort_by_parent, has_multiple_root_models, reparent_model_roots, get_model_world_matrices
+from .msh_model_triangle_strips import create_models_triangle_strips, TriangleStripOptions
+from .msh_model_triangle_strips_cache import TriangleStripsCache
+from .msh_model_vertex_cache_optimize import optimize_models_vertex_cache, VertexCacheOptimizationStats
 from .msh_material import *
 from .msh_material_gather import gather_materials
 from .msh_material_utilities import remove_unused_materials
@@ -44,8 +49,20 @@ class Scene:
     materials: Dict[str, Material] = field(default_factory=dict)
     models: List[Model] = field(default_factory=list)
 
-def create_scene(generate_triangle_strips: bool, apply_modifiers: bool, export_target: str) -> Scene:
-    """ Create a msh Scene from the active Blender scene. """
+def create_scene(generate_triangle_strips: bool, apply_modifiers: bool, export_target: str,
+                 triangle_strip_options: TriangleStripOptions = None,
+                 triangle_strips_cache: TriangleStripsCache = None,
+                 geometry_cache: GeometryCache = None,
+                 split_large_segments: bool = False,
+                 optimize_vertex_cache: bool = False,
+                 vertex_cache_stats: List[VertexCacheOptimizationStats] = None,
+                 weld_tolerances: WeldTolerances = None,
+                 weld_stats: List[WeldStats] = None,
+                 objects: List[bpy.types.Object] = None) -> Scene:
+    """ Create a msh Scene from the active Blender scene. When optimizing for the vertex
+        cache the stats of each segment are appended to vertex_cache_stats if passed and
+        when welding with tolerances the stats of each object to weld_stats. When objects
+        is passed only they are exported instead of the objects export_target selects. """
 
     scene = Scene()
 
@@ -53,16 +70,11 @@ def create_scene(generate_triangle_strips: bool, apply_modifiers: bool, export_t
 
     scene.materials = gather_materials()
 
-    scene.models = gather_models(apply_modifiers=apply_modifiers, export_target=export_target)
-    scene.models = sort_by_parent(scene.models)
-
-    if generate_triangle_strips:
-        scene.models = create_models_triangle_strips(scene.models)
-    else:
-        for model in scene.models:
-            if model.geometry:
-                for segment in model.geometry:
-                    segment.triangle_strips = segment.triangles
+    scene.models = gather_models(apply_modifiers=apply_modifiers, export_target=export_target,
+                                 geometry_cache=geometry_cache, split_large_segments=split_large_segments,
+                                 weld_tolerances=weld_tolerances, weld_stats=weld_stats, objects=objects)
+    scene.models = _process_models(scene.models, generate_triangle_strips, triangle_strip_options,
+                                   triangle_strips_cache, optimize_vertex_cache, vertex_cache_stats)
 
     if has_multiple_root_models(scene.models):
         scene.models = reparent_model_roots(scene.models)
@@ -71,26 +83,130 @@ def create_scene(generate_triangle_strips: bool, apply_modifiers: bool, export_t
 
     return scene
 
-def create_scene_aabb(scene: Scene) -> SceneAABB:
-    """ Create a SceneAABB for a Scene. """
+def create_scenes(generate_triangle_strips: bool, apply_modifiers: bool, export_target: str,
+                  triangle_strip_options: TriangleStripOptions = None,
+                  triangle_strips_cache: TriangleStripsCache = None,
+                  geometry_cache: GeometryCache = None,
+                  split_large_segments: bool = False,
+                  optimize_vertex_cache: bool = False,
+                  vertex_cache_stats: List[VertexCacheOptimizationStats] = None,
+                  weld_tolerances: WeldTolerances = None,
+                  weld_stats: List[WeldStats] = None) -> Dict[str, Scene]:
+    """ Create a msh Scene for each collection ('COLLECTIONS') or top level object
+        ('TOP_LEVEL_OBJECTS') of the active Blender scene, keyed by it's name. Takes the
+        same arguments as create_scene.
 
-    global_aabb = SceneAABB()
+        The objects of every Scene are gathered and processed together, so the depsgraph
+        is evaluated and the materials gathered only once. Each Scene only has the
+        materials it's models use. """
+
+    object_groups = select_object_groups(export_target)
+
+    objects = []
+    added = set()
+
+    for group in object_groups.values():
+        for obj in group:
+            if obj.name not in added:
+                objects.append(obj)
+                added.add(obj.name)
+
+    materials = gather_materials()
+
+    models = gather_models(apply_modifiers=apply_modifiers, export_target=export_target,
+                           geometry_cache=geometry_cache, split_large_segments=split_large_segments,
+                           weld_tolerances=weld_tolerances, weld_stats=weld_stats, objects=objects)
+    models = _process_models(models, generate_triangle_strips, triangle_strip_options,
+                             triangle_strips_cache, optimize_vertex_cache, vertex_cache_stats)
+
+    scenes: Dict[str, Scene] = {}
+
+    for name, group in object_groups.items():
+        group_names = {obj.name for obj in group}
+
+        # Models are copied as reparenting changes them, their geometry is shared.
+        scene = Scene(name=name)
+        scene.models = [copy(model) for model in models if model.name in group_names]
+
+        if len(scene.models) == 0:
+            continue
+
+        if has_multiple_root_models(scene.models):
+            scene.models = reparent_model_roots(scene.models)
+
+        scene.materials = remove_unused_materials(materials, scene.models)
+
+        scenes[name] = scene
+
+    return scenes
+
+def _process_models(models: List[Model], generate_triangle_strips: bool,
+                    triangle_strip_options: TriangleStripOptions,
+                    triangle_strips_cache: TriangleStripsCache,
+                    optimize_vertex_cache: bool,
+                    vertex_cache_stats: List[VertexCacheOptimizationStats]) -> List[Model]:
+    """ Sorts gathered models by parent, optimizes them for the vertex cache and creates
+        their triangle strips. """
+
+    models = sort_by_parent(models)
+
+    if optimize_vertex_cache:
+        if triangle_strip_options is None:
+            triangle_strip_options = TriangleStripOptions()
+
+        stats = optimize_models_vertex_cache(models, triangle_strip_options.vertex_cache_size,
+                                             triangle_strip_options.vertex_cache_type)
+
+        if vertex_cache_stats is not None:
+            vertex_cache_stats.extend(stats)
+
+    if generate_triangle_strips:
+        models = create_models_triangle_strips(models, triangle_strip_options, triangle_strips_cache)
+    else:
+        for model in models:
+            if model.geometry:
+                for segment in model.geometry:
+                    segment.triangle_strips = segment.triangles
+
+    return models
+
+def create_scene_aabb(scene: Scene, fast: bool = False) -> SceneAABB:
+    """ Create a SceneAABB for a Scene. When fast is set only the corners of each segment's
+        own bounding box are transformed, which can give a larger box for rotated models. """
+
+    world_matrices = get_model_world_matrices(scene.models)
+    segment_mins: List[np.ndarray] = []
+    segment_maxs: List[np.ndarray] = []
 
     for model in scene.models:
         if model.geometry is None or model.hidden:
             continue
 
-        model_world_matrix = get_model_world_matrix(model, scene.models)
-        model_aabb = SceneAABB()
+        model_world_matrix = np.array(world_matrices[model.name], dtype=np.float64)
+        rotation_scale = model_world_matrix[:3, :3].T
+        translation = model_world_matrix[:3, 3]
 
         for segment in model.geometry:
-            segment_aabb = SceneAABB()
+            if len(segment.positions) == 0:
+                continue
 
-            for pos in segment.positions:
-                segment_aabb.integrate_position(model_world_matrix @ pos)
+            positions = segment.positions
 
-            model_aabb.integrate_aabb(segment_aabb)
+            if fast:
+                positions = np.where(_AABB_CORNER_MASKS, positions.max(axis=0), positions.min(axis=0))
 
-        global_aabb.integrate_aabb(model_aabb)
+            world_positions = positions @ rotation_scale + translation
+
+            segment_mins.append(world_positions.min(axis=0))
+            segment_maxs.append(world_positions.max(axis=0))
+
+    global_aabb = SceneAABB()
+
+    if segment_mins:
+        global_aabb.min_ = Vector(np.min(segment_mins, axis=0).tolist())
+        global_aabb.max_ = Vector(np.max(segment_maxs, axis=0).tolist())
 
     return global_aabb
+
+# Selects between the min (False) and max (True) of each axis for the 8 corners of a box.
+_AABB_CORNER_MASKS = np.array(list(product((False, True), repeat=3)))
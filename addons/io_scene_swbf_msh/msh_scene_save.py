@@ -1,21 +1,460 @@
 """ Contains functions for saving a Scene to a .msh file.  """
 
-from itertools import islice
-from typing import Dict
+import os
+import stat
+import struct
+import tempfile
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Tuple
 from .msh_scene import Scene, create_scene_aabb
 from .msh_model import *
 from .msh_material import *
-from .msh_writer import Writer
+from .msh_writer import Writer, StreamingWriter
+from .msh_reader import MshFile
 from .msh_utilities import *
 
-def save_scene(output_file, scene: Scene):
-    """ Saves scene to the supplied file. """
+def save_scene(output_file, scene: Scene, fast_bounding_box: bool = False, stream: bool = False):
+    """ Saves scene to the supplied file. When fast_bounding_box is set the scene's bounding
+        box is built from the bounding boxes of the segments instead of their vertices.
 
-    with Writer(file=output_file, chunk_id="HEDR") as hedr:
+        By default the file is assembled in memory and written in one call. When stream is
+        set the chunk sizes are calculated up front and the file is then written strictly
+        forward as it's serialized, for pipes and other outputs that can not seek. """
+
+    if stream:
+        chunk_sizes = measure_scene_chunks(scene)
+
+        _write_scene(StreamingWriter(output_file, chunk_id="HEDR", chunk_sizes=chunk_sizes), scene, fast_bounding_box)
+    else:
+        _write_scene(Writer(file=output_file, chunk_id="HEDR"), scene, fast_bounding_box)
+
+def save_scene_file(filepath: str, scene: Scene, fast_bounding_box: bool = False, worker_count: int = None):
+    """ Saves scene to a .msh file at filepath. MODL chunks are serialized concurrently by
+        a pool of worker threads while the calling thread appends them, in order, to a
+        temporary file next to filepath. Only twice as many MODL chunks as there are workers
+        are serialized ahead of the one being written, so the whole file is never held in
+        memory. The temporary file is flushed to disk and then renamed over filepath so the
+        file is never seen half written.
+
+        Serialization starts once the scene has been created, it doesn't overlap with
+        gathering the scene from Blender, which has to happen on the main thread.
+
+        When filepath is a stream, such as a named pipe or /dev/stdout, the scene is instead
+        streamed straight into it with save_scene. """
+
+    if is_stream_path(filepath):
+        with open(filepath, "wb") as output_file:
+            save_scene(output_file, scene, fast_bounding_box, stream=True)
+
+        return
+
+    if worker_count is None:
+        worker_count = _DEFAULT_WORKER_COUNT
+
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        _save_scene_blobs_file(filepath, _iterate_scene_blobs(scene, fast_bounding_box, executor,
+                                                              max_pending=2 * worker_count))
+
+# The same default as ThreadPoolExecutor's.
+_DEFAULT_WORKER_COUNT = min(32, (os.cpu_count() or 1) + 4)
+
+def update_scene_file(filepath: str, scene: Scene, fast_bounding_box: bool = False, worker_count: int = None) -> bool:
+    """ Updates an existing .msh file at filepath to match scene, rewriting only the SINF,
+        MATL and MODL chunks whose contents changed. Changed chunks that kept their size are
+        overwritten where they are, when a chunk's size changed everything after it is
+        rewritten and the HEDR and MSH2 sizes are fixed up.
+
+        Falls back to saving the whole file with save_scene_file when there is no file to
+        update, it wasn't written by this exporter or more than half of the new file would
+        have to be rewritten anyway. Returns True if the file was updated in place.
+
+        Unlike save_scene_file an update is not atomic, if it's interrupted the file is left
+        half written. """
+
+    if is_stream_path(filepath):
+        save_scene_file(filepath, scene, fast_bounding_box, worker_count)
+
+        return False
+
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        blobs = list(_iterate_scene_blobs(scene, fast_bounding_box, executor))
+
+    try:
+        update = _plan_scene_file_update(filepath, blobs)
+    except (OSError, ValueError):
+        update = None
+
+    if update is None:
+        _save_scene_blobs_file(filepath, blobs)
+
+        return False
+
+    patches, tail_offset, tail_blobs = update
+
+    if len(patches) == 0 and tail_offset is None:
+        return True
+
+    with open(filepath, "r+b") as output_file:
+        for offset, blob in patches:
+            output_file.seek(offset)
+            output_file.write(blob)
+
+        if tail_offset is not None:
+            output_file.seek(tail_offset)
+
+            for blob in tail_blobs:
+                output_file.write(blob)
+
+            output_file.write(b"CL1L\0\0\0\0")
+            output_file.truncate()
+
+            msh2_size = sum(len(blob) for blob in blobs)
+
+            _write_scene_header_sizes(output_file, msh2_size)
+
+        output_file.flush()
+        os.fsync(output_file.fileno())
+
+    return True
+
+def is_stream_path(filepath: str) -> bool:
+    """ Checks if filepath is an existing named pipe, socket or character device, which
+        can only be written forward and must not be replaced by renaming a file over it. """
+
+    if filepath.startswith("\\\\.\\pipe\\"):
+        return True
+
+    try:
+        mode = os.stat(filepath).st_mode
+    except OSError:
+        return False
+
+    return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or stat.S_ISCHR(mode)
+
+def _plan_scene_file_update(filepath: str, blobs: List[bytearray]):
+    """ Compares the top level chunks of the .msh file at filepath against the blobs of the
+        new scene. Returns None if the file must be saved in full, else a tuple of the
+        (offset, blob) pairs to overwrite in place, the offset to rewrite the file from
+        (None if no chunk changed size) and the blobs to write from that offset. """
+
+    if not os.path.isfile(filepath):
+        return None
+
+    with MshFile(filepath) as msh:
+        hedr = msh.root
+
+        if hedr.offset + 8 + hedr.size != len(msh.view):
+            return None
+
+        if [child.id for child in hedr.children] != ["MSH2", "CL1L"] or hedr.children[1].size != 0:
+            return None
+
+        msh2 = hedr.children[0]
+        chunks = msh2.children
+
+        if [chunk.id for chunk in chunks[:2]] != ["SINF", "MATL"] or any(chunk.id != "MODL" for chunk in chunks[2:]):
+            return None
+
+        patches: List[Tuple[int, bytearray]] = []
+        tail_index = None
+
+        for index, blob in enumerate(blobs):
+            if index >= len(chunks) or chunks[index].size + 8 != len(blob):
+                tail_index = index
+                break
+
+            chunk = chunks[index]
+
+            if msh.view[chunk.offset:chunk.offset + 8 + chunk.size] != blob:
+                patches.append((chunk.offset, blob))
+
+        if tail_index is None and len(chunks) > len(blobs):
+            tail_index = len(blobs)
+
+        if tail_index is None:
+            return patches, None, []
+
+        tail_offset = chunks[tail_index].offset if tail_index < len(chunks) else msh2.offset + 8 + msh2.size
+        tail_blobs = blobs[tail_index:]
+
+        new_size = 16 + sum(len(blob) for blob in blobs) + 8
+        rewrite_size = sum(len(blob) for blob in tail_blobs) + sum(len(blob) for _, blob in patches)
+
+        if rewrite_size > new_size // 2:
+            return None
+
+        return patches, tail_offset, tail_blobs
+
+def _save_scene_blobs_file(filepath: str, blobs: Iterable[bytearray]):
+    """ Writes the blobs of a scene to a temporary file next to filepath, flushes it to
+        disk and renames it over filepath. """
+
+    directory = os.path.dirname(os.path.abspath(filepath))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".msh.tmp")
+
+    try:
+        with os.fdopen(file_descriptor, "wb") as output_file:
+            _write_scene_blobs(output_file, blobs)
+
+            output_file.flush()
+            os.fsync(output_file.fileno())
+
+        os.chmod(temp_path, _get_new_file_mode(filepath))
+        os.replace(temp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+        raise
+
+def _iterate_scene_blobs(scene: Scene, fast_bounding_box: bool, executor, max_pending: int = None) -> Iterator[bytearray]:
+    """ Generator. Yields the serialized SINF, MATL and MODL chunks of scene, in file order.
+        MODL chunks are serialized on the worker threads of executor, with at most
+        max_pending of them queued or serialized ahead of the one last yielded. """
+
+    sinf_blob, _ = _create_chunk_blob("SINF", _write_sinf, scene, fast_bounding_box)
+
+    yield sinf_blob
+
+    matl_blob, material_index = _create_chunk_blob("MATL", _write_matl_and_get_material_index, scene)
+
+    yield matl_blob
+
+    pending = deque()
+
+    try:
+        for index, model in enumerate(scene.models):
+            if max_pending is not None and len(pending) >= max_pending:
+                yield pending.popleft().result()
+
+            pending.append(executor.submit(_create_modl_blob, model, index, material_index))
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Saving failed or was abandoned, don't serialize the remaining chunks.
+        for future in pending:
+            future.cancel()
+
+def _write_scene_blobs(output_file, blobs: Iterable[bytearray]):
+    """ Writes the same file as _write_scene from the serialized chunks of MSH2.
+        The HEDR and MSH2 sizes are patched once every chunk has been written. """
+
+    output_file.write(b"HEDR\0\0\0\0MSH2\0\0\0\0")
+
+    msh2_size = 0
+
+    for blob in blobs:
+        output_file.write(blob)
+        msh2_size += len(blob)
+
+    output_file.write(b"CL1L\0\0\0\0")
+
+    _write_scene_header_sizes(output_file, msh2_size)
+
+def _write_scene_header_sizes(output_file, msh2_size: int):
+    hedr_size = 8 + msh2_size + 8
+
+    if hedr_size > Writer.MAX_SIZE:
+        raise OverflowError(f".msh file overflowed max size. size = {hedr_size} MAX_SIZE = {Writer.MAX_SIZE}")
+
+    output_file.seek(4)
+    output_file.write(struct.pack("<I", hedr_size))
+    output_file.seek(12)
+    output_file.write(struct.pack("<I", msh2_size))
+    output_file.seek(0, os.SEEK_END)
+
+def _create_chunk_blob(chunk_id: str, write_chunk, *args):
+    """ Serializes a chunk with write_chunk(writer, *args) into memory.
+        Returns the chunk's bytes and the result of write_chunk. """
+
+    writer = Writer(None, chunk_id=chunk_id)
+
+    with writer as chunk:
+        result = write_chunk(chunk, *args)
+
+    return writer.buffer, result
+
+def _create_modl_blob(model: Model, index: int, material_index: Dict[str, int]) -> bytearray:
+    modl_blob, _ = _create_chunk_blob("MODL", _write_modl, model, index, material_index)
+
+    return modl_blob
+
+def _get_new_file_mode(filepath: str) -> int:
+    """ Gets the permissions for a file being saved to filepath, those of the existing
+        file if there is one or else the default for new files. """
+
+    try:
+        return stat.S_IMODE(os.stat(filepath).st_mode)
+    except OSError:
+        return _NEW_FILE_MODE
+
+def _get_umask() -> int:
+    """ Reads the process's umask, which can only be done by setting it. Only done once on
+        import, as changing the umask affects every thread of the process. """
+
+    umask = os.umask(0)
+    os.umask(umask)
+
+    return umask
+
+_NEW_FILE_MODE = 0o666 & ~_get_umask()
+
+def predict_scene_size(scene: Scene) -> int:
+    """ Returns the exact size in bytes of the .msh file save_scene will write for scene. """
+
+    return measure_scene_chunks(scene)[0] + 8
+
+def measure_scene_chunks(scene: Scene) -> List[int]:
+    """ Measures the size of every chunk of the .msh file for scene without writing it.
+        Sizes are in the order the chunks are written, starting with HEDR. They are
+        calculated from the lengths of the scene's strings and arrays, nothing is
+        serialized and the bounding box isn't calculated as it's chunk has a fixed size. """
+
+    sizes: List[int] = []
+
+    hedr = _begin_chunk(sizes)
+    msh2 = _begin_chunk(sizes)
+
+    msh2_size = _measure_sinf(sizes, scene)
+    msh2_size += _measure_matl(sizes, scene)
+
+    for model in scene.models:
+        msh2_size += _measure_modl(sizes, model)
+
+    hedr_size = _end_chunk(sizes, msh2, msh2_size)
+    hedr_size += _measure_leaf(sizes, 0) # CL1L
+
+    _end_chunk(sizes, hedr, hedr_size)
+
+    if sizes[0] > Writer.MAX_SIZE:
+        raise OverflowError(f".msh file overflowed max size. size = {sizes[0]} MAX_SIZE = {Writer.MAX_SIZE}")
+
+    return sizes
+
+def _begin_chunk(sizes: List[int]) -> int:
+    """ Reserves the size of a chunk, chunks are measured in the order they're written. """
+
+    sizes.append(0)
+
+    return len(sizes) - 1
+
+def _end_chunk(sizes: List[int], index: int, size: int) -> int:
+    """ Records the padded size of a chunk and returns it's size including it's header. """
+
+    sizes[index] = (size + 3) & ~3
+
+    return 8 + sizes[index]
+
+def _measure_leaf(sizes: List[int], size: int) -> int:
+    return _end_chunk(sizes, _begin_chunk(sizes), size)
+
+def _measure_string(string: str) -> int:
+    return len(string.encode("utf-8")) + 1
+
+def _measure_sinf(sizes: List[int], scene: Scene) -> int:
+    sinf = _begin_chunk(sizes)
+
+    size = _measure_leaf(sizes, _measure_string(scene.name)) # NAME
+    size += _measure_leaf(sizes, 12) # FRAM
+    size += _measure_leaf(sizes, 44) # BBOX
+
+    return _end_chunk(sizes, sinf, size)
+
+def _measure_matl(sizes: List[int], scene: Scene) -> int:
+    matl = _begin_chunk(sizes)
+
+    size = 4 # Material count.
+
+    if len(scene.materials) > 0:
+        for material_name, material in scene.materials.items():
+            size += _measure_matd(sizes, material_name, material)
+    else:
+        size += _measure_matd(sizes, f"{scene.name}Material", Material())
+
+    return _end_chunk(sizes, matl, size)
+
+def _measure_matd(sizes: List[int], material_name: str, material: Material) -> int:
+    matd = _begin_chunk(sizes)
+
+    size = _measure_leaf(sizes, _measure_string(material_name)) # NAME
+    size += _measure_leaf(sizes, 52) # DATA
+    size += _measure_leaf(sizes, 4) # ATRB
+    size += _measure_leaf(sizes, _measure_string(material.texture0)) # TX0D
+
+    if material.texture1 or material.texture2 or material.texture3:
+        size += _measure_leaf(sizes, _measure_string(material.texture1)) # TX1D
+
+        if material.texture2 or material.texture3:
+            size += _measure_leaf(sizes, _measure_string(material.texture2)) # TX2D
+
+        if material.texture3:
+            size += _measure_leaf(sizes, _measure_string(material.texture3)) # TX3D
+
+    return _end_chunk(sizes, matd, size)
+
+def _measure_modl(sizes: List[int], model: Model) -> int:
+    modl = _begin_chunk(sizes)
+
+    size = _measure_leaf(sizes, 4) # MTYP
+    size += _measure_leaf(sizes, 4) # MNDX
+    size += _measure_leaf(sizes, _measure_string(model.name)) # NAME
+
+    if model.parent:
+        size += _measure_leaf(sizes, _measure_string(model.parent)) # PRNT
+
+    if model.hidden:
+        size += _measure_leaf(sizes, 4) # FLGS
+
+    size += _measure_leaf(sizes, 40) # TRAN
+
+    if model.geometry is not None:
+        geom = _begin_chunk(sizes)
+        geom_size = 0
+
+        for segment in model.geometry:
+            geom_size += _measure_segm(sizes, segment)
+
+        size += _end_chunk(sizes, geom, geom_size)
+
+    if model.collisionprimitive is not None:
+        size += _measure_leaf(sizes, 16) # SWCI
+
+    return _end_chunk(sizes, modl, size)
+
+def _measure_segm(sizes: List[int], segment: GeometrySegment) -> int:
+    segm = _begin_chunk(sizes)
+
+    size = _measure_leaf(sizes, 4) # MATI
+    size += _measure_leaf(sizes, 4 + 12 * len(segment.positions)) # POSL
+    size += _measure_leaf(sizes, 4 + 12 * len(segment.normals)) # NRML
+
+    if segment.colors is not None:
+        size += _measure_leaf(sizes, 4 + 4 * len(segment.colors)) # CLRL
+
+    size += _measure_leaf(sizes, 4 + 8 * len(segment.texcoords)) # UV0L
+    size += _measure_leaf(sizes, 4 + 2 * (len(segment.polygon_sizes) + len(segment.polygon_indices))) # NDXL
+    size += _measure_leaf(sizes, 4 + 6 * len(segment.triangles)) # NDXT
+    size += _measure_leaf(sizes, 4 + 2 * _count_triangle_strip_indices(segment.triangle_strips)) # STRP
+
+    return _end_chunk(sizes, segm, size)
+
+def _count_triangle_strip_indices(triangle_strips) -> int:
+    if isinstance(triangle_strips, np.ndarray):
+        return triangle_strips.size
+
+    return sum(len(strip) for strip in triangle_strips) if triangle_strips else 0
+
+def _write_scene(root: Writer, scene: Scene, fast_bounding_box: bool):
+    with root as hedr:
         with hedr.create_child("MSH2") as msh2:
 
             with msh2.create_child("SINF") as sinf:
-                _write_sinf(sinf, scene)
+                _write_sinf(sinf, scene, fast_bounding_box)
 
             material_index: Dict[str, int] = {}
 
@@ -29,7 +468,7 @@ def save_scene(output_file, scene: Scene):
         with hedr.create_child("CL1L"):
             pass
 
-def _write_sinf(sinf: Writer, scene: Scene):
+def _write_sinf(sinf: Writer, scene: Scene, fast_bounding_box: bool):
     with sinf.create_child("NAME") as name:
         name.write_string(scene.name)
 
@@ -38,7 +477,7 @@ def _write_sinf(sinf: Writer, scene: Scene):
         fram.write_f32(29.97003)
 
     with sinf.create_child("BBOX") as bbox:
-        aabb = create_scene_aabb(scene)
+        aabb = create_scene_aabb(scene, fast_bounding_box)
 
         bbox_position = div_vec(add_vec(aabb.min_, aabb.max_), Vector((2.0, 2.0, 2.0)))
         bbox_size = div_vec(sub_vec(aabb.max_, aabb.min_), Vector((2.0, 2.0, 2.0)))
@@ -143,49 +582,57 @@ def _write_segm(segm: Writer, segment: GeometrySegment, material_index: Dict[str
 
     with segm.create_child("POSL") as posl:
         posl.write_u32(len(segment.positions))
-
-        for position in segment.positions:
-            posl.write_f32(position.x, position.y, position.z)
+        posl.write_array(np.ascontiguousarray(segment.positions, dtype="<f4"))
 
     with segm.create_child("NRML") as nrml:
         nrml.write_u32(len(segment.normals))
-
-        for normal in segment.normals:
-            nrml.write_f32(normal.x, normal.y, normal.z)
+        nrml.write_array(np.ascontiguousarray(segment.normals, dtype="<f4"))
 
     if segment.colors is not None:
         with segm.create_child("CLRL") as clrl:
             clrl.write_u32(len(segment.colors))
-
-            for color in segment.colors:
-                clrl.write_u32(pack_color(color))
+            clrl.write_array(pack_color_array(segment.colors).astype("<u4"))
 
     with segm.create_child("UV0L") as uv0l:
         uv0l.write_u32(len(segment.texcoords))
-
-        for texcoord in segment.texcoords:
-            uv0l.write_f32(texcoord.x, texcoord.y)
+        uv0l.write_array(np.ascontiguousarray(segment.texcoords, dtype="<f4"))
 
     with segm.create_child("NDXL") as ndxl:
-        ndxl.write_u32(len(segment.polygons))
+        ndxl.write_u32(len(segment.polygon_sizes))
 
-        for polygon in segment.polygons:
-            ndxl.write_u16(len(polygon))
-
-            for index in polygon:
-                ndxl.write_u16(index)
+        # Each polygon is written as it's size followed by it's indices.
+        polygon_starts = np.cumsum(segment.polygon_sizes, dtype=np.int64) - segment.polygon_sizes
+        ndxl.write_array(np.insert(segment.polygon_indices.astype("<u2"), polygon_starts,
+                                   segment.polygon_sizes.astype("<u2")))
 
     with segm.create_child("NDXT") as ndxt:
         ndxt.write_u32(len(segment.triangles))
-
-        for triangle in segment.triangles:
-            ndxt.write_u16(triangle[0], triangle[1], triangle[2])
+        ndxt.write_array(np.ascontiguousarray(segment.triangles, dtype="<u2"))
 
     with segm.create_child("STRP") as strp:
-        strp.write_u32(sum(len(strip) for strip in segment.triangle_strips))
-
-        for strip in segment.triangle_strips:
-            strp.write_u16(strip[0] | 0x8000, strip[1] | 0x8000)
+        strip_indices, strip_starts = _flatten_triangle_strips(segment.triangle_strips)
+
+        # The first two indices of each strip are flagged to mark the start of the strip.
+        strip_indices[strip_starts] |= 0x8000
+        strip_indices[strip_starts + 1] |= 0x8000
+
+        strp.write_u32(len(strip_indices))
+        strp.write_array(strip_indices)
+
+def _flatten_triangle_strips(triangle_strips) -> Tuple[np.ndarray, np.ndarray]:
+    """ Flattens triangle strips (a list of index lists or an array with a row per strip)
+        into a new uint16 index array and an array of the offset of each strip in it. """
+
+    if isinstance(triangle_strips, np.ndarray):
+        strip_lengths = np.full(len(triangle_strips), triangle_strips.shape[1], dtype=np.int64)
+        strip_indices = triangle_strips.astype("<u2").ravel()
+    elif triangle_strips:
+        strip_lengths = np.fromiter((len(strip) for strip in triangle_strips), dtype=np.int64,
+                                    count=len(triangle_strips))
+        strip_indices = np.fromiter((index for strip in triangle_strips for index in strip), dtype="<u2",
+                                    count=int(strip_lengths.sum()))
+    else:
+        strip_lengths = np.zeros(0, dtype=np.int64)
+        strip_indices = np.zeros(0, dtype="<u2")
 
-            for index in islice(strip, 2, len(strip)):
-                strp.write_u16(index)
+    return strip_indices, np.cumsum(strip_lengths) - strip_lengths
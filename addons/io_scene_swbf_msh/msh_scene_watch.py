@@ -0,0 +1,228 @@
+""" Contains watch mode, which automatically re-exports a scene to a .msh file a short
+    time after it was last changed, and it's Blender properties and UI. """
+
+import bpy
+import time
+from dataclasses import dataclass
+from typing import Set
+from bpy.app.handlers import persistent
+from bpy.props import BoolProperty, EnumProperty, FloatProperty, StringProperty
+from bpy.types import PropertyGroup
+from .msh_scene import create_scene
+from .msh_scene_save import update_scene_file
+from .msh_export_settings import get_last_export_settings, create_scene_arguments
+
+@dataclass
+class WatchStatus:
+    """ Class describing the outcome of the last automatic export. """
+
+    last_export_time: float = None
+    last_export_duration: float = 0.0
+    last_error: str = ""
+    last_change_time: float = 0.0
+    exporting: bool = False
+    exported_objects: Set[str] = None
+
+watch_status = WatchStatus()
+
+def _on_enabled_update(self, context):
+    if self.enabled:
+        schedule_watch_export(self.debounce)
+    elif bpy.app.timers.is_registered(on_watch_timer):
+        bpy.app.timers.unregister(on_watch_timer)
+
+class WatchProperties(PropertyGroup):
+    enabled: BoolProperty(
+        name="Watch",
+        description="Automatically export the scene to the .msh file whenever it has been changed.",
+        default=False,
+        update=_on_enabled_update
+    )
+
+    filepath: StringProperty(
+        name="File",
+        description="The .msh file to export to.",
+        default="",
+        subtype='FILE_PATH'
+    )
+
+    debounce: FloatProperty(
+        name="Delay",
+        description="How long in seconds the scene must go unchanged before it is exported.",
+        default=1.0,
+        min=0.0,
+        soft_max=10.0
+    )
+
+    export_target: EnumProperty(name="Export Target",
+                                description="What to export.",
+                                items=(
+                                    ('SCENE', "Scene", "Export the current active scene."),
+                                    ('SELECTED', "Selected", "Export the currently selected objects and their parents."),
+                                    ('SELECTED_WITH_CHILDREN', "Selected with Children", "Export the currently selected objects with their children and parents.")
+                                ),
+                                default='SCENE')
+
+    apply_modifiers: BoolProperty(
+        name="Apply Modifiers",
+        description="Whether to apply Modifiers during export or not.",
+        default=True
+    )
+
+    generate_triangle_strips: BoolProperty(
+        name="Generate Triangle Strips",
+        description="Generate triangle strips for geometry. Makes each export slower.",
+        default=False
+    )
+
+class WatchPanel(bpy.types.Panel):
+    """ Creates a Panel in the Scene properties window """
+    bl_label = "SWBF .msh Watch"
+    bl_idname = "SCENE_PT_swbf_msh_watch"
+    bl_space_type = 'PROPERTIES'
+    bl_region_type = 'WINDOW'
+    bl_context = "scene"
+
+    def draw(self, context):
+        layout = self.layout
+
+        watch_props = context.scene.swbf_msh_watch
+
+        layout.prop(watch_props, "enabled")
+        layout.prop(watch_props, "filepath")
+        layout.prop(watch_props, "debounce")
+        layout.prop(watch_props, "export_target")
+        layout.prop(watch_props, "apply_modifiers")
+        layout.prop(watch_props, "generate_triangle_strips")
+        layout.label(text="Other settings are taken from the last export.", icon='INFO')
+
+        if watch_status.last_export_time is not None:
+            last_export = time.strftime("%H:%M:%S", time.localtime(watch_status.last_export_time))
+
+            layout.label(text=f"Last Export: {last_export} ({watch_status.last_export_duration:.2f}s)")
+
+        if watch_status.last_error:
+            layout.label(text=watch_status.last_error, icon='ERROR')
+
+        if bpy.app.timers.is_registered(on_watch_timer):
+            layout.label(text="Export Pending...")
+
+def schedule_watch_export(delay: float):
+    """ Exports the watched scene once it has gone unchanged for delay seconds. """
+
+    watch_status.last_change_time = time.monotonic()
+
+    if not bpy.app.timers.is_registered(on_watch_timer):
+        bpy.app.timers.register(on_watch_timer, first_interval=delay)
+
+def on_watch_timer():
+    """ Exports the watched scene if it hasn't changed for the debounce time, else returns
+        the time to wait until it might not have. """
+
+    scene = bpy.context.scene
+    watch_props = scene.swbf_msh_watch
+
+    if not watch_props.enabled:
+        return None
+
+    idle_time = time.monotonic() - watch_status.last_change_time
+
+    if idle_time < watch_props.debounce:
+        return watch_props.debounce - idle_time
+
+    export_watched_scene(scene)
+
+    return None
+
+def export_watched_scene(scene: bpy.types.Scene):
+    """ Exports scene to it's watch mode .msh file. Settings other than the watch mode's
+        own are those the export operator was last run with, but triangle strips are always
+        generated without starting any processes. Geometry is reused from the geometry
+        cache for the objects that haven't changed and only the changed chunks of an
+        existing .msh file are rewritten. """
+
+    watch_props = scene.swbf_msh_watch
+    start = time.perf_counter()
+
+    watch_status.exporting = True
+
+    try:
+        if not watch_props.filepath:
+            raise RuntimeError("No .msh file has been set to export to!")
+
+        filepath = bpy.path.abspath(watch_props.filepath)
+
+        scene_arguments = create_scene_arguments(get_last_export_settings(), worker_count=1)
+        scene_arguments.update(
+            generate_triangle_strips=watch_props.generate_triangle_strips,
+            apply_modifiers=watch_props.apply_modifiers,
+            export_target=watch_props.export_target)
+
+        msh_scene = create_scene(**scene_arguments)
+
+        update_scene_file(filepath=filepath, scene=msh_scene)
+
+        watch_status.exported_objects = {model.name for model in msh_scene.models}
+
+        watch_status.last_export_time = time.time()
+        watch_status.last_export_duration = time.perf_counter() - start
+        watch_status.last_error = ""
+    except Exception as error:
+        watch_status.last_error = str(error)
+
+        print(f"SWBF .msh watch: {error}")
+    finally:
+        watch_status.exporting = False
+
+    _redraw_properties_editors()
+
+def _redraw_properties_editors():
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'PROPERTIES':
+                area.tag_redraw()
+
+def is_watched_update(update, scene: bpy.types.Scene) -> bool:
+    """ Checks if a depsgraph update changes the watched scene's .msh file. Only changes to
+        the geometry or transform of exported objects, to materials and to the objects in
+        collections count, so that selecting objects or using the UI doesn't export. """
+
+    original = update.id.original
+
+    if isinstance(original, (bpy.types.Material, bpy.types.Collection)):
+        return True
+
+    if not isinstance(original, bpy.types.Object):
+        return False
+
+    if not (update.is_updated_geometry or update.is_updated_transform):
+        return False
+
+    if watch_status.exported_objects is None or scene.swbf_msh_watch.export_target == 'SCENE':
+        return original.name in scene.objects
+
+    return original.name in watch_status.exported_objects
+
+@persistent
+def on_watch_depsgraph_update_post(scene, depsgraph=None):
+    """ Schedules an export of a watched scene when an update changes what would be
+        exported. """
+
+    if watch_status.exporting or not scene.swbf_msh_watch.enabled:
+        return
+
+    if depsgraph is None:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+
+    if any(is_watched_update(update, scene) for update in depsgraph.updates):
+        schedule_watch_export(scene.swbf_msh_watch.debounce)
+
+def register_watch_handlers():
+    bpy.app.handlers.depsgraph_update_post.append(on_watch_depsgraph_update_post)
+
+def unregister_watch_handlers():
+    if on_watch_depsgraph_update_post in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(on_watch_depsgraph_update_post)
+
+    if bpy.app.timers.is_registered(on_watch_timer):
+        bpy.app.timers.unregister(on_watch_timer)
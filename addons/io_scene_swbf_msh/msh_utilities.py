@@ -1,5 +1,6 @@
 """ Misc utilities. """
 
+import numpy as np
 from mathutils import Vector
 
 def add_vec(l: Vector, r: Vector) -> Vector:
@@ -29,3 +30,12 @@ def pack_color(color) -> int:
     packed |= (int(color[3] * 255.0 + 0.5) << 24)
 
     return packed
+
+def pack_color_array(colors: np.ndarray) -> np.ndarray:
+    """ Packs an array of RGBA colors in the same way as pack_color. """
+
+    channels = np.floor(colors * 255.0 + 0.5).astype(np.int64)
+
+    packed = (channels[:, 0] << 16) | (channels[:, 1] << 8) | channels[:, 2] | (channels[:, 3] << 24)
+
+    return (packed & 0xFFFFFFFF).astype(np.uint32)
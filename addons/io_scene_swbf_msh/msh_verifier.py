@@ -0,0 +1,324 @@
+""" Contains a verifier for checking the integrity of .msh files and a command line tool
+    for verifying many files in parallel. Only depends on NumPy and the standard library
+    so it can run outside of Blender:
+
+        python msh_verifier.py file.msh directory_of_msh_files """
+
+import argparse
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Set
+
+try:
+    from .msh_reader import MshFile, Chunk, CONTAINER_CHUNKS
+except ImportError:
+    from msh_reader import MshFile, Chunk, CONTAINER_CHUNKS
+
+# The number of bytes in each element of a SEGM's vertex and index arrays.
+_SEGM_ARRAY_ITEM_SIZES: Dict[str, int] = {
+    "POSL": 12,
+    "NRML": 12,
+    "CLRL": 4,
+    "UV0L": 8,
+    "NDXT": 6,
+    "STRP": 2
+}
+
+_STRIP_START_FLAG = 0x8000
+
+def verify_msh_file(path: str) -> List[str]:
+    """ Verifies the .msh file at path and returns a description of every problem found
+        in it, an empty list means the file is valid. """
+
+    try:
+        with MshFile(path) as msh:
+            return verify_msh(msh)
+    except (OSError, ValueError, RuntimeError) as error:
+        return [str(error)]
+
+def verify_msh(msh: MshFile) -> List[str]:
+    """ Verifies an open .msh file and returns a description of every problem found in it. """
+
+    problems: List[str] = []
+
+    try:
+        _verify_chunk_tree(msh.root, problems)
+
+        if msh.root.offset + 8 + msh.root.size != len(msh.view):
+            problems.append(f"File has {len(msh.view) - msh.root.size - 8} bytes after the HEDR chunk.")
+
+        msh2 = msh.root.find("MSH2")
+
+        if msh2 is None:
+            problems.append("HEDR chunk has no MSH2 chunk.")
+            return problems
+
+        material_count = _verify_matl(msh2.find("MATL"), problems)
+
+        models = msh2.find_all("MODL")
+        model_names = [_find_string(modl, "NAME") for modl in models]
+        names: Set[str] = set()
+
+        for modl, name in zip(models, model_names):
+            if name is None:
+                problems.append(f"MODL chunk at offset {modl.offset} has no NAME.")
+            elif name in names:
+                problems.append(f"Model name '{name}' is used by more than one MODL.")
+
+            names.add(name)
+
+        for modl, name in zip(models, model_names):
+            _verify_modl(modl, name, names, material_count, problems)
+    except ValueError as error:
+        problems.append(str(error))
+
+    return problems
+
+def _verify_chunk_tree(chunk: Chunk, problems: List[str]):
+    """ Checks every chunk is padded to 4 bytes and that the children of each container
+        chunk exactly fill it. Chunks overrunning their parent raise a ValueError. """
+
+    stack = [chunk]
+
+    while stack:
+        chunk = stack.pop()
+
+        if chunk.size % 4 != 0:
+            problems.append(f"{chunk.id} chunk at offset {chunk.offset} is not padded to 4 bytes "
+                            f"(size = {chunk.size}).")
+
+        if chunk.id in CONTAINER_CHUNKS and chunk.size < CONTAINER_CHUNKS[chunk.id]:
+            problems.append(f"{chunk.id} chunk at offset {chunk.offset} is too small for it's "
+                            f"{CONTAINER_CHUNKS[chunk.id]} byte header (size = {chunk.size}).")
+        elif chunk.id in CONTAINER_CHUNKS:
+            children = chunk.children
+            end = children[-1].offset + 8 + children[-1].size if children else chunk.offset + 8 + CONTAINER_CHUNKS[chunk.id]
+
+            if end != chunk.offset + 8 + chunk.size:
+                problems.append(f"{chunk.id} chunk at offset {chunk.offset} has {chunk.offset + 8 + chunk.size - end} "
+                                f"bytes not belonging to any child chunk.")
+
+            stack.extend(reversed(children))
+
+def _verify_matl(matl: Chunk, problems: List[str]) -> int:
+    """ Checks a MATL's material count matches it's MATD chunks and returns the count. """
+
+    if matl is None:
+        problems.append("MSH2 chunk has no MATL chunk.")
+        return 0
+
+    material_count = matl.read_u32()
+    matd_count = len(matl.find_all("MATD"))
+
+    if material_count != matd_count:
+        problems.append(f"MATL material count ({material_count}) does not match it's MATD chunks ({matd_count}).")
+
+    return matd_count
+
+def _verify_modl(modl: Chunk, name: str, names: Set[str], material_count: int, problems: List[str]):
+    parent = _find_string(modl, "PRNT")
+
+    if parent is not None and parent not in names:
+        problems.append(f"Model '{name}' has a parent ('{parent}') that is not in the file.")
+
+    tran = modl.find("TRAN")
+
+    if tran is None or tran.size != 40:
+        problems.append(f"Model '{name}' is missing it's TRAN chunk or it is the wrong size.")
+    elif not np.isfinite(np.frombuffer(tran.data, dtype="<f4")).all():
+        problems.append(f"Model '{name}' has a transform that is not finite.")
+
+    geom = modl.find("GEOM")
+
+    if geom is None:
+        return
+
+    for index, segm in enumerate(geom.find_all("SEGM")):
+        _verify_segm(segm, f"Model '{name}' segment {index}", material_count, problems)
+
+def _verify_segm(segm: Chunk, segm_name: str, material_count: int, problems: List[str]):
+    mati = segm.find("MATI")
+
+    if mati is None:
+        problems.append(f"{segm_name} has no MATI chunk.")
+    elif mati.read_u32() >= material_count:
+        problems.append(f"{segm_name} uses material {mati.read_u32()} but the file has {material_count} materials.")
+
+    counts: Dict[str, int] = {}
+
+    for chunk_id, item_size in _SEGM_ARRAY_ITEM_SIZES.items():
+        chunk = segm.find(chunk_id)
+
+        if chunk is None:
+            continue
+
+        counts[chunk_id] = chunk.read_u32()
+        expected_size = _pad(4 + counts[chunk_id] * item_size)
+
+        if chunk.size != expected_size:
+            problems.append(f"{segm_name} {chunk_id} chunk is {chunk.size} bytes but it's count of "
+                            f"{counts[chunk_id]} needs {expected_size} bytes.")
+            return
+
+    if "POSL" not in counts:
+        problems.append(f"{segm_name} has no POSL chunk.")
+        return
+
+    vertex_count = counts["POSL"]
+
+    for chunk_id in ("NRML", "UV0L", "CLRL"):
+        if chunk_id in counts and counts[chunk_id] != vertex_count:
+            problems.append(f"{segm_name} has {vertex_count} positions but {counts[chunk_id]} {chunk_id} elements.")
+
+    if not np.isfinite(_get_array(segm.find("POSL"), "<f4", vertex_count * 3)).all():
+        problems.append(f"{segm_name} has vertex positions that are not finite.")
+
+    ndxl = segm.find("NDXL")
+
+    if ndxl is not None:
+        _verify_ndxl(ndxl, segm_name, vertex_count, problems)
+
+    if "NDXT" in counts:
+        triangles = _get_array(segm.find("NDXT"), "<u2", counts["NDXT"] * 3)
+
+        if len(triangles) > 0 and triangles.max() >= vertex_count:
+            problems.append(f"{segm_name} NDXT chunk has an index ({triangles.max()}) out of range of it's "
+                            f"{vertex_count} vertices.")
+
+    if "STRP" in counts:
+        _verify_strp(_get_array(segm.find("STRP"), "<u2", counts["STRP"]), segm_name, vertex_count, problems)
+
+def _verify_ndxl(ndxl: Chunk, segm_name: str, vertex_count: int, problems: List[str]):
+    """ Checks the polygons of a NDXL chunk, each is it's size followed by it's indices. """
+
+    polygon_count = ndxl.read_u32()
+    data = _get_array(ndxl, "<u2", (ndxl.size - 4) // 2)
+    starts = _find_polygon_starts(data, polygon_count)
+
+    if starts is None:
+        problems.append(f"{segm_name} NDXL chunk is too small for it's {polygon_count} polygons.")
+        return
+
+    sizes = data[starts]
+    offsets = np.cumsum(sizes.astype(np.int64) + 1)
+    end = int(offsets[-1]) if len(offsets) > 0 else 0
+
+    if end > len(data) or len(data) - end > 1:
+        problems.append(f"{segm_name} NDXL chunk's size does not match it's {polygon_count} polygons.")
+        return
+
+    is_size = np.zeros(end, dtype=bool)
+    is_size[starts] = True
+    indices = data[:end][~is_size]
+
+    if len(sizes) > 0 and sizes.min() < 3:
+        problems.append(f"{segm_name} NDXL chunk has a polygon with less than 3 indices.")
+
+    if len(indices) > 0 and indices.max() >= vertex_count:
+        problems.append(f"{segm_name} NDXL chunk has an index ({indices.max()}) out of range of it's "
+                        f"{vertex_count} vertices.")
+
+def _find_polygon_starts(data: np.ndarray, polygon_count: int) -> np.ndarray:
+    """ Finds the offset of each of the first polygon_count polygons in NDXL data, or returns
+        None if the data ends first. Each polygon's offset depends on the one before it, so
+        they're found by pointer doubling: every round jumps twice as many polygons ahead
+        from every offset at once, taking log2(polygon_count) rounds of array operations. """
+
+    end = len(data)
+
+    # Every polygon takes at least one u16, a count from a corrupt file must not be trusted
+    # to size the arrays.
+    if polygon_count > end:
+        return None
+
+    # The polygon following an offset, offsets past the end of the data go to len(data).
+    jump = np.minimum(np.arange(1, end + 1, dtype=np.int64) + data, end)
+    jump = np.append(jump, end)
+
+    starts = np.zeros(min(polygon_count, 1), dtype=np.int64)
+
+    while len(starts) < polygon_count and starts[-1] < end:
+        starts = np.concatenate((starts, jump[starts]))[:polygon_count]
+        jump = jump[jump]
+
+    if len(starts) > 0 and starts[-1] >= end:
+        return None
+
+    return starts
+
+def _verify_strp(strip_indices: np.ndarray, segm_name: str, vertex_count: int, problems: List[str]):
+    """ Checks the triangle strips of a STRP chunk. The first two indices of each strip
+        have the strip start flag set and every strip has at least 3 indices. """
+
+    if len(strip_indices) == 0:
+        return
+
+    flagged = np.flatnonzero(strip_indices & _STRIP_START_FLAG)
+    firsts = flagged[0::2]
+    seconds = flagged[1::2]
+
+    if (len(flagged) == 0 or len(flagged) % 2 != 0 or flagged[0] != 0
+            or not np.array_equal(seconds, firsts + 1)):
+        problems.append(f"{segm_name} STRP chunk has strip start flags that are not in pairs at the start of each strip.")
+        return
+
+    if np.diff(np.append(firsts, len(strip_indices))).min() < 3:
+        problems.append(f"{segm_name} STRP chunk has a strip with less than 3 indices.")
+
+    indices = strip_indices & ~np.uint16(_STRIP_START_FLAG)
+
+    if indices.max() >= vertex_count:
+        problems.append(f"{segm_name} STRP chunk has an index ({indices.max()}) out of range of it's "
+                        f"{vertex_count} vertices.")
+
+def _get_array(chunk: Chunk, dtype: str, count: int) -> np.ndarray:
+    """ Gets a view of the array of count elements following a chunk's element count. """
+
+    return np.frombuffer(chunk.data, dtype=dtype, count=count, offset=4)
+
+def _find_string(chunk: Chunk, chunk_id: str) -> str:
+    child = chunk.find(chunk_id)
+
+    return child.read_string() if child is not None else None
+
+def _pad(size: int) -> int:
+    return (size + 3) & ~3
+
+def _iterate_msh_paths(paths: List[str]) -> Iterator[str]:
+    """ Generator. Yields the paths of files, and of every .msh file under directories. """
+
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for directory, _, filenames in os.walk(path):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(".msh"):
+                    yield os.path.join(directory, filename)
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Verify the integrity of .msh files.")
+    parser.add_argument("paths", nargs="+", help=".msh files or directories to search for .msh files")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args(argv)
+
+    paths = list(_iterate_msh_paths(args.paths))
+    invalid_count = 0
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for path, problems in zip(paths, executor.map(verify_msh_file, paths, chunksize=16)):
+            if problems:
+                invalid_count += 1
+
+                for problem in problems:
+                    print(f"{path}: {problem}")
+
+    print(f"Verified {len(paths)} files, {invalid_count} invalid.", file=sys.stderr)
+
+    return 1 if invalid_count > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,26 @@
 
 import io
 import struct
+from typing import List
 
 class Writer:
+    """ Class for writing a chunk of a .msh file. A root chunk and it's children are
+        assembled in a shared in-memory buffer, with each chunk's size patched in the
+        buffer, and the root writes the whole buffer to the file when it is complete.
+        A root without a file leaves the finished chunk in it's buffer. """
+
     def __init__(self, file, chunk_id: str, parent=None):
         self.file = file
         self.size: int = 0
         self.size_pos = None
         self.parent = parent
+        self.buffer: bytearray = parent.buffer if parent is not None else bytearray()
 
-        self.file.write(bytes(chunk_id[0:4], "ascii"))
+        self.buffer += bytes(chunk_id[0:4], "ascii")
 
     def __enter__(self):
-        self.size_pos = self.file.tell()
-        self.file.write(struct.pack(f"<I", 0))
+        self.size_pos = len(self.buffer)
+        self.buffer += b"\0\0\0\0"
 
         return self
 
@@ -21,21 +28,32 @@ class Writer:
         if self.size > self.MAX_SIZE:
             raise OverflowError(f".msh file overflowed max size. size = {self.size} MAX_SIZE = {self.MAX_SIZE}")
 
-        if (self.size % 4) > 0:
-            padding = 4 - (self.size % 4)
-            self.write_bytes(bytes([0 for i in range(padding)]))
+        self._write_padding()
 
-        head_pos = self.file.tell()
-        self.file.seek(self.size_pos)
-        self.file.write(struct.pack(f"<I", self.size))
-        self.file.seek(head_pos)
+        struct.pack_into("<I", self.buffer, self.size_pos, self.size)
 
         if self.parent is not None:
             self.parent.size += self.size
+        elif exc_type is None and self.file is not None:
+            self.file.write(self.buffer)
+
+    def _write_padding(self):
+        if (self.size % 4) > 0:
+            padding = 4 - (self.size % 4)
+            self.write_bytes(bytes(padding))
 
     def write_bytes(self, packed_bytes):
         self.size += len(packed_bytes)
-        self.file.write(packed_bytes)
+        self.buffer += packed_bytes
+
+    def write_array(self, data):
+        """ Writes the raw contents of a C-contiguous buffer, such as an array.array or
+            NumPy array, in a single copy. The data must already be little endian. """
+
+        view = memoryview(data).cast("B")
+
+        self.size += view.nbytes
+        self.buffer += view
 
     def write_string(self, string: str):
         self.write_bytes(bytes(string, "utf-8"))
@@ -63,9 +81,49 @@ class Writer:
         self.write_bytes(struct.pack(f"<{len(floats)}f", *floats))
 
     def create_child(self, child_id: str):
-        child = Writer(self.file, chunk_id=child_id, parent=self)
+        child = type(self)(self.file, chunk_id=child_id, parent=self)
         self.size += 8
 
         return child
 
     MAX_SIZE: int = 2147483647 - 8
+
+class StreamingWriter(Writer):
+    """ Class for writing a chunk of a .msh file strictly forward, for outputs that can not
+        seek such as pipes and sockets. Each chunk's size is written up front, taken from
+        chunk_sizes, which lists the size of every chunk in the order they're started. """
+
+    def __init__(self, file, chunk_id: str, parent=None, chunk_sizes: List[int] = None):
+        self.file = file
+        self.size: int = 0
+        self.expected_size = None
+        self.parent = parent
+        self.chunk_sizes = parent.chunk_sizes if parent is not None else iter(chunk_sizes)
+
+        self.file.write(bytes(chunk_id[0:4], "ascii"))
+
+    def __enter__(self):
+        self.expected_size = next(self.chunk_sizes)
+        self.file.write(struct.pack(f"<I", self.expected_size))
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._write_padding()
+
+        if exc_type is None and self.size != self.expected_size:
+            raise RuntimeError(f"Streamed .msh chunk size ({self.size}) does not match it's measured "
+                               f"size ({self.expected_size})!")
+
+        if self.parent is not None:
+            self.parent.size += self.size
+
+    def write_bytes(self, packed_bytes):
+        self.size += len(packed_bytes)
+        self.file.write(packed_bytes)
+
+    def write_array(self, data):
+        view = memoryview(data).cast("B")
+
+        self.size += view.nbytes
+        self.file.write(view)
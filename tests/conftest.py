@@ -0,0 +1,183 @@
+""" Stubs the Blender modules (bpy, mathutils) so the exporter's modules can be imported
+    and tested outside of Blender. Only what the tested modules touch is stubbed. The
+    addon is registered as a bare package so it's __init__.py, which registers the
+    operator with Blender, isn't run. """
+
+import os
+import sys
+import types
+import numpy as np
+import pytest
+
+ADDON_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               "addons", "io_scene_swbf_msh")
+
+class _StubTypes(types.ModuleType):
+    """ Module whose every attribute is a new empty class, for subclassing and isinstance. """
+
+    def __getattr__(self, name: str):
+        stub_type = type(name, (), {})
+        setattr(self, name, stub_type)
+
+        return stub_type
+
+class _StubProps(types.ModuleType):
+    def __getattr__(self, name: str):
+        return lambda *args, **kwargs: None
+
+def _create_bpy():
+    bpy = types.ModuleType("bpy")
+    bpy.types = _StubTypes("bpy.types")
+    bpy.props = _StubProps("bpy.props")
+    bpy.context = types.SimpleNamespace()
+    bpy.app = types.ModuleType("bpy.app")
+    bpy.app.handlers = types.ModuleType("bpy.app.handlers")
+    bpy.app.handlers.persistent = lambda function: function
+    bpy.app.handlers.depsgraph_update_post = []
+    bpy.app.handlers.load_post = []
+
+    return {"bpy": bpy, "bpy.types": bpy.types, "bpy.props": bpy.props,
+            "bpy.app": bpy.app, "bpy.app.handlers": bpy.app.handlers}
+
+class Vector(tuple):
+    def __new__(cls, values=(0.0, 0.0, 0.0)):
+        return tuple.__new__(cls, (float(value) for value in values))
+
+    x = property(lambda self: self[0])
+    y = property(lambda self: self[1])
+    z = property(lambda self: self[2])
+    w = property(lambda self: self[3])
+
+    @property
+    def length(self) -> float:
+        return sum(value * value for value in self) ** 0.5
+
+class Quaternion(tuple):
+    """ Quaternion stored (w, x, y, z) like Blender's. """
+
+    def __new__(cls, values=(1.0, 0.0, 0.0, 0.0)):
+        return tuple.__new__(cls, (float(value) for value in values))
+
+    w = property(lambda self: self[0])
+    x = property(lambda self: self[1])
+    y = property(lambda self: self[2])
+    z = property(lambda self: self[3])
+
+    def to_matrix(self):
+        w, x, y, z = self
+
+        return Matrix([[1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w), 0],
+                       [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w), 0],
+                       [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y), 0],
+                       [0, 0, 0, 1]])
+
+class Matrix:
+    """ 4x4 matrix, the identity by default. """
+
+    def __init__(self, rows=None):
+        self.values = np.identity(4) if rows is None else np.array(rows, dtype=np.float64)
+
+    @staticmethod
+    def Translation(translation):
+        matrix = Matrix()
+        matrix.values[:3, 3] = list(translation)
+
+        return matrix
+
+    def to_4x4(self):
+        return Matrix(self.values)
+
+    def __matmul__(self, other):
+        if isinstance(other, Matrix):
+            return Matrix(self.values @ other.values)
+
+        return Vector((self.values @ np.append(np.array(other, dtype=np.float64), 1.0))[:3])
+
+    def __array__(self, dtype=None, copy=None):
+        return self.values if dtype is None else self.values.astype(dtype)
+
+class Color(tuple):
+    pass
+
+def _create_mathutils():
+    mathutils = types.ModuleType("mathutils")
+    mathutils.Vector = Vector
+    mathutils.Quaternion = Quaternion
+    mathutils.Matrix = Matrix
+    mathutils.Color = Color
+
+    return {"mathutils": mathutils}
+
+def _create_addon_package():
+    package = types.ModuleType("io_scene_swbf_msh")
+    package.__path__ = [ADDON_DIRECTORY]
+
+    return {"io_scene_swbf_msh": package}
+
+for _name, _module in {**_create_bpy(), **_create_mathutils(), **_create_addon_package()}.items():
+    sys.modules.setdefault(_name, _module)
+
+@pytest.fixture
+def msh_scene():
+    """ A Scene using every chunk the exporter writes: materials with extra textures, a
+        hierarchy, hidden and collision models and segments with and without colors and
+        with list and array triangle strips. """
+
+    from io_scene_swbf_msh.msh_scene import Scene
+    from io_scene_swbf_msh.msh_model import Model, ModelType, GeometrySegment, CollisionPrimitive, CollisionPrimitiveShape
+    from io_scene_swbf_msh.msh_material import Material
+
+    rng = np.random.default_rng(0)
+
+    def create_segment(material_name: str, width: int, colors: bool, array_strips: bool) -> GeometrySegment:
+        vertex_count = (width + 1) * (width + 1)
+        polygons = []
+
+        for y in range(width):
+            for x in range(width):
+                a = y * (width + 1) + x
+                polygons.append([a, a + 1, a + width + 2, a + width + 1])
+
+        segment = GeometrySegment(material_name=material_name)
+        segment.positions = rng.standard_normal((vertex_count, 3)).astype(np.float32)
+        segment.normals = rng.standard_normal((vertex_count, 3)).astype(np.float32)
+        segment.texcoords = rng.random((vertex_count, 2)).astype(np.float32)
+
+        if colors:
+            segment.colors = rng.random((vertex_count, 4)).astype(np.float32)
+
+        segment.polygons = polygons
+        segment.triangles = np.array([[p[0], p[1], p[2]] for p in polygons] +
+                                     [[p[0], p[2], p[3]] for p in polygons], dtype=np.uint16)
+
+        if array_strips:
+            segment.triangle_strips = segment.triangles.copy()
+        else:
+            segment.triangle_strips = [[p[0], p[1], p[3], p[2]] for p in polygons]
+
+        return segment
+
+    scene = Scene(name="test")
+    scene.materials = {
+        "plain": Material(),
+        "textured": Material(texture0="diffuse.tga", texture1="normal.tga", texture3="detail.tga")
+    }
+
+    root = Model(name="root", model_type=ModelType.NULL)
+
+    mesh = Model(name="mesh", parent="root", model_type=ModelType.STATIC, hidden=False)
+    mesh.transform.translation = Vector((1.0, 2.0, 3.0))
+    mesh.transform.rotation = Quaternion((0.5, 0.5, 0.5, 0.5))
+    mesh.geometry = [create_segment("plain", 4, colors=True, array_strips=False),
+                     create_segment("textured", 3, colors=False, array_strips=True)]
+
+    lowres = Model(name="mesh_lowres", parent="mesh", model_type=ModelType.STATIC, hidden=True)
+    lowres.geometry = [create_segment("textured", 1, colors=False, array_strips=False)]
+
+    collision = Model(name="p_box", parent="root", hidden=True,
+                      collisionprimitive=CollisionPrimitive(shape=CollisionPrimitiveShape.BOX,
+                                                            radius=1.0, height=2.0, length=3.0))
+
+    scene.models = [root, mesh, lowres, collision]
+
+    return scene
@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+
+from io_scene_swbf_msh.msh_model_gather import get_modifier_signature
+
+def create_modifier(modifier_type: str, **values):
+    properties = [SimpleNamespace(identifier="rna_type", type="POINTER")]
+
+    for identifier, value in values.items():
+        prop_type = "COLLECTION" if isinstance(value, list) else "ENUM" if isinstance(value, str) else "FLOAT"
+        properties.append(SimpleNamespace(identifier=identifier, type=prop_type, is_enum_flag=False, is_array=False))
+
+    return SimpleNamespace(type=modifier_type, bl_rna=SimpleNamespace(properties=properties), rna_type=None, **values)
+
+def test_identical_modifiers_have_the_same_signature():
+    assert (get_modifier_signature(create_modifier("DISPLACE", strength=0.5, texture_coords="LOCAL"))
+            == get_modifier_signature(create_modifier("DISPLACE", strength=0.5, texture_coords="LOCAL")))
+
+def test_empty_collection_properties_are_ignored():
+    assert get_modifier_signature(create_modifier("UV_PROJECT", projectors=[], scale_x=1.0)) is not None
+
+def test_collection_properties_with_items_are_not_shared():
+    assert get_modifier_signature(create_modifier("UV_PROJECT", projectors=[object()], scale_x=1.0)) is None
+
+def test_global_texture_coordinates_are_not_shared():
+    assert get_modifier_signature(create_modifier("WAVE", texture_coords="GLOBAL")) is None
@@ -0,0 +1,196 @@
+import io
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from io_scene_swbf_msh import msh_scene_save
+from io_scene_swbf_msh.msh_scene_save import save_scene, save_scene_file, update_scene_file, predict_scene_size
+from io_scene_swbf_msh.msh_utilities import pack_color
+
+class ReferenceWriter:
+    """ The original writer, which wrote each element as it went and seeked back to fill in
+        the size of every chunk. The byte layout of the current writers is checked against it. """
+
+    def __init__(self, file, chunk_id: str, parent=None):
+        self.file = file
+        self.size: int = 0
+        self.size_pos = None
+        self.parent = parent
+
+        self.file.write(bytes(chunk_id[0:4], "ascii"))
+
+    def __enter__(self):
+        self.size_pos = self.file.tell()
+        self.file.write(struct.pack(f"<I", 0))
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if (self.size % 4) > 0:
+            padding = 4 - (self.size % 4)
+            self.write_bytes(bytes([0 for i in range(padding)]))
+
+        head_pos = self.file.tell()
+        self.file.seek(self.size_pos)
+        self.file.write(struct.pack(f"<I", self.size))
+        self.file.seek(head_pos)
+
+        if self.parent is not None:
+            self.parent.size += self.size
+
+    def write_bytes(self, packed_bytes):
+        self.size += len(packed_bytes)
+        self.file.write(packed_bytes)
+
+    def write_string(self, string: str):
+        self.write_bytes(bytes(string, "utf-8"))
+        self.write_bytes(b'\0')
+
+    def write_i32(self, *ints):
+        self.write_bytes(struct.pack(f"<{len(ints)}i", *ints))
+
+    def write_u8(self, *ints):
+        self.write_bytes(struct.pack(f"<{len(ints)}B", *ints))
+
+    def write_u16(self, *ints):
+        self.write_bytes(struct.pack(f"<{len(ints)}H", *ints))
+
+    def write_u32(self, *ints):
+        self.write_bytes(struct.pack(f"<{len(ints)}I", *ints))
+
+    def write_f32(self, *floats):
+        self.write_bytes(struct.pack(f"<{len(floats)}f", *floats))
+
+    def create_child(self, child_id: str):
+        child = ReferenceWriter(self.file, chunk_id=child_id, parent=self)
+        self.size += 8
+
+        return child
+
+def reference_write_segm(segm, segment, material_index):
+    """ The original SEGM writer, writing one element at a time. """
+
+    with segm.create_child("MATI") as mati:
+        mati.write_u32(material_index.get(segment.material_name, 0))
+
+    with segm.create_child("POSL") as posl:
+        posl.write_u32(len(segment.positions))
+
+        for position in segment.positions:
+            posl.write_f32(position[0], position[1], position[2])
+
+    with segm.create_child("NRML") as nrml:
+        nrml.write_u32(len(segment.normals))
+
+        for normal in segment.normals:
+            nrml.write_f32(normal[0], normal[1], normal[2])
+
+    if segment.colors is not None:
+        with segm.create_child("CLRL") as clrl:
+            clrl.write_u32(len(segment.colors))
+
+            for color in segment.colors:
+                clrl.write_u32(pack_color(color))
+
+    with segm.create_child("UV0L") as uv0l:
+        uv0l.write_u32(len(segment.texcoords))
+
+        for texcoord in segment.texcoords:
+            uv0l.write_f32(texcoord[0], texcoord[1])
+
+    with segm.create_child("NDXL") as ndxl:
+        ndxl.write_u32(len(segment.polygons))
+
+        for polygon in segment.polygons:
+            ndxl.write_u16(len(polygon))
+
+            for index in polygon:
+                ndxl.write_u16(index)
+
+    with segm.create_child("NDXT") as ndxt:
+        ndxt.write_u32(len(segment.triangles))
+
+        for triangle in segment.triangles:
+            ndxt.write_u16(triangle[0], triangle[1], triangle[2])
+
+    with segm.create_child("STRP") as strp:
+        strp.write_u32(sum(len(strip) for strip in segment.triangle_strips))
+
+        for strip in segment.triangle_strips:
+            strp.write_u16(strip[0] | 0x8000, strip[1] | 0x8000)
+
+            for index in strip[2:]:
+                strp.write_u16(index)
+
+def create_reference_bytes(scene, monkeypatch) -> bytes:
+    output_file = io.BytesIO()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(msh_scene_save, "_write_segm", reference_write_segm)
+        msh_scene_save._write_scene(ReferenceWriter(output_file, "HEDR"), scene, False)
+
+    return output_file.getvalue()
+
+def test_save_scene_matches_the_original_writer(msh_scene, monkeypatch):
+    reference = create_reference_bytes(msh_scene, monkeypatch)
+    output_file = io.BytesIO()
+
+    save_scene(output_file, msh_scene)
+
+    assert output_file.getvalue() == reference
+
+def test_streamed_scene_matches_the_original_writer(msh_scene, monkeypatch):
+    reference = create_reference_bytes(msh_scene, monkeypatch)
+    output_file = io.BytesIO()
+
+    save_scene(output_file, msh_scene, stream=True)
+
+    assert output_file.getvalue() == reference
+
+def test_predicted_size_is_exact(msh_scene, monkeypatch):
+    assert predict_scene_size(msh_scene) == len(create_reference_bytes(msh_scene, monkeypatch))
+
+def test_saved_file_matches_the_original_writer(msh_scene, monkeypatch, tmp_path):
+    reference = create_reference_bytes(msh_scene, monkeypatch)
+    filepath = tmp_path / "test.msh"
+
+    save_scene_file(str(filepath), msh_scene, worker_count=2)
+
+    assert filepath.read_bytes() == reference
+    assert os.listdir(tmp_path) == ["test.msh"]
+
+def test_updated_file_matches_the_original_writer(msh_scene, monkeypatch, tmp_path):
+    filepath = tmp_path / "test.msh"
+
+    save_scene_file(str(filepath), msh_scene)
+
+    # One segment keeps it's size and one model grows, so both update paths are taken.
+    msh_scene.models[1].geometry[0].positions *= 2.0
+    msh_scene.models[2].name = "mesh_lowres_renamed"
+
+    update_scene_file(str(filepath), msh_scene)
+
+    assert filepath.read_bytes() == create_reference_bytes(msh_scene, monkeypatch)
+    assert os.listdir(tmp_path) == ["test.msh"]
+
+class CountingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.submit_count = 0
+
+    def submit(self, *args, **kwargs):
+        self.submit_count += 1
+
+        return super().submit(*args, **kwargs)
+
+def test_serialization_is_bounded_ahead_of_the_writer(msh_scene):
+    msh_scene.models = msh_scene.models * 5
+
+    with CountingExecutor() as executor:
+        blobs = msh_scene_save._iterate_scene_blobs(msh_scene, False, executor, max_pending=2)
+
+        # The SINF and MATL blobs come first, then one MODL blob per model.
+        for modl_count, _ in enumerate(blobs, start=-1):
+            assert executor.submit_count <= max(modl_count, 0) + 2
+
+    assert executor.submit_count == len(msh_scene.models)
@@ -0,0 +1,32 @@
+import multiprocessing.spawn
+import sys
+
+import numpy as np
+
+from io_scene_swbf_msh.msh_model import GeometrySegment
+from io_scene_swbf_msh.msh_model_triangle_strips import _create_segments_triangle_strips_parallel
+from io_scene_swbf_msh.msh_model_triangle_strips_generate import TriangleStripOptions, create_segment_triangle_strips
+
+def create_segment(seed: int) -> GeometrySegment:
+    rng = np.random.default_rng(seed)
+
+    segment = GeometrySegment()
+    segment.positions = np.zeros((64, 3), dtype=np.float32)
+    segment.triangles = rng.permutation(np.array([[a, a + 1, a + 8] for a in range(55)], dtype=np.uint16))
+
+    return segment
+
+def test_parallel_strips_match_serial_strips_without_changing_the_process():
+    segments = [create_segment(seed) for seed in range(4)]
+    options = TriangleStripOptions()
+    path = list(sys.path)
+    executable = multiprocessing.spawn.get_executable()
+
+    _create_segments_triangle_strips_parallel(segments, options, worker_count=2)
+
+    for segment in segments:
+        assert segment.triangle_strips == create_segment_triangle_strips(segment.triangles.tolist(), options)
+
+    assert sys.path == path
+    assert multiprocessing.spawn.get_executable() == executable
+    assert "msh_model_triangle_strips_generate" not in sys.modules
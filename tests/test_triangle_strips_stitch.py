@@ -0,0 +1,104 @@
+import random
+from collections import Counter
+from typing import List
+
+import pytest
+
+from io_scene_swbf_msh.msh_model_triangle_strips_generate import create_triangle_strips, stitch_triangle_strips
+
+def create_grid_triangles(width: int, height: int) -> List[List[int]]:
+    triangles = []
+
+    for y in range(height):
+        for x in range(width):
+            a = y * (width + 1) + x
+            b = a + 1
+            c = a + width + 1
+            d = c + 1
+
+            triangles += [[a, b, d], [a, d, c]]
+
+    return triangles
+
+def get_strip_triangles(strips: List[List[int]]) -> Counter:
+    """ Counts the triangles drawn by strips in their winding, each rotated to start at it's
+        smallest index. Degenerate triangles are skipped. """
+
+    triangles = Counter()
+
+    for strip in strips:
+        for index in range(len(strip) - 2):
+            triangle = strip[index:index + 3]
+
+            if index % 2 == 1:
+                triangle = [triangle[1], triangle[0], triangle[2]]
+
+            if len(set(triangle)) < 3:
+                continue
+
+            smallest = triangle.index(min(triangle))
+            triangles[tuple(triangle[smallest:] + triangle[:smallest])] += 1
+
+    return triangles
+
+def test_single_strip_is_unchanged():
+    strips = [[0, 1, 2, 3]]
+
+    assert stitch_triangle_strips(strips, restart_cost=3) == strips
+
+@pytest.mark.parametrize("seed", range(5))
+def test_stitched_strip_draws_the_same_triangles(seed):
+    triangles = create_grid_triangles(12, 9)
+    random.Random(seed).shuffle(triangles)
+
+    strips = create_triangle_strips(triangles)
+    stitched = stitch_triangle_strips(strips, restart_cost=1000)
+
+    assert len(stitched) == 1
+    assert get_strip_triangles(stitched) == get_strip_triangles(strips)
+
+@pytest.mark.parametrize("strips", [
+    [[0, 1, 2], [3, 4, 5]],
+    [[0, 1, 2, 3], [4, 5, 6, 7, 8]],
+    [[0, 1, 2, 3, 4], [5, 6, 7]],
+    [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10], [11, 12, 13, 14, 15, 16]]
+])
+def test_stitching_keeps_winding(strips):
+    stitched = stitch_triangle_strips(strips, restart_cost=1000)
+
+    assert len(stitched) == 1
+    assert get_strip_triangles(stitched) == get_strip_triangles(strips)
+
+def test_even_length_strip_is_joined_reversed():
+    # The second strip ends on the first strip's last vertex and has an even triangle count
+    # (even length), so it keeps it's winding when reversed and joins with a single repeated index.
+    strips = [[0, 1, 2, 3], [6, 5, 4, 3]]
+
+    stitched = stitch_triangle_strips(strips, restart_cost=1000)
+
+    assert stitched == [[0, 1, 2, 3, 3, 4, 5, 6]]
+    assert get_strip_triangles(stitched) == get_strip_triangles(strips)
+
+def test_odd_length_strip_is_not_joined_reversed():
+    # Reversing an odd length strip would flip it's winding, so it must be joined from it's start.
+    strips = [[0, 1, 2, 3], [5, 4, 3]]
+
+    stitched = stitch_triangle_strips(strips, restart_cost=1000)
+
+    assert len(stitched) == 1
+    assert get_strip_triangles(stitched) == get_strip_triangles(strips)
+
+def test_strips_are_unchanged_when_stitching_costs_more():
+    strips = [[0, 1, 2], [3, 4, 5], [6, 7, 8]]
+
+    assert stitch_triangle_strips(strips, restart_cost=0) == strips
+
+@pytest.mark.parametrize("seed", range(5))
+def test_stitching_never_adds_indices_without_a_restart_cost(seed):
+    triangles = create_grid_triangles(20, 20)
+    random.Random(seed).shuffle(triangles)
+
+    strips = create_triangle_strips(triangles)
+    stitched = stitch_triangle_strips(strips, restart_cost=0)
+
+    assert sum(len(strip) for strip in stitched) <= sum(len(strip) for strip in strips)
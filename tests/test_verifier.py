@@ -0,0 +1,149 @@
+import struct
+
+import numpy as np
+import pytest
+
+from io_scene_swbf_msh.msh_reader import MshFile, Chunk
+from io_scene_swbf_msh.msh_scene_save import save_scene_file
+from io_scene_swbf_msh.msh_verifier import verify_msh_file, _find_polygon_starts
+
+@pytest.fixture
+def msh_path(msh_scene, tmp_path) -> str:
+    path = str(tmp_path / "test.msh")
+
+    save_scene_file(path, msh_scene)
+
+    return path
+
+def find_segm_chunk(path: str, chunk_id: str):
+    """ Returns the offset and size of a chunk in the first segment of the file. """
+
+    with MshFile(path) as msh:
+        modl = next(modl for modl in msh.models if modl.find("GEOM") is not None)
+        chunk = modl.find("GEOM").find("SEGM").find(chunk_id)
+
+        return chunk.offset, chunk.size
+
+def patch_file(path: str, offset: int, data: bytes):
+    with open(path, "r+b") as file:
+        file.seek(offset)
+        file.write(data)
+
+def verify_single_problem(path: str) -> str:
+    problems = verify_msh_file(path)
+
+    assert len(problems) == 1, problems
+
+    return problems[0]
+
+def test_saved_file_is_valid(msh_path):
+    assert verify_msh_file(msh_path) == []
+
+def test_triangle_index_out_of_range(msh_path):
+    offset, _ = find_segm_chunk(msh_path, "NDXT")
+    patch_file(msh_path, offset + 12, struct.pack("<H", 999))
+
+    assert "NDXT chunk has an index (999) out of range" in verify_single_problem(msh_path)
+
+def test_strip_index_out_of_range(msh_path):
+    offset, _ = find_segm_chunk(msh_path, "STRP")
+    patch_file(msh_path, offset + 16, struct.pack("<H", 999))
+
+    assert "STRP chunk has an index (999) out of range" in verify_single_problem(msh_path)
+
+def test_missing_strip_start_flag(msh_path):
+    offset, _ = find_segm_chunk(msh_path, "STRP")
+    patch_file(msh_path, offset + 14, struct.pack("<H", 1))
+
+    assert "strip start flags that are not in pairs" in verify_single_problem(msh_path)
+
+def test_material_out_of_range(msh_path):
+    offset, _ = find_segm_chunk(msh_path, "MATI")
+    patch_file(msh_path, offset + 8, struct.pack("<I", 2))
+
+    assert "uses material 2 but the file has 2 materials" in verify_single_problem(msh_path)
+
+def test_polygon_index_out_of_range(msh_path):
+    offset, _ = find_segm_chunk(msh_path, "NDXL")
+    patch_file(msh_path, offset + 14, struct.pack("<H", 999))
+
+    assert "NDXL chunk has an index (999) out of range" in verify_single_problem(msh_path)
+
+def test_polygon_with_too_few_indices(msh_path):
+    # Two 4 index polygons rewritten as two 2 index polygons and a triangle keeps the chunk's size.
+    offset, _ = find_segm_chunk(msh_path, "NDXL")
+    patch_file(msh_path, offset + 12, struct.pack("<10H", 2, 0, 1, 2, 0, 1, 3, 0, 1, 2))
+    patch_file(msh_path, offset + 8, struct.pack("<I", 17))
+
+    assert "NDXL chunk has a polygon with less than 3 indices" in verify_single_problem(msh_path)
+
+def test_polygon_count_too_large(msh_path):
+    offset, _ = find_segm_chunk(msh_path, "NDXL")
+    patch_file(msh_path, offset + 8, struct.pack("<I", 1000))
+
+    assert "NDXL chunk is too small for it's 1000 polygons" in verify_single_problem(msh_path)
+
+def test_missing_parent(msh_path):
+    with MshFile(msh_path) as msh:
+        prnt = msh.models[1].find("PRNT")
+        offset = prnt.offset
+
+    patch_file(msh_path, offset + 8, b"tree")
+
+    assert "has a parent ('tree') that is not in the file" in verify_single_problem(msh_path)
+
+def test_truncated_file(msh_path):
+    with open(msh_path, "r+b") as file:
+        file.truncate(len(file.read()) - 64)
+
+    assert verify_msh_file(msh_path) != []
+
+def test_bytes_after_hedr(msh_path):
+    with open(msh_path, "ab") as file:
+        file.write(bytes(8))
+
+    assert verify_single_problem(msh_path) == "File has 8 bytes after the HEDR chunk."
+
+def find_polygon_starts_reference(data: np.ndarray, polygon_count: int) -> np.ndarray:
+    starts = []
+    offset = 0
+
+    for _ in range(polygon_count):
+        if offset >= len(data):
+            return None
+
+        starts.append(offset)
+        offset += int(data[offset]) + 1
+
+    return np.array(starts, dtype=np.int64)
+
+@pytest.mark.parametrize("seed", range(20))
+def test_find_polygon_starts_matches_a_walk(seed):
+    rng = np.random.default_rng(seed)
+    data = rng.integers(0, 8, size=int(rng.integers(0, 200))).astype("<u2")
+
+    for polygon_count in (0, 1, 5, 40, 200, 1000):
+        expected = find_polygon_starts_reference(data, polygon_count)
+        starts = _find_polygon_starts(data, polygon_count)
+
+        if expected is None:
+            assert starts is None
+        else:
+            assert starts.tolist() == expected.tolist()
+
+def test_find_polygon_starts_rejects_a_count_larger_than_the_data():
+    assert _find_polygon_starts(np.full(40, 3, dtype="<u2"), 2 ** 25) is None
+
+def test_zero_size_count_chunk_at_the_end_of_the_file_is_reported(tmp_path):
+    path = tmp_path / "empty_matl.msh"
+    path.write_bytes(b"HEDR" + struct.pack("<I", 16) + b"MSH2" + struct.pack("<I", 8) + b"MATL" + struct.pack("<I", 0))
+
+    problems = verify_msh_file(str(path))
+
+    assert "MATL chunk at offset 16 is too small to read a u32 at 0!" in problems
+
+def test_zero_size_chunk_is_not_read_past():
+    view = memoryview(b"MATI" + struct.pack("<I", 0) + b"POSL" + struct.pack("<2I", 4, 0))
+
+    with pytest.raises(ValueError):
+        Chunk(view, "MATI", 0, 0).read_u32()
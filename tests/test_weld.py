@@ -0,0 +1,77 @@
+import numpy as np
+
+from io_scene_swbf_msh.msh_model_gather import (weld_corners, quantize_attribute, remove_degenerate_triangles,
+                                                remove_degenerate_polygons)
+
+def test_identical_corners_are_welded_in_order_of_first_use():
+    attributes = np.array([[2.0, 0.0], [1.0, 0.0], [2.0, 0.0], [0.0, 0.0], [1.0, 0.0]], dtype=np.float32)
+    groups = np.zeros(5, dtype=np.int64)
+
+    group_corners, corner_indices = weld_corners(attributes, groups, 1)
+
+    assert group_corners[0].tolist() == [0, 1, 3]
+    assert corner_indices.tolist() == [0, 1, 0, 2, 1]
+
+def test_corners_are_not_welded_across_groups():
+    attributes = np.array([[1.0], [1.0], [1.0], [2.0]], dtype=np.float32)
+    groups = np.array([0, 1, 0, 1], dtype=np.int64)
+
+    group_corners, corner_indices = weld_corners(attributes, groups, 2)
+
+    assert [corners.tolist() for corners in group_corners] == [[0], [1, 3]]
+    assert corner_indices.tolist() == [0, 0, 0, 1]
+
+def test_empty_group_has_no_vertices():
+    attributes = np.array([[1.0], [2.0]], dtype=np.float32)
+    groups = np.array([0, 0], dtype=np.int64)
+
+    group_corners, _ = weld_corners(attributes, groups, 3)
+
+    assert [len(corners) for corners in group_corners] == [2, 0, 0]
+
+def test_negative_zero_welds_with_zero():
+    attributes = np.array([[0.0, 1.0], [-0.0, 1.0]], dtype=np.float32)
+
+    group_corners, corner_indices = weld_corners(attributes, np.zeros(2, dtype=np.int64), 1)
+
+    assert len(group_corners[0]) == 1
+    assert corner_indices.tolist() == [0, 0]
+
+def test_quantized_values_in_the_same_grid_cell_weld():
+    values = np.array([[0.98], [1.04], [1.2], [1.24]], dtype=np.float32)
+
+    _, corner_indices = weld_corners(quantize_attribute(values, 0.1), np.zeros(4, dtype=np.int64), 1)
+
+    assert corner_indices.tolist() == [0, 0, 1, 1]
+
+def test_close_values_either_side_of_a_cell_boundary_do_not_weld():
+    # Grid snapping welds by cell, not distance, so values 0.002 apart can stay separate.
+    values = np.array([[0.149], [0.151]], dtype=np.float64)
+
+    _, corner_indices = weld_corners(quantize_attribute(values, 0.1), np.zeros(2, dtype=np.int64), 1)
+
+    assert corner_indices.tolist() == [0, 1]
+
+def test_zero_tolerance_keeps_values():
+    values = np.array([[0.1, 0.2]], dtype=np.float32)
+
+    assert quantize_attribute(values, 0.0) is values
+
+def test_degenerate_triangles_are_removed():
+    triangles = np.array([[0, 1, 2], [0, 0, 1], [1, 2, 1], [3, 4, 4], [2, 3, 4]], dtype=np.uint16)
+
+    assert remove_degenerate_triangles(triangles).tolist() == [[0, 1, 2], [2, 3, 4]]
+
+def test_collapsed_polygon_corners_are_removed():
+    polygon_indices = np.array([0, 1, 2,
+                                3, 3, 4, 5,
+                                6, 6, 7,
+                                8, 9, 9, 8,
+                                1, 2, 3, 1], dtype=np.uint16)
+    polygon_sizes = np.array([3, 4, 3, 4, 4], dtype=np.uint16)
+
+    indices, sizes = remove_degenerate_polygons(polygon_indices, polygon_sizes)
+
+    assert indices.tolist() == [0, 1, 2, 3, 4, 5, 1, 2, 3]
+    assert sizes.tolist() == [3, 3, 3]
+    assert sizes.dtype == polygon_sizes.dtype